@@ -0,0 +1,59 @@
+"""
+Usernames and avatars of note authors.
+
+Every rendered note and reply shows its author's name and avatar, and a
+busy thread shows the same few authors over and over. load() answers from
+what the current request already looked up, then from the shared cache,
+and fetches the rest in one query. There is deliberately no per-process
+tier: invalidate() has to reach every worker, since a new avatar should
+show up on the next request wherever it lands.
+"""
+import os
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .models import default_avatar
+
+AUTHOR_CACHE_TTL = int(os.getenv('AUTHOR_CACHE_TTL', 60 * 60))
+
+
+def make_key(user_id):
+    return f'author:{user_id}'
+
+
+def _request_authors(request):
+    if request is None:
+        return {}
+    if not hasattr(request, '_authors'):
+        request._authors = {}
+    return request._authors
+
+
+def load(request, user_ids):
+    """
+    (username, avatar) by user id, covering `user_ids`. Authors without a
+    profile get default_avatar(). `request` may be None outside a request.
+    """
+    authors = _request_authors(request)
+    missing = {user_id for user_id in user_ids if user_id not in authors}
+    if missing:
+        shared = cache.get_many([make_key(user_id) for user_id in missing])
+        for user_id in list(missing):
+            found = shared.get(make_key(user_id))
+            if found is not None:
+                authors[user_id] = tuple(found)
+                missing.discard(user_id)
+    if missing:
+        loaded = {
+            user_id: (username, default_avatar(username) if avatar is None else avatar)
+            for user_id, username, avatar in User.objects.filter(pk__in=missing)
+            .values_list('id', 'username', 'profile__avatar')
+        }
+        cache.set_many({make_key(user_id): author for user_id, author in loaded.items()}, AUTHOR_CACHE_TTL)
+        authors.update(loaded)
+    return authors
+
+
+def invalidate(user_id):
+    cache.delete(make_key(user_id))
@@ -0,0 +1,248 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Hot in-process LRU in front of a shared Django cache backend.
+
+    Lookups try the local LRU, then the shared backend (promoting hits into
+    the LRU), and only report a miss when neither has the key. `None` is
+    never cached; store a falsy sentinel such as `{}` for negative results.
+    """
+
+    def __init__(self, prefix, max_entries=1000, ttl=60 * 60, local_ttl=None,
+                 alias='default'):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.alias = alias
+        self.local = LRUCache(max_entries, local_ttl or ttl)
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _found_shared(self, key, value):
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value)
+        else:
+            self._count('misses')
+        return value
+
+    def _split_local(self, keys):
+        """(values the local LRU has, keys to look up in the shared tier)"""
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+        self._count('local_hits', len(found))
+        return found, remote_keys
+
+    def _merge_shared(self, found, remote_keys, remote):
+        for key in remote_keys:
+            value = self._found_shared(key, remote.get(self.make_key(key)))
+            if value is not None:
+                found[key] = value
+        return found
+
+    def _set_local(self, mapping, ttl):
+        """Store `mapping` in the LRU; returns it keyed for the shared tier."""
+        for key, value in mapping.items():
+            self.local.set(key, value, min(ttl, self.local.ttl))
+        return {self.make_key(key): value for key, value in mapping.items()}
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        return self._found_shared(key, self.shared.get(self.make_key(key)))
+
+    def get_many(self, keys):
+        found, remote_keys = self._split_local(keys)
+        if not remote_keys:
+            return found
+        remote = self.shared.get_many([self.make_key(key) for key in remote_keys])
+        return self._merge_shared(found, remote_keys, remote)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, min(ttl, self.local.ttl))
+        self.shared.set(self.make_key(key), value, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.shared.set_many(self._set_local(mapping, ttl), ttl)
+
+    # The same over the shared backend's async API, for the ASGI views: a
+    # Redis round trip must not block the event loop. The LRU never does.
+
+    async def aget(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        return self._found_shared(key, await self.shared.aget(self.make_key(key)))
+
+    async def aget_many(self, keys):
+        found, remote_keys = self._split_local(keys)
+        if not remote_keys:
+            return found
+        remote = await self.shared.aget_many([self.make_key(key) for key in remote_keys])
+        return self._merge_shared(found, remote_keys, remote)
+
+    async def aset(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, min(ttl, self.local.ttl))
+        await self.shared.aset(self.make_key(key), value, ttl)
+
+    async def aset_many(self, mapping, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        await self.shared.aset_many(self._set_local(mapping, ttl), ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(self.make_key(key))
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        stats['local_size'] = len(self.local)
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one.
+
+    The first caller runs `fn`; callers arriving while it is in flight wait
+    for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop."""
+
+    def __init__(self):
+        self._calls = {}
+
+    def start(self, key, fn):
+        """Start `fn()` as a task unless one is already running for `key`."""
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark background failures as retrieved; waiters still see them
+            task.exception()
+
+    async def do(self, key, fn):
+        # Shielded so a client disconnecting doesn't cancel the shared fetch
+        return await asyncio.shield(self.start(key, fn))
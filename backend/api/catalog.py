@@ -0,0 +1,114 @@
+import os
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import search as search_index
+from .models import FeedVersion, Movie, Note
+
+# Catalog rows older than this are still served, but refetched from OMDb in
+# the background so ratings don't drift
+CATALOG_REFRESH_AGE = int(os.getenv('CATALOG_REFRESH_AGE', 60 * 60 * 24 * 7))
+# /api/search/ answers from the catalog alone when it matches at least this
+# many movies; fewer means OMDb likely knows titles we haven't seen yet
+CATALOG_MIN_RESULTS = int(os.getenv('CATALOG_MIN_RESULTS', 10))
+
+CATALOG_FIELDS = ['title', 'year', 'poster', 'imdb_rating', 'fetched_at']
+
+
+def _from_detail(detail, fetched_at):
+    rating = detail.get('imdbRating')
+    return Movie(
+        imdb_id=detail['imdbID'],
+        title=detail['Title'],
+        year=detail['Year'],
+        poster=detail['Poster'],
+        imdb_rating=None if rating in (None, 'N/A') else rating,
+        fetched_at=fetched_at,
+    )
+
+
+def lookup(imdb_ids):
+    """
+    Catalog rows for `imdb_ids`, by id.
+
+    This includes rows only ever filled from client input. Those may lack
+    a poster or rating, so callers should check is_fetched() and go to
+    OMDb for the others.
+    """
+    return Movie.objects.in_bulk(list(imdb_ids))
+
+
+def is_fetched(movie):
+    return movie.fetched_at is not None
+
+
+def is_stale(movie, now=None):
+    now = now or timezone.now()
+    return movie.fetched_at is None or movie.fetched_at <= now - timedelta(seconds=CATALOG_REFRESH_AGE)
+
+
+def _shown(movie):
+    # What feed threads show of their movie
+    return movie.title, movie.year, movie.poster
+
+
+def store(details, existing=None):
+    """
+    Insert or update catalog rows from parsed OMDb detail records.
+
+    `existing` is lookup() of at least those ids, for callers that already
+    made it. Threads about movies whose title, year or poster changed are
+    marked for re-rendering; a refresh that changes nothing they show, or
+    only adds new movies, outdates nothing.
+    """
+    now = timezone.now()
+    movies = [_from_detail(detail, now) for detail in details if detail]
+    if movies:
+        if existing is None:
+            existing = lookup(movie.imdb_id for movie in movies)
+        changed = [movie.imdb_id for movie in movies
+                   if movie.imdb_id in existing and _shown(existing[movie.imdb_id]) != _shown(movie)]
+        Movie.objects.bulk_create(
+            movies, update_conflicts=True, unique_fields=['imdb_id'],
+            update_fields=CATALOG_FIELDS + ['updated_at'],
+        )
+        if changed:
+            Note.objects.filter(parent=None, movie__in=changed).bump_version()
+            FeedVersion.bump_notes(*changed)
+    return len(movies)
+
+
+def get_or_create(imdb_id, title=None, year=None, poster=None, imdb_rating=None):
+    """
+    The catalog row for `imdb_id`, created from client-supplied details if
+    it doesn't exist yet. Existing rows are never overwritten this way;
+    only OMDb refreshes change them.
+    """
+    movie, _ = Movie.objects.get_or_create(imdb_id=imdb_id, defaults={
+        'title': title or '',
+        'year': year or '',
+        'poster': poster or '',
+        'imdb_rating': imdb_rating or None,
+    })
+    return movie
+
+
+def search(query, limit):
+    """
+    Catalog movies matching `query` through the full-text index (see
+    search.search_movies), exact titles first.
+    """
+    return search_index.search_movies(
+        query, limit, queryset=Movie.objects.exclude(fetched_at=None).exclude(poster='')
+    )
+
+
+def refresh_candidates(limit):
+    """Ids of never-fetched rows, then the longest-unrefreshed ones."""
+    cutoff = timezone.now() - timedelta(seconds=CATALOG_REFRESH_AGE)
+    never = list(Movie.objects.filter(fetched_at=None).order_by('updated_at')
+                 .values_list('imdb_id', flat=True)[:limit])
+    stale = list(Movie.objects.filter(fetched_at__lte=cutoff).order_by('fetched_at')
+                 .values_list('imdb_id', flat=True)[:limit - len(never)])
+    return never + stale
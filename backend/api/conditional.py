@@ -0,0 +1,41 @@
+import functools
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_get(validators):
+    """
+    Decorator for APIView.get that answers If-None-Match and
+    If-Modified-Since with a 304 before the view runs.
+
+    `validators(request)` returns `(version, last_modified)`. `version` is a
+    string that changes whenever the body would, computed from a cheap
+    aggregate rather than the body itself; the ETag is derived from it and
+    the negotiated media type. `last_modified` may be None, and should be
+    unless every change moves it forward (deletions usually don't).
+
+    Responses are marked private and no-cache so browsers always
+    revalidate instead of guessing a freshness lifetime.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def get(view, request, *args, **kwargs):
+            version, last_modified = validators(request)
+            version = f'{version}|{request.accepted_renderer.media_type}'
+            etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                if last_modified:
+                    response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept', 'Authorization'])
+            return response
+        return get
+    return decorator
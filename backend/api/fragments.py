@@ -0,0 +1,68 @@
+"""
+Rendered feed threads, cached one thread at a time.
+
+A thread with its embedded replies only renders differently once it or a
+reply is edited, replied to or deleted, one of its authors changes avatar,
+or a catalog refresh changes its movie. Each of those bumps Note.version (see
+Note.save()/delete(), NoteQuerySet.bump_author_threads() and
+catalog.store()), and fragments are keyed by it: listing a page is one
+multi-get, and only the threads that changed since are rendered again.
+Outdated fragments are never looked up again and just expire.
+
+time_ago is the one field that depends on when a thread is shown; with
+SERVER_TIME_AGO on it is recomputed from created_at on every hit.
+"""
+import os
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .cache import TieredCache
+from .models import time_ago
+
+thread_cache = TieredCache(
+    'thread',
+    max_entries=int(os.getenv('THREAD_CACHE_SIZE', 5000)),
+    ttl=int(os.getenv('THREAD_CACHE_TTL', 60 * 60)),
+)
+
+
+def fragment_key(thread, replies_limit):
+    # Ids start over when the database is reset or restored while a shared
+    # cache lives on; created_at keeps a new thread off the old one's entry
+    return (f'{thread.id}:{thread.created_at.timestamp()}:{thread.version}:{replies_limit}:'
+            f'{settings.SERVER_TIME_AGO:d}')
+
+
+def restamp(data, now):
+    """
+    A copy of rendered thread `data` with time_ago as of `now`; cached dicts
+    are shared. created_at is rendered with a 'Z' suffix, which
+    datetime.fromisoformat() only accepts from Python 3.11 on.
+    """
+    data = dict(data, time_ago=time_ago(parse_datetime(data['created_at']), now))
+    data['replies'] = [dict(reply, time_ago=time_ago(parse_datetime(reply['created_at']), now))
+                       for reply in data['replies']]
+    return data
+
+
+def render_threads(threads, render_misses, replies_limit, now):
+    """
+    `threads` (rows or instances with id, created_at and version) rendered
+    in order, from the cache where possible; `render_misses(misses)`
+    renders the rest like a list serializer would, and those are cached.
+    """
+    if not settings.THREAD_CACHE:
+        return render_misses(threads)
+    keys = [fragment_key(thread, replies_limit) for thread in threads]
+    cached = thread_cache.get_many(keys)
+    misses = [thread for thread, key in zip(threads, keys) if key not in cached]
+    rendered = {}
+    if misses:
+        rendered = dict(zip((fragment_key(thread, replies_limit) for thread in misses), render_misses(misses)))
+        thread_cache.set_many(rendered)
+    if settings.SERVER_TIME_AGO and cached:
+        with metrics.phase('serializer'):
+            cached = {key: restamp(data, now) for key, data in cached.items()}
+    return [cached[key] if key in cached else rendered[key] for key in keys]
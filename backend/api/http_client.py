@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+# (connect, read) timeouts applied when a caller doesn't pass its own
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.3))
+# Connections kept alive per host; should cover the OMDb detail fan-out
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
+# In-flight connections per process for the async client; requests beyond
+# this wait for a free connection instead of opening more
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', 500))
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that never sends a request without a timeout."""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def build_session(retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=HTTP_POOL_SIZE,
+                  timeout=None):
+    """
+    Build a Session with keep-alive connection pools, default timeouts and
+    retry-with-backoff on connection errors and 502/503/504 responses.
+
+    Only idempotent methods are retried, and the final response is handed
+    back rather than raised so callers can inspect its status code.
+    Retry-After is left to callers (e.g. Spotify 429s) instead of sleeping
+    inside the request.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout,
+        max_retries=retry,
+        pool_connections=10,
+        pool_maxsize=pool_size,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# One session per process so every outbound call reuses pooled connections
+session = build_session()
+# For calls bounded by an overall deadline, which retries would overrun
+# (each attempt gets the full timeout again)
+no_retry_session = build_session(retries=0)
+
+
+def get(url, retry=True, **kwargs):
+    with metrics.phase('http'):
+        return (session if retry else no_retry_session).get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    with metrics.phase('http'):
+        return session.post(url, **kwargs)
+
+
+# httpx clients are tied to the event loop they were first used on
+_async_clients = weakref.WeakKeyDictionary()
+# Set by request_client() for the calls made inside it: a list holding
+# the client once the first call has opened it
+_request_client = contextvars.ContextVar('request_client', default=None)
+
+
+def build_async_client(retries=HTTP_RETRIES, pool_size=HTTP_POOL_SIZE,
+                       max_connections=HTTP_ASYNC_MAX_CONNECTIONS):
+    """
+    Async counterpart of build_session() for the ASGI views.
+
+    httpx only retries failed connection attempts, not 5xx responses.
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=pool_size),
+        transport=httpx.AsyncHTTPTransport(retries=retries),
+    )
+
+
+@contextlib.asynccontextmanager
+async def request_client():
+    """
+    Run the async calls made inside on a client of their own, opened by
+    the first call and closed on the way out.
+
+    For event loops that only last one request: under WSGI, Django runs
+    each async view on a new loop, and a client kept for it would never be
+    closed. Requests answered from cache never open one.
+    """
+    opened = []
+    token = _request_client.set(opened)
+    try:
+        yield
+    finally:
+        _request_client.reset(token)
+        if opened:
+            await opened[0].aclose()
+
+
+def in_request_client():
+    """
+    Whether the current event loop ends with the request (see
+    request_client()), taking any tasks still running on it along.
+    """
+    return _request_client.get() is not None
+
+
+def get_async_client():
+    """
+    Pooled AsyncClient shared by everything running on the current event
+    loop, or the one request_client() opened.
+    """
+    opened = _request_client.get()
+    if opened is not None:
+        if not opened:
+            opened.append(build_async_client())
+        return opened[0]
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+async def aget(url, **kwargs):
+    with metrics.phase('http'):
+        return await get_async_client().get(url, **kwargs)
+
+
+async def apost(url, **kwargs):
+    with metrics.phase('http'):
+        return await get_async_client().post(url, **kwargs)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import MovieDiscussionStats
+
+
+class Command(BaseCommand):
+    help = "Recompute MovieDiscussionStats from the notes table"
+
+    def handle(self, *args, **options):
+        movies = MovieDiscussionStats.rebuild()
+        self.stdout.write(f'Rebuilt discussion stats for {movies} movies')
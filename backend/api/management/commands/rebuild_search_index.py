@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Recreate missing full-text search triggers and reindex movies and notes"
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            self.stderr.write('Full-text search is not supported on this database')
+            return
+        if not search.install():
+            search.rebuild()
+        self.stdout.write('Rebuilt the search index')
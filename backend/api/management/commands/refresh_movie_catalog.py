@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import catalog, omdb
+
+
+class Command(BaseCommand):
+    help = "Fetch movies added from client input, and the oldest catalog entries, from OMDb"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Number of movies to refresh (default: 500)')
+        parser.add_argument('--batch-size', type=int, default=omdb.MAX_RESULTS,
+                            help='Concurrent OMDb lookups per batch (default: %(default)s)')
+
+    def handle(self, *args, **options):
+        imdb_ids = catalog.refresh_candidates(options['limit'])
+        batch_size = max(options['batch_size'], 1)
+        refreshed = 0
+        for start in range(0, len(imdb_ids), batch_size):
+            refreshed += omdb.refresh_catalog(imdb_ids[start:start + batch_size])
+        self.stdout.write(f'Refreshed {refreshed} of {len(imdb_ids)} movies')
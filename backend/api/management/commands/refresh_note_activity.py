@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Note
+
+
+class Command(BaseCommand):
+    help = "Recompute Note.reply_count and Note.last_activity_at from the replies table, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Notes updated per transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            # Walk by primary key so each batch is a short, index-driven update
+            batch = list(
+                Note.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            updated += Note.objects.filter(pk__in=batch).refresh_activity()
+            last_pk = batch[-1]
+
+        self.stdout.write(f'Refreshed activity for {updated} notes')
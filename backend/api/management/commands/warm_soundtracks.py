@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api import spotify
+from api.models import Note, WatchlistItem
+
+
+class Command(BaseCommand):
+    help = "Prefetch Spotify soundtrack playlists for the most discussed and watchlisted movies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Number of movies to warm (default: 100)')
+        parser.add_argument('--force', action='store_true',
+                            help='Refetch even if the cached results are still fresh')
+        parser.add_argument('titles', nargs='*',
+                            help='Movie titles to warm instead of the most popular ones')
+
+    def hot_titles(self, limit):
+        counts = {}
+        note_titles = (
+            Note.objects.filter(parent=None).exclude(movie=None).exclude(movie__title='')
+            .values('movie__title').annotate(total=Count('id'))
+        )
+        for row in note_titles:
+            counts[row['movie__title']] = counts.get(row['movie__title'], 0) + row['total']
+        for row in WatchlistItem.objects.values('movie__title').annotate(total=Count('id')):
+            counts[row['movie__title']] = counts.get(row['movie__title'], 0) + row['total']
+        return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+    def handle(self, *args, **options):
+        if not spotify.credentials_configured():
+            self.stderr.write('Spotify credentials not configured')
+            return
+
+        titles = options['titles'] or self.hot_titles(options['limit'])
+        warmed = 0
+        for title in titles:
+            # Same query SoundtrackWidget sends
+            query = f'{title} soundtrack'
+            try:
+                spotify.cached_search_playlists(query, force=options['force'])
+            except spotify.SpotifyRateLimited as e:
+                self.stderr.write(f'Rate limited by Spotify, stopping (retry after {e.retry_after}s)')
+                break
+            except (spotify.SpotifyAuthError, spotify.SpotifySearchError) as e:
+                self.stderr.write(f'{title}: {e}')
+                continue
+            warmed += 1
+
+        self.stdout.write(f'Warmed {warmed} of {len(titles)} soundtrack searches')
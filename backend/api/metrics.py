@@ -0,0 +1,248 @@
+"""
+Per-request timings and Prometheus metrics.
+
+MetricsMiddleware (api/middleware.py) counts every request and its total
+duration. A sampled fraction (METRICS_SAMPLE_RATE) also gets a breakdown by
+phase: `db` (every query, through a connection execute wrapper), `http`
+(outbound calls through api.http_client) and `serializer`. Phases are wall
+time and may overlap, e.g. serializer time includes the queries a
+serializer triggers; concurrent calls in one phase count once.
+
+The registry is per process; with several workers, each one is scraped
+separately (Prometheus adds them up).
+"""
+import bisect
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# Share of requests timed per phase; the rest are only counted
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+# Add a Server-Timing header to sampled responses
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'true').lower() == 'true'
+# Bearer token for the scraper; without one /api/metrics/ is staff only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return '+Inf' if value == math.inf else repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _label_text(self, values, **extra):
+        pairs = list(zip(self.labels, values)) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted((labels, self._copy(value)) for labels, value in self._series.items())
+        for labels, value in series:
+            lines.extend(self._lines(labels, value))
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._series.get(labels, 0)
+
+    def _copy(self, value):
+        return value
+
+    def _lines(self, labels, value):
+        return [f'{self.name}_total{self._label_text(labels)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def _lines(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{self._label_text(labels, le=_format_value(bound))} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(labels)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{self._label_text(labels)} {count}')
+        return lines
+
+
+requests_total = Counter('flicks_http_requests', 'Requests handled', ['method', 'route', 'status'])
+request_duration = Histogram('flicks_http_request_duration_seconds', 'Time to produce a response',
+                             ['method', 'route'], DURATION_BUCKETS)
+phase_duration = Histogram('flicks_http_request_phase_seconds', 'Time per phase of sampled requests',
+                           ['route', 'phase'], DURATION_BUCKETS)
+db_queries = Histogram('flicks_http_request_db_queries', 'Database queries per sampled request',
+                       ['route'], QUERY_BUCKETS)
+REGISTRY = [requests_total, request_duration, phase_duration, db_queries]
+
+
+def expose():
+    """The registry in Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """Phase timings for one sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def enter(self, name):
+        with self._lock:
+            phase = self._phases.setdefault(name, [0.0, 0, 0.0])
+            if phase[1] == 0:
+                phase[2] = time.perf_counter()
+            phase[1] += 1
+
+    def exit(self, name):
+        with self._lock:
+            phase = self._phases[name]
+            phase[1] -= 1
+            if phase[1] == 0:
+                phase[0] += time.perf_counter() - phase[2]
+
+    def durations(self):
+        """Seconds per phase, for phases that have finished."""
+        with self._lock:
+            return {name: phase[0] for name, phase in self._phases.items()}
+
+
+class _Phase:
+    __slots__ = ('timings', 'name')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.timings.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.timings.exit(self.name)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+_untimed = nullcontext()
+
+
+def current():
+    return _current.get()
+
+
+def phase(name):
+    """Context manager timing `name` for the current request, if it is sampled."""
+    timings = _current.get()
+    return _untimed if timings is None else _Phase(timings, name)
+
+
+def start_request(sample_rate=None):
+    """
+    Begin timing a request in the current context. Returns (timings, token);
+    timings is None for requests that aren't sampled.
+    """
+    sample_rate = METRICS_SAMPLE_RATE if sample_rate is None else sample_rate
+    timings = RequestTimings() if sample_rate > 0 and random.random() < sample_rate else None
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record(method, route, status, elapsed, timings):
+    method = method if method in METHODS else 'OTHER'
+    requests_total.inc(method, route, str(status))
+    request_duration.observe(elapsed, method, route)
+    if timings is not None:
+        for name, seconds in timings.durations().items():
+            phase_duration.observe(seconds, route, name)
+        db_queries.observe(timings.queries, route)
+
+
+def server_timing(elapsed, timings):
+    """Server-Timing header value, durations in milliseconds."""
+    parts = []
+    for name, seconds in sorted(timings.durations().items()):
+        part = f'{name};dur={seconds * 1000:.1f}'
+        if name == 'db':
+            part += f';desc="{timings.queries} queries"'
+        parts.append(part)
+    parts.append(f'total;dur={elapsed * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.queries += 1
+    with _Phase(timings, 'db'):
+        return execute(sql, params, many, context)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created handler: time every query on the new connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
@@ -0,0 +1,93 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can sit in an async middleware chain.
+
+    WhiteNoise is sync-only, which makes Django run every request (async
+    views included) in a worker thread under ASGI. Static files are still
+    served by WhiteNoise in a thread; everything else passes straight
+    through to the async handler.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    def _static_file(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    async def __acall__(self, request):
+        static_file = await sync_to_async(self._static_file)(request) if self.autorefresh \
+            else self._static_file(request)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Records every request in the Prometheus registry (api/metrics.py) and,
+    for sampled ones, times its phases and adds a Server-Timing header.
+
+    Goes first in MIDDLEWARE so the total covers the whole chain. Streamed
+    bodies are produced after it returns and are not included.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, started, timings)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, started, timings)
+
+    def finish(self, request, response, started, timings):
+        elapsed = time.perf_counter() - started
+        # The URL pattern rather than the path, so ids don't become labels
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        metrics.record(request.method, route, response.status_code, elapsed, timings)
+        if timings is not None and metrics.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(elapsed, timings)
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_note_movie_imdb_id_note_movie_title'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='api.note'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['-created_at', '-id'], name='note_thread_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['movie_imdb_id', '-created_at', '-id'], name='note_movie_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('parent__isnull', False)), fields=['parent', '-created_at', '-id'], name='note_parent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['author', '-created_at'], name='note_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', '-added_at', '-id'], name='watchlist_user_added_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.20 on 2026-10-18 16:47
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def backfill_activity(apps, schema_editor):
+    Note = apps.get_model('api', 'Note')
+    replies = Note.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+    Note.objects.update(
+        reply_count=Coalesce(Subquery(replies.annotate(total=Count('pk')).values('total')), 0),
+        last_activity_at=Coalesce(
+            Subquery(replies.annotate(latest=Max('created_at')).values('latest')), F('created_at')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_note_watchlist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['-last_activity_at', '-id'], name='note_thread_activity_idx'),
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
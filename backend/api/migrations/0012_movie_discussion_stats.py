@@ -0,0 +1,75 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Max, Sum, When
+import django.db.models.deletion
+
+
+def backfill_stats(apps, schema_editor):
+    Note = apps.get_model('api', 'Note')
+    MovieDiscussionStats = apps.get_model('api', 'MovieDiscussionStats')
+    MovieDiscussionAuthor = apps.get_model('api', 'MovieDiscussionAuthor')
+
+    # Replies count towards their thread's movie
+    movie = Case(When(parent=None, then=F('movie_imdb_id')), default=F('parent__movie_imdb_id'))
+    authors = (Note.objects.annotate(movie=movie).exclude(movie=None).order_by()
+               .values('movie', 'author').annotate(total=Count('id')))
+    MovieDiscussionAuthor.objects.bulk_create([
+        MovieDiscussionAuthor(movie_imdb_id=row['movie'], author_id=row['author'], note_count=row['total'])
+        for row in authors
+    ], batch_size=500)
+
+    author_counts = dict(
+        MovieDiscussionAuthor.objects.order_by().values('movie_imdb_id')
+        .annotate(total=Count('id')).values_list('movie_imdb_id', 'total')
+    )
+    threads = (Note.objects.filter(parent=None).exclude(movie_imdb_id=None).order_by()
+               .values('movie_imdb_id').annotate(
+                   threads=Count('id'), replies=Sum('reply_count'),
+                   latest=Max('last_activity_at'), title=Max('movie_title')))
+    MovieDiscussionStats.objects.bulk_create([
+        MovieDiscussionStats(movie_imdb_id=row['movie_imdb_id'], movie_title=row['title'] or '',
+                             thread_count=row['threads'], reply_count=row['replies'],
+                             author_count=author_counts.get(row['movie_imdb_id'], 0),
+                             last_activity_at=row['latest'])
+        for row in threads
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0011_profile_watchlist_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieDiscussionStats',
+            fields=[
+                ('movie_imdb_id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('movie_title', models.CharField(blank=True, max_length=200)),
+                ('thread_count', models.PositiveIntegerField(default=0)),
+                ('reply_count', models.PositiveIntegerField(default=0)),
+                ('author_count', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-last_activity_at'], name='discussion_activity_idx'), models.Index(fields=['-thread_count', '-last_activity_at'], name='discussion_threads_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieDiscussionAuthor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_imdb_id', models.CharField(max_length=20)),
+                ('note_count', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('movie_imdb_id', 'author')},
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,139 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_movies(apps, schema_editor):
+    """One catalog row per movie referenced anywhere, from the copies it replaces."""
+    Movie = apps.get_model('api', 'Movie')
+    WatchlistItem = apps.get_model('api', 'WatchlistItem')
+    Note = apps.get_model('api', 'Note')
+    MovieDiscussionStats = apps.get_model('api', 'MovieDiscussionStats')
+
+    movies = {}
+    # Latest copy wins, so the most recently added item's details are kept
+    for item in WatchlistItem.objects.order_by('added_at').iterator():
+        movies[item.imdb_id] = Movie(imdb_id=item.imdb_id, title=item.title, year=item.year,
+                                     poster=item.poster, imdb_rating=item.imdb_rating)
+    titles = (Note.objects.exclude(movie_imdb_id=None).exclude(movie_imdb_id='').order_by('created_at')
+              .values_list('movie_imdb_id', 'movie_title'))
+    titles = list(titles) + list(MovieDiscussionStats.objects.values_list('movie_imdb_id', 'movie_title'))
+    for imdb_id, title in titles:
+        if imdb_id not in movies:
+            movies[imdb_id] = Movie(imdb_id=imdb_id, title=title or '')
+        elif not movies[imdb_id].title:
+            movies[imdb_id].title = title or ''
+    Movie.objects.bulk_create(movies.values(), batch_size=500)
+
+    # Blank ids meant "no movie"; they can't point at a catalog row
+    Note.objects.filter(movie_imdb_id='').update(movie_imdb_id=None)
+
+
+def restore_copies(apps, schema_editor):
+    WatchlistItem = apps.get_model('api', 'WatchlistItem')
+    Note = apps.get_model('api', 'Note')
+    MovieDiscussionStats = apps.get_model('api', 'MovieDiscussionStats')
+
+    for item in WatchlistItem.objects.select_related('movie').iterator():
+        movie = item.movie
+        item.title, item.year, item.poster = movie.title, movie.year[:4], movie.poster
+        item.imdb_rating = movie.imdb_rating
+        item.save(update_fields=['title', 'year', 'poster', 'imdb_rating'])
+    for model in (Note, MovieDiscussionStats):
+        model.objects.exclude(movie=None).update(
+            movie_title=models.Subquery(
+                apps.get_model('api', 'Movie').objects.filter(pk=models.OuterRef('movie')).values('title')[:1]
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_movie_discussion_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Movie',
+            fields=[
+                ('imdb_id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('year', models.CharField(blank=True, max_length=20)),
+                ('poster', models.URLField(blank=True, max_length=500)),
+                ('imdb_rating', models.CharField(blank=True, max_length=4, null=True)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fetched_at'], name='movie_fetched_idx'),
+                            models.Index(fields=['updated_at'], name='movie_updated_idx')],
+            },
+        ),
+        migrations.RunPython(populate_movies, migrations.RunPython.noop),
+
+        # The id columns keep their names and become foreign keys to Movie.
+        # Renames are state-only; RenameField doesn't carry Meta.indexes
+        # along, so note_movie_thread_idx is swapped in state as well.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.RemoveIndex(model_name='note', name='note_movie_thread_idx'),
+            migrations.RenameField(model_name='watchlistitem', old_name='imdb_id', new_name='movie'),
+            migrations.AlterField(
+                model_name='watchlistitem', name='movie',
+                field=models.CharField(max_length=20, db_column='imdb_id'),
+            ),
+            migrations.RenameField(model_name='note', old_name='movie_imdb_id', new_name='movie'),
+            migrations.AlterField(
+                model_name='note', name='movie',
+                field=models.CharField(max_length=20, null=True, blank=True, db_column='movie_imdb_id'),
+            ),
+            migrations.AddIndex(
+                model_name='note',
+                index=models.Index(condition=models.Q(parent__isnull=True), fields=['movie', '-created_at', '-id'],
+                                   name='note_movie_thread_idx'),
+            ),
+            migrations.RenameField(model_name='moviediscussionstats', old_name='movie_imdb_id', new_name='movie'),
+            migrations.AlterField(
+                model_name='moviediscussionstats', name='movie',
+                field=models.CharField(max_length=20, primary_key=True, serialize=False, db_column='movie_imdb_id'),
+            ),
+        ]),
+        migrations.AlterField(
+            model_name='watchlistitem',
+            name='movie',
+            field=models.ForeignKey(db_column='imdb_id', on_delete=django.db.models.deletion.PROTECT,
+                                    related_name='watchlist_items', to='api.movie'),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='movie',
+            field=models.ForeignKey(blank=True, db_column='movie_imdb_id', db_index=False, null=True,
+                                    on_delete=django.db.models.deletion.PROTECT, related_name='notes',
+                                    to='api.movie'),
+        ),
+        migrations.AlterField(
+            model_name='moviediscussionstats',
+            name='movie',
+            field=models.OneToOneField(db_column='movie_imdb_id', on_delete=django.db.models.deletion.CASCADE,
+                                       primary_key=True, related_name='discussion', serialize=False,
+                                       to='api.movie'),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, restore_copies),
+
+        # Defaults only matter when unapplying, so the restored columns can
+        # be added back before restore_copies fills them in
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(model_name='watchlistitem', name='title',
+                                  field=models.CharField(max_length=200, default='')),
+            migrations.AlterField(model_name='watchlistitem', name='year',
+                                  field=models.CharField(max_length=4, default='')),
+            migrations.AlterField(model_name='watchlistitem', name='poster',
+                                  field=models.URLField(max_length=500, default='')),
+        ]),
+
+        migrations.RemoveField(model_name='watchlistitem', name='title'),
+        migrations.RemoveField(model_name='watchlistitem', name='year'),
+        migrations.RemoveField(model_name='watchlistitem', name='poster'),
+        migrations.RemoveField(model_name='watchlistitem', name='imdb_rating'),
+        migrations.RemoveField(model_name='note', name='movie_title'),
+        migrations.RemoveField(model_name='moviediscussionstats', name='movie_title'),
+    ]
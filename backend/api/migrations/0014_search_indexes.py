@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from api import search
+    search.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from api import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text search columns/tables for movies and notes (see api/search.py).
+    Vendor specific, so they are created outside the model state.
+    """
+
+    dependencies = [
+        ('api', '0013_movie_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
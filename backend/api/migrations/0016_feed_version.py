@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_note_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedVersion',
+            fields=[
+                ('scope', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='note',
+            name='note_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userprofile',
+            name='profile_updated_idx',
+        ),
+    ]
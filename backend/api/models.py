@@ -1,12 +1,42 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+def default_avatar(username):
+    """Initials avatar for users without a profile picture."""
+    return f'https://api.dicebear.com/7.x/initials/svg?seed={username}&backgroundColor=9370DB'
+
+
+def time_ago(created_at, now):
+    """Short relative age, e.g. "3d ago", of `created_at` as seen at `now`."""
+    diff = now - created_at
+
+    if diff.days > 365:
+        years = diff.days // 365
+        return f"{years}y ago"
+    elif diff.days > 30:
+        months = diff.days // 30
+        return f"{months}mo ago"
+    elif diff.days > 0:
+        return f"{diff.days}d ago"
+    elif diff.seconds > 3600:
+        hours = diff.seconds // 3600
+        return f"{hours}h ago"
+    elif diff.seconds > 60:
+        minutes = diff.seconds // 60
+        return f"{minutes}m ago"
+    else:
+        return "just now"
+
+
 # Create your models here.
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     avatar = models.URLField(default='https://api.dicebear.com/7.x/initials/svg')  # Default avatar URL
     bio = models.TextField(max_length=500, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -14,27 +44,101 @@ class UserProfile(models.Model):
     def save(self, *args, **kwargs):
         if not self.avatar:
             # Generate unique avatar URL using username and initials style
-            self.avatar = f'https://api.dicebear.com/7.x/initials/svg?seed={self.user.username}&backgroundColor=9370DB'
+            self.avatar = default_avatar(self.user.username)
         super().save(*args, **kwargs)
 
+class Movie(models.Model):
+    """
+    One title's OMDb details, shared by every watchlist item and note about it.
+
+    Rows come from OMDb detail lookups as searches pass through, or from
+    what the client sent when a movie was first added or discussed; those
+    have no `fetched_at` until the catalog refresh fills them in from OMDb.
+    """
+    imdb_id = models.CharField(max_length=20, primary_key=True)
+    title = models.CharField(max_length=200)
+    year = models.CharField(max_length=20, blank=True)
+    poster = models.URLField(max_length=500, blank=True)
+    imdb_rating = models.CharField(max_length=4, blank=True, null=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Catalog refresh: never-fetched and oldest rows first
+            models.Index(fields=['fetched_at'], name='movie_fetched_idx'),
+            # Watchlist validators: latest catalog change
+            models.Index(fields=['updated_at'], name='movie_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.year})"
+
+    def as_search_result(self):
+        """The record /api/search/ returns, as built by omdb._parse_detail()."""
+        return {
+            'imdbID': self.imdb_id,
+            'Title': self.title,
+            'Year': self.year,
+            'Poster': self.poster,
+            'imdbRating': self.imdb_rating or 'N/A',
+        }
+
+
 class WatchlistItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='watchlist')
-    imdb_id = models.CharField(max_length=20)
-    title = models.CharField(max_length=200)
-    year = models.CharField(max_length=4)
-    poster = models.URLField(max_length=500)
+    movie = models.ForeignKey(Movie, on_delete=models.PROTECT, related_name='watchlist_items',
+                              db_column='imdb_id')
     added_at = models.DateTimeField(auto_now_add=True)
     watched = models.BooleanField(default=False)
     rating = models.IntegerField(null=True, blank=True)
     notes = models.TextField(blank=True)
-    imdb_rating = models.CharField(max_length=4, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-added_at']
-        unique_together = ['user', 'imdb_id']
+        unique_together = ['user', 'movie']
+        indexes = [
+            # WatchlistView: a user's list, newest first (and its cursor pages)
+            models.Index(fields=['user', '-added_at', '-id'], name='watchlist_user_added_idx'),
+            # WatchlistView validators: count and latest change per user
+            models.Index(fields=['user', 'updated_at'], name='watchlist_user_updated_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.title} ({self.year}) - {self.user.username}'s list"
+        return f"{self.movie} - {self.user.username}'s list"
+
+def reply_count_subquery():
+    return Coalesce(Subquery(
+        Note.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def last_reply_subquery():
+    return Coalesce(Subquery(
+        Note.objects.filter(parent=OuterRef('pk')).order_by().values('parent')
+        .annotate(latest=Max('created_at')).values('latest')
+    ), F('created_at'))
+
+
+class NoteQuerySet(models.QuerySet):
+    def refresh_activity(self):
+        """Recompute reply_count and last_activity_at from the replies table."""
+        FeedVersion.bump_all()
+        return self.update(reply_count=reply_count_subquery(), last_activity_at=last_reply_subquery(),
+                           version=F('version') + 1)
+
+    def bump_version(self):
+        """Mark these threads' cached renderings (api/fragments.py) outdated."""
+        return self.update(version=F('version') + 1)
+
+    def bump_author_threads(self, author_id):
+        """bump_version() on every thread `author_id` started or replied to, e.g. for a new avatar."""
+        replied = self.model.objects.filter(author_id=author_id, parent__isnull=False).values('parent_id')
+        return self.filter(models.Q(author_id=author_id) | models.Q(pk__in=replied),
+                           parent__isnull=True).bump_version()
+
 
 class Note(models.Model):
     title = models.CharField(max_length=100)
@@ -42,21 +146,131 @@ class Note(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notes")
-    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Indexed by note_parent_created_idx below; a plain FK index would also
+    # cover the NULL rows and mislead planners on thread queries
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies',
+                               db_index=False)
     edited = models.BooleanField(default=False)
-    movie_imdb_id = models.CharField(max_length=20, null=True, blank=True)  # Store IMDb ID of the movie
-    movie_title = models.CharField(max_length=200, null=True, blank=True)    # Store movie title for easier querying
+    # Column kept as movie_imdb_id; covered by note_movie_thread_idx below
+    movie = models.ForeignKey(Movie, on_delete=models.PROTECT, null=True, blank=True, related_name='notes',
+                              db_column='movie_imdb_id', db_index=False)
+    # Denormalized from replies; kept in sync by save()/delete() below
+    reply_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    # Threads only: bumped whenever the thread as rendered with its replies
+    # changes, which outdates its cached fragment
+    version = models.PositiveIntegerField(default=0)
+
+    objects = NoteQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # NoteListCreate: the thread feed, optionally for one movie
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(parent__isnull=True),
+                         name='note_thread_feed_idx'),
+            models.Index(fields=['movie', '-created_at', '-id'],
+                         condition=models.Q(parent__isnull=True), name='note_movie_thread_idx'),
+            # Replies of a thread in display order
+            models.Index(fields=['parent', '-created_at', '-id'], condition=models.Q(parent__isnull=False),
+                         name='note_parent_created_idx'),
+            # NoteDetail/NoteDelete and per-author listings
+            models.Index(fields=['author', '-created_at'], name='note_author_created_idx'),
+            # Threads by most recent reply
+            models.Index(fields=['-last_activity_at', '-id'], condition=models.Q(parent__isnull=True),
+                         name='note_thread_activity_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        note = super().from_db(db, field_names, values)
+        # save() bumps the feed of, and moves the discussion counts away
+        # from, the movie an edit moves a thread away from
+        note._loaded_movie_id = note.__dict__.get('movie_id')
+        return note
+
     def save(self, *args, **kwargs):
         if self.pk:  # If the note already exists
             self.edited = True
-        super().save(*args, **kwargs)
+            loaded_movie_id = self.__dict__.get('_loaded_movie_id', self.movie_id)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                Note.objects.filter(pk=self.parent_id or self.pk).bump_version()
+                thread = self.parent if self.parent_id else self
+                FeedVersion.bump_notes(thread.movie_id, loaded_movie_id)
+                if not self.parent_id and self.movie_id != loaded_movie_id:
+                    self._move_discussion(loaded_movie_id)
+            self._loaded_movie_id = self.movie_id
+            return
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.parent_id:
+                Note.objects.filter(pk=self.parent_id).update(
+                    reply_count=F('reply_count') + 1,
+                    last_activity_at=self.created_at,
+                    version=F('version') + 1
+                )
+            self._loaded_movie_id = self.movie_id
+            thread = self.parent if self.parent_id else self
+            FeedVersion.bump_notes(thread.movie_id)
+            if thread.movie_id:
+                # A reply bumps its thread's activity to its created_at; a
+                # new thread's own last_activity_at is set a moment earlier
+                MovieDiscussionStats.note_added(
+                    thread.movie_id, self.author_id,
+                    self.created_at if self.parent_id else self.last_activity_at,
+                    is_reply=bool(self.parent_id)
+                )
+
+    def _move_discussion(self, old_movie_id):
+        """Move this thread's and its replies' counts over from `old_movie_id`."""
+        notes_by_author = dict(
+            (Note.objects.filter(pk=self.pk) | Note.objects.filter(parent=self.pk))
+            .order_by().values('author').annotate(total=Count('id')).values_list('author', 'total')
+        )
+        replies = sum(notes_by_author.values()) - 1
+        if old_movie_id:
+            MovieDiscussionStats.notes_removed(old_movie_id, threads=1, replies=replies,
+                                               notes_by_author=notes_by_author)
+        if self.movie_id:
+            MovieDiscussionStats.notes_added(self.movie_id, threads=1, replies=replies,
+                                             notes_by_author=notes_by_author, activity_at=self.last_activity_at)
+
+    def delete(self, *args, **kwargs):
+        parent_id = self.parent_id
+        thread = self.parent if parent_id else self
+        movie_imdb_id = thread.movie_id
+        with transaction.atomic():
+            if movie_imdb_id:
+                # Deleting a thread takes its replies with it
+                removed = Note.objects.filter(pk=self.pk)
+                if not parent_id:
+                    removed = removed | Note.objects.filter(parent=self.pk)
+                notes_by_author = dict(
+                    removed.order_by().values('author').annotate(total=Count('id'))
+                    .values_list('author', 'total')
+                )
+            result = super().delete(*args, **kwargs)
+            FeedVersion.bump_notes(movie_imdb_id)
+            if parent_id:
+                Note.objects.filter(pk=parent_id).update(
+                    reply_count=F('reply_count') - 1,
+                    last_activity_at=last_reply_subquery(),
+                    version=F('version') + 1
+                )
+            if movie_imdb_id:
+                deleted = sum(notes_by_author.values())
+                MovieDiscussionStats.notes_removed(
+                    movie_imdb_id,
+                    threads=0 if parent_id else 1,
+                    replies=1 if parent_id else deleted - 1,
+                    notes_by_author=notes_by_author,
+                )
+        return result
 
     @property
     def is_reply(self):
@@ -64,22 +278,205 @@ class Note(models.Model):
 
     @property
     def time_since_created(self):
-        now = timezone.now()
-        diff = now - self.created_at
-
-        if diff.days > 365:
-            years = diff.days // 365
-            return f"{years}y ago"
-        elif diff.days > 30:
-            months = diff.days // 30
-            return f"{months}mo ago"
-        elif diff.days > 0:
-            return f"{diff.days}d ago"
-        elif diff.seconds > 3600:
-            hours = diff.seconds // 3600
-            return f"{hours}h ago"
-        elif diff.seconds > 60:
-            minutes = diff.seconds // 60
-            return f"{minutes}m ago"
-        else:
-            return "just now"
\ No newline at end of file
+        return time_ago(self.created_at, timezone.now())
+
+class MovieDiscussionAuthor(models.Model):
+    """How many notes an author has in a movie's discussion; backs author_count."""
+    movie_imdb_id = models.CharField(max_length=20)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    note_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['movie_imdb_id', 'author']
+
+
+class MovieDiscussionStats(models.Model):
+    """
+    Per-movie summary of its notes, so trending lists and thread counts
+    don't need a GROUP BY over Note.
+
+    Updated incrementally by Note.save()/delete(). Replies count towards
+    their thread's movie. Deletes that skip Note.delete() (queryset
+    deletes, removing a user) leave it behind; `manage.py
+    rebuild_discussion_stats` recomputes everything.
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True,
+                                 related_name='discussion', db_column='movie_imdb_id')
+    thread_count = models.PositiveIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)
+    author_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Trending by recent activity and by number of threads
+            models.Index(fields=['-last_activity_at'], name='discussion_activity_idx'),
+            models.Index(fields=['-thread_count', '-last_activity_at'], name='discussion_threads_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.movie_id}: {self.thread_count} threads'
+
+    @classmethod
+    def note_added(cls, movie_imdb_id, author_id, activity_at, is_reply):
+        """Count a new note; call inside the transaction that saved it."""
+        author, new_author = MovieDiscussionAuthor.objects.get_or_create(
+            movie_imdb_id=movie_imdb_id, author_id=author_id, defaults={'note_count': 1}
+        )
+        if not new_author:
+            MovieDiscussionAuthor.objects.filter(pk=author.pk).update(note_count=F('note_count') + 1)
+
+        stats, created = cls.objects.get_or_create(movie_id=movie_imdb_id, defaults={
+            'thread_count': 0 if is_reply else 1,
+            'reply_count': 1 if is_reply else 0,
+            'author_count': 1 if new_author else 0,
+            'last_activity_at': activity_at,
+        })
+        if not created:
+            cls.objects.filter(pk=movie_imdb_id).update(
+                thread_count=F('thread_count') + (0 if is_reply else 1),
+                reply_count=F('reply_count') + (1 if is_reply else 0),
+                author_count=F('author_count') + (1 if new_author else 0),
+                last_activity_at=activity_at,
+            )
+
+    @classmethod
+    def notes_added(cls, movie_imdb_id, threads, replies, notes_by_author, activity_at):
+        """
+        Count notes a thread brought along when it moved to this movie; call
+        inside the transaction that moved it. `notes_by_author` is as for
+        notes_removed().
+        """
+        new_authors = 0
+        for author_id, count in notes_by_author.items():
+            author, created = MovieDiscussionAuthor.objects.get_or_create(
+                movie_imdb_id=movie_imdb_id, author_id=author_id, defaults={'note_count': count}
+            )
+            if created:
+                new_authors += 1
+            else:
+                MovieDiscussionAuthor.objects.filter(pk=author.pk).update(note_count=F('note_count') + count)
+
+        stats, created = cls.objects.get_or_create(movie_id=movie_imdb_id, defaults={
+            'thread_count': threads,
+            'reply_count': replies,
+            'author_count': new_authors,
+            'last_activity_at': activity_at,
+        })
+        if not created:
+            cls.objects.filter(pk=movie_imdb_id).update(
+                thread_count=F('thread_count') + threads,
+                reply_count=F('reply_count') + replies,
+                author_count=F('author_count') + new_authors,
+                last_activity_at=cls.latest_activity(),
+            )
+
+    @classmethod
+    def notes_removed(cls, movie_imdb_id, threads, replies, notes_by_author):
+        """
+        Uncount deleted notes; call inside the transaction that deleted
+        them, after the thread's own activity was updated.
+
+        `notes_by_author` maps author ids to how many of the deleted notes
+        were theirs.
+        """
+        for author_id, count in notes_by_author.items():
+            MovieDiscussionAuthor.objects.filter(
+                movie_imdb_id=movie_imdb_id, author_id=author_id
+            ).update(note_count=F('note_count') - count)
+        gone, _ = MovieDiscussionAuthor.objects.filter(
+            movie_imdb_id=movie_imdb_id, author_id__in=list(notes_by_author), note_count__lte=0
+        ).delete()
+
+        cls.objects.filter(pk=movie_imdb_id).update(
+            thread_count=F('thread_count') - threads,
+            reply_count=F('reply_count') - replies,
+            author_count=F('author_count') - gone,
+            last_activity_at=cls.latest_activity(),
+        )
+        cls.objects.filter(pk=movie_imdb_id, thread_count=0).delete()
+
+    @staticmethod
+    def latest_activity():
+        """last_activity_at of the movie's most recently active thread, for update()."""
+        return Subquery(
+            Note.objects.filter(parent=None, movie=OuterRef('pk'))
+            .order_by('-last_activity_at').values('last_activity_at')[:1]
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every row from the notes table."""
+        movie = Case(When(parent=None, then=F('movie')), default=F('parent__movie'))
+        with transaction.atomic():
+            MovieDiscussionAuthor.objects.all().delete()
+            cls.objects.all().delete()
+
+            authors = (Note.objects.annotate(thread_movie=movie).exclude(thread_movie=None).order_by()
+                       .values('thread_movie', 'author').annotate(total=Count('id')))
+            MovieDiscussionAuthor.objects.bulk_create([
+                MovieDiscussionAuthor(movie_imdb_id=row['thread_movie'], author_id=row['author'],
+                                      note_count=row['total'])
+                for row in authors
+            ], batch_size=500)
+
+            author_counts = dict(
+                MovieDiscussionAuthor.objects.order_by().values('movie_imdb_id')
+                .annotate(total=Count('id')).values_list('movie_imdb_id', 'total')
+            )
+            threads = (Note.objects.filter(parent=None).exclude(movie=None).order_by()
+                       .values('movie').annotate(
+                           threads=Count('id'), replies=Sum('reply_count'),
+                           latest=Max('last_activity_at')))
+            return len(cls.objects.bulk_create([
+                cls(movie_id=row['movie'], thread_count=row['threads'], reply_count=row['replies'],
+                    author_count=author_counts.get(row['movie'], 0),
+                    last_activity_at=row['latest'])
+                for row in threads
+            ], batch_size=500))
+
+
+class FeedVersion(models.Model):
+    """
+    Counters behind the notes feed's ETag (views.feed_validators), so a
+    conditional GET reads two rows by primary key instead of aggregating
+    over every note.
+
+    FEED covers the whole feed and movie_scope() the feed filtered to one
+    movie; Note.save()/delete() bump both for the movie of the thread they
+    touch, and catalog.store() for movies whose title, year or poster
+    changed. AUTHORS is bumped on avatar changes, which can show up in any
+    feed. Deletes that skip Note.delete() don't bump anything.
+    """
+    FEED = 'feed'
+    AUTHORS = 'authors'
+
+    scope = models.CharField(max_length=40, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.scope}: {self.version}'
+
+    @staticmethod
+    def movie_scope(imdb_id):
+        return f'movie:{imdb_id}'
+
+    @classmethod
+    def bump(cls, *scopes):
+        """Increment `scopes`, creating missing rows; call inside the transaction that made the change."""
+        scopes = set(scopes)
+        if cls.objects.filter(scope__in=scopes).update(version=F('version') + 1) < len(scopes):
+            # Bumping the existing rows twice is harmless, and a writer
+            # creating the same rows concurrently doesn't lose either bump
+            cls.objects.bulk_create([cls(scope=scope) for scope in scopes], ignore_conflicts=True)
+            cls.objects.filter(scope__in=scopes).update(version=F('version') + 1)
+
+    @classmethod
+    def bump_notes(cls, *movie_ids):
+        """bump() the whole feed and the feeds of `movie_ids` (None for threads without a movie)."""
+        cls.bump(cls.FEED, *(cls.movie_scope(imdb_id) for imdb_id in movie_ids if imdb_id))
+
+    @classmethod
+    def bump_all(cls):
+        cls.bump(cls.FEED)
+        cls.objects.exclude(scope=cls.FEED).update(version=F('version') + 1)
@@ -0,0 +1,394 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import asyncio
+import hashlib
+import os
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+import httpx
+import requests
+
+from . import catalog, http_client, metrics
+from .cache import AsyncSingleFlight, SingleFlight, TieredCache
+
+OMDB_URL = os.getenv('OMDB_URL', 'http://www.omdbapi.com/')
+OMDB_API_KEY = os.getenv('OMDB_API_KEY', '1e75925c')
+
+# Per-call (connect, read) timeout for a single OMDb round trip
+OMDB_TIMEOUT = (http_client.HTTP_CONNECT_TIMEOUT, float(os.getenv('OMDB_TIMEOUT', 5)))
+OMDB_ASYNC_TIMEOUT = httpx.Timeout(OMDB_TIMEOUT[1], connect=OMDB_TIMEOUT[0])
+# Overall budget for one /api/search/ request (search + detail fan-out)
+OMDB_SEARCH_DEADLINE = float(os.getenv('OMDB_SEARCH_DEADLINE', 8))
+MAX_RESULTS = 10
+
+# Detail records rarely change, so keep them for a day in the shared cache
+# and an hour in each process
+detail_cache = TieredCache(
+    'omdb:detail',
+    max_entries=int(os.getenv('OMDB_DETAIL_CACHE_SIZE', 2000)),
+    ttl=int(os.getenv('OMDB_DETAIL_CACHE_TTL', 60 * 60 * 24)),
+    local_ttl=int(os.getenv('OMDB_DETAIL_LOCAL_TTL', 60 * 60)),
+)
+
+# Final result lists per normalized query. Entries are served as-is while
+# fresh, served and refreshed in the background once stale, and dropped
+# after the hard TTL. Partial results (some lookups timed out) are stale
+# from the start so the next request retries them.
+OMDB_SEARCH_FRESH = int(os.getenv('OMDB_SEARCH_FRESH', 60 * 10))
+OMDB_SEARCH_TTL = int(os.getenv('OMDB_SEARCH_TTL', 60 * 60 * 6))
+OMDB_PARTIAL_TTL = int(os.getenv('OMDB_PARTIAL_TTL', 60))
+search_cache = TieredCache(
+    'omdb:search',
+    max_entries=int(os.getenv('OMDB_SEARCH_CACHE_SIZE', 1000)),
+    ttl=OMDB_SEARCH_TTL,
+)
+search_flight = SingleFlight()
+async_search_flight = AsyncSingleFlight()
+
+# Shared by all requests so a burst of searches can't spawn unbounded threads
+_detail_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('OMDB_DETAIL_WORKERS', 16)),
+    thread_name_prefix='omdb-detail',
+)
+# A watchlist import can look up a thousand movies at once; imports share
+# these few workers instead, so one can't starve searches of the detail pool
+import_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('OMDB_IMPORT_WORKERS', 4)),
+    thread_name_prefix='omdb-import',
+)
+# Kept apart from the detail pool so a refresh waiting on detail lookups
+# can never occupy the workers it is waiting for
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='omdb-refresh')
+catalog_flight = SingleFlight()
+
+
+def _search_params(query):
+    return {
+        's': query,
+        'apikey': OMDB_API_KEY,
+        'type': 'movie',
+    }
+
+
+def _parse_search(response):
+    response.raise_for_status()
+    data = response.json()
+    if data.get('Response') == 'False':
+        return []
+    return data.get('Search', [])
+
+
+def _detail_params(imdb_id):
+    return {
+        'i': imdb_id,
+        'apikey': OMDB_API_KEY,
+    }
+
+
+def _parse_detail(response):
+    """
+    Trim an `i=` response down to what /api/search/ returns.
+
+    Returns `{}` for records we never show (no poster, title or year) so
+    they can be cached too, and None when OMDb didn't answer usefully.
+    """
+    if response.status_code != 200:
+        return None
+    detail_data = response.json()
+    # Only include movies with posters and required fields
+    if (detail_data.get('Poster', 'N/A') == 'N/A' or
+            not detail_data.get('Title') or
+            not detail_data.get('Year')):
+        return {}
+    return {
+        'imdbID': detail_data['imdbID'],
+        'Title': detail_data['Title'],
+        'Year': detail_data['Year'],
+        'Poster': detail_data['Poster'],
+        'imdbRating': detail_data.get('imdbRating', 'N/A')
+    }
+
+
+def _remaining(deadline):
+    """Seconds left until `deadline` (a time.monotonic() value); raises once it has passed."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise requests.Timeout('OMDb search deadline passed')
+    return remaining
+
+
+def _get(params, deadline):
+    if deadline is None:
+        return http_client.get(OMDB_URL, params=params, timeout=OMDB_TIMEOUT)
+    # Neither timeout may outlast the deadline, and a retry would start
+    # the clock again
+    remaining = _remaining(deadline)
+    timeout = (min(OMDB_TIMEOUT[0], remaining), min(OMDB_TIMEOUT[1], remaining))
+    return http_client.get(OMDB_URL, params=params, timeout=timeout, retry=False)
+
+
+def search(query, deadline=None):
+    """
+    Run the `s=` search and return OMDb's raw result list. With a
+    `deadline` (time.monotonic()), gives up by then with requests.Timeout.
+    """
+    return _parse_search(_get(_search_params(query), deadline))
+
+
+def fetch_detail(imdb_id, deadline=None):
+    """Fetch one `i=` detail record from OMDb (see _parse_detail), giving up at `deadline`."""
+    return _parse_detail(_get(_detail_params(imdb_id), deadline))
+
+
+def _fetch_upstream(imdb_ids, timeout, pool=_detail_pool):
+    """Fetch `imdb_ids` from OMDb concurrently on `pool`; returns what finished in time."""
+    # cancel() only stops lookups still queued; running ones hold their
+    # pool worker until their own timeouts, which end with the deadline
+    deadline = time.monotonic() + timeout
+    # Pool threads don't see the request's timings, so the fan-out is
+    # timed here as a whole
+    with metrics.phase('http'):
+        futures = {imdb_id: pool.submit(fetch_detail, imdb_id, deadline) for imdb_id in imdb_ids}
+        done, not_done = wait(futures.values(), timeout=max(timeout, 0))
+    for future in not_done:
+        future.cancel()
+
+    fetched = {}
+    for imdb_id, future in futures.items():
+        if future in done and future.exception() is None and future.result() is not None:
+            fetched[imdb_id] = future.result()
+    return fetched
+
+
+def _run_in_background(fn, *args):
+    def job():
+        try:
+            return fn(*args)
+        finally:
+            # Pool threads outlive requests, so nothing else would close
+            # the connection a job opened
+            connections.close_all()
+    return _refresh_pool.submit(job)
+
+
+def refresh_catalog(imdb_ids, timeout=OMDB_SEARCH_DEADLINE):
+    """
+    Refetch `imdb_ids` from OMDb, skipping the caches, and update the
+    catalog and detail cache with the results. Returns the number of
+    catalog rows written.
+    """
+    fetched = _fetch_upstream(imdb_ids, timeout)
+    if fetched:
+        detail_cache.set_many(fetched)
+    return catalog.store(fetched.values())
+
+
+def _refresh_catalog_in_background(imdb_ids):
+    key = ','.join(sorted(imdb_ids))
+    if not catalog_flight.in_flight(key):
+        _run_in_background(catalog_flight.do, key, lambda: refresh_catalog(imdb_ids))
+
+
+def _from_catalog(imdb_ids):
+    """
+    Detail records for the catalog's copies of `imdb_ids`, and the
+    catalog.lookup() they came from. Old copies are still returned, and
+    refetched in the background.
+    """
+    movies = catalog.lookup(imdb_ids)
+    fetched = {imdb_id: movie for imdb_id, movie in movies.items() if catalog.is_fetched(movie)}
+    if not fetched:
+        return {}, movies
+    found = {imdb_id: movie.as_search_result() for imdb_id, movie in fetched.items()}
+    detail_cache.set_many(found)
+    stale = [imdb_id for imdb_id, movie in fetched.items() if catalog.is_stale(movie)]
+    if stale:
+        _refresh_catalog_in_background(stale)
+    return found, movies
+
+
+def _store_fetched(fetched, existing):
+    detail_cache.set_many(fetched)
+    catalog.store(fetched.values(), existing)
+
+
+def fetch_details(imdb_ids, timeout, pool=_detail_pool):
+    """
+    Fetch detail records, keeping the order of `imdb_ids`.
+
+    Cached records are used as-is, then the movie catalog's; only the rest
+    go to OMDb, concurrently on `pool`, and are added to the catalog.
+    Lookups still running after `timeout` seconds, or that failed, are left
+    out so the caller gets whatever finished in time. Returns the results and whether
+    every lookup finished.
+    """
+    details = detail_cache.get_many(imdb_ids)
+    missing = [imdb_id for imdb_id in imdb_ids if imdb_id not in details]
+    existing = None
+    if missing:
+        found, existing = _from_catalog(missing)
+        details.update(found)
+        missing = [imdb_id for imdb_id in missing if imdb_id not in details]
+    complete = True
+
+    if missing:
+        fetched = _fetch_upstream(missing, timeout, pool)
+        if fetched:
+            _store_fetched(fetched, existing)
+        details.update(fetched)
+        complete = len(fetched) == len(missing)
+
+    return [details[imdb_id] for imdb_id in imdb_ids if details.get(imdb_id)], complete
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def _search_key(query):
+    # Hashed so arbitrary user input is always a valid cache key
+    return hashlib.md5(query.encode()).hexdigest()
+
+
+def _search_entry(results, complete):
+    """(entry, ttl) to store in search_cache for `results`."""
+    fresh_for = OMDB_SEARCH_FRESH if complete else 0
+    entry = {'results': results, 'fresh_until': time.time() + fresh_for}
+    return entry, OMDB_SEARCH_TTL if complete else OMDB_PARTIAL_TTL
+
+
+def _store_search(key, results, complete):
+    search_cache.set(key, *_search_entry(results, complete))
+
+
+def _search_catalog(query):
+    """
+    Results for `query` from the movie catalog, or None when it has too
+    few matches to stand in for OMDb.
+    """
+    movies = catalog.search(query, MAX_RESULTS)
+    if not movies or len(movies) < catalog.CATALOG_MIN_RESULTS:
+        return None
+    stale = [movie.imdb_id for movie in movies if catalog.is_stale(movie)]
+    if stale:
+        _refresh_catalog_in_background(stale)
+    return [movie.as_search_result() for movie in movies]
+
+
+def _fetch_search(query, key):
+    results = _search_catalog(query)
+    if results is not None:
+        _store_search(key, results, True)
+        return results
+
+    deadline = time.monotonic() + OMDB_SEARCH_DEADLINE
+    movies = search(query, deadline)[:MAX_RESULTS]
+    imdb_ids = [movie['imdbID'] for movie in movies if movie.get('imdbID')]
+    results, complete = fetch_details(imdb_ids, deadline - time.monotonic())
+    _store_search(key, results, complete)
+    return results
+
+
+def _refresh_in_background(query, key):
+    if not search_flight.in_flight(key):
+        _run_in_background(search_flight.do, key, lambda: _fetch_search(query, key))
+
+
+def search_movies(query):
+    """
+    Search OMDb and return detailed results for the first matches.
+
+    Answers from the query cache when possible, then from the movie
+    catalog if it has enough matches. Concurrent misses for the same query
+    share one upstream fetch.
+    """
+    query = normalize_query(query)
+    key = _search_key(query)
+
+    entry = search_cache.get(key)
+    if entry is not None:
+        if entry['fresh_until'] <= time.time():
+            _refresh_in_background(query, key)
+        return entry['results']
+
+    return search_flight.do(key, lambda: _fetch_search(query, key))
+
+
+# Async versions for the ASGI views. They share the caches above, through
+# their async API, but fan out on the event loop instead of the thread
+# pools. Catalog reads and writes still run in a thread.
+
+async def asearch(query, deadline=None):
+    timeout = OMDB_ASYNC_TIMEOUT
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        timeout = httpx.Timeout(min(OMDB_TIMEOUT[1], remaining), connect=min(OMDB_TIMEOUT[0], remaining))
+    response = await http_client.aget(OMDB_URL, params=_search_params(query), timeout=timeout)
+    return _parse_search(response)
+
+
+async def afetch_detail(imdb_id):
+    response = await http_client.aget(OMDB_URL, params=_detail_params(imdb_id), timeout=OMDB_ASYNC_TIMEOUT)
+    return _parse_detail(response)
+
+
+async def afetch_details(imdb_ids, timeout):
+    """Async fetch_details(): misses are fetched concurrently on the event loop."""
+    details = await detail_cache.aget_many(imdb_ids)
+    missing = [imdb_id for imdb_id in imdb_ids if imdb_id not in details]
+    existing = None
+    if missing:
+        found, existing = await sync_to_async(_from_catalog)(missing)
+        details.update(found)
+        missing = [imdb_id for imdb_id in missing if imdb_id not in details]
+    complete = True
+
+    if missing:
+        tasks = {imdb_id: asyncio.ensure_future(afetch_detail(imdb_id)) for imdb_id in missing}
+        done, pending = await asyncio.wait(tasks.values(), timeout=max(timeout, 0))
+        for task in pending:
+            task.cancel()
+
+        fetched = {}
+        for imdb_id, task in tasks.items():
+            if task in done and task.exception() is None and task.result() is not None:
+                fetched[imdb_id] = task.result()
+        if fetched:
+            await sync_to_async(_store_fetched)(fetched, existing)
+        details.update(fetched)
+        complete = len(fetched) == len(tasks)
+
+    return [details[imdb_id] for imdb_id in imdb_ids if details.get(imdb_id)], complete
+
+
+async def _afetch_search(query, key):
+    results = await sync_to_async(_search_catalog)(query)
+    if results is not None:
+        await search_cache.aset(key, *_search_entry(results, True))
+        return results
+
+    deadline = time.monotonic() + OMDB_SEARCH_DEADLINE
+    movies = (await asearch(query, deadline))[:MAX_RESULTS]
+    imdb_ids = [movie['imdbID'] for movie in movies if movie.get('imdbID')]
+    results, complete = await afetch_details(imdb_ids, deadline - time.monotonic())
+    await search_cache.aset(key, *_search_entry(results, complete))
+    return results
+
+
+async def asearch_movies(query):
+    """Async search_movies(), with the same caching and coalescing."""
+    query = normalize_query(query)
+    key = _search_key(query)
+
+    entry = await search_cache.aget(key)
+    if entry is not None:
+        if entry['fresh_until'] <= time.time():
+            if http_client.in_request_client():
+                # A task would be cancelled along with this request's loop
+                _refresh_in_background(query, key)
+            else:
+                async_search_flight.start(key, lambda: _afetch_search(query, key))
+        return entry['results']
+
+    return await async_search_flight.do(key, lambda: _afetch_search(query, key))
@@ -0,0 +1,105 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def encode_cursor(timestamp, pk):
+    if not isinstance(timestamp, str):
+        timestamp = timestamp.isoformat()
+    return base64.urlsafe_b64encode(f'{timestamp}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        timestamp = None
+    if timestamp is None:
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    return timestamp, pk
+
+
+def after_cursor(queryset, field, cursor):
+    """Rows strictly after `cursor` in (`field` desc, id desc) order."""
+    timestamp, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+    )
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (`ordering_field`, id).
+
+    The cursor is the last row's timestamp and id, so rows inserted while a
+    client pages through never shift or repeat later pages. When `optional`
+    is set the list stays unpaginated unless `limit` or `cursor` is passed,
+    which keeps existing clients working.
+    """
+    ordering_field = 'created_at'
+    page_size = 20
+    max_page_size = 100
+    optional = True
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.page_size))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        return min(max(limit, 1), self.max_page_size)
+
+    def is_requested(self, request):
+        params = request.query_params
+        return not self.optional or 'limit' in params or 'cursor' in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not self.is_requested(request):
+            return None
+
+        limit = self.get_limit(request)
+        queryset = queryset.order_by(f'-{self.ordering_field}', '-id')
+        if params.get('cursor'):
+            queryset = after_cursor(queryset, self.ordering_field, params['cursor'])
+
+        rows = list(queryset[:limit + 1])
+        page = rows[:limit]
+        self.next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            # Model instances or named values_list() rows
+            self.next_cursor = encode_cursor(getattr(last, self.ordering_field), last.id)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+
+class NoteCursorPagination(KeysetPagination):
+    ordering_field = 'created_at'
+
+
+class ActivityCursorPagination(KeysetPagination):
+    # Threads move up when replied to, so a thread can reappear on a later
+    # page if it gets a reply mid-scroll
+    ordering_field = 'last_activity_at'
+
+
+class ReplyCursorPagination(KeysetPagination):
+    ordering_field = 'created_at'
+    optional = False
+
+
+class WatchlistCursorPagination(KeysetPagination):
+    ordering_field = 'added_at'
+    page_size = 50
+    max_page_size = 200
@@ -0,0 +1,31 @@
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """
+    Parses a CSV body into a list of dicts keyed by lower-cased header.
+
+    Blank cells are dropped so optional fields fall back to their defaults
+    instead of failing validation.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            # utf-8-sig also strips the BOM spreadsheet exports start with
+            text = codecs.decode(stream.read(), 'utf-8-sig' if encoding.lower() == 'utf-8' else encoding)
+            reader = csv.DictReader(text.splitlines())
+            return [
+                {key.strip().lower(): value.strip() for key, value in row.items()
+                 if key and value and value.strip()}
+                for row in reader
+            ]
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ParseError('CSV parse error - %s' % exc)
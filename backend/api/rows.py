@@ -0,0 +1,190 @@
+"""
+Read-only list serialization straight from values_list() rows.
+
+The list endpoints render thousands of notes and watchlist items. Going
+through model instances and the DRF field machinery costs far more per
+row than the queries do, so for reads each serializer here fetches the
+columns it needs as tuples and builds the same dicts as its ModelSerializer
+counterpart in serializers.py, field for field and in the same order. The
+tests compare the rendered bytes of both; a field added to one has to be
+added to the other.
+
+Each class takes a queryset of the model, so callers keep their filtering,
+ordering and pagination, and hands back plain lists of dicts.
+"""
+import itertools
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import authors, metrics, streaming
+from .models import Note, time_ago
+from .pagination import encode_cursor
+
+
+def iso_datetime(value, tz):
+    """DRF's DateTimeField output for an aware datetime, in `tz`."""
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def rendered_at(now):
+    """The `now` rows get for time_ago: None with SERVER_TIME_AGO off."""
+    if not settings.SERVER_TIME_AGO:
+        return None
+    return timezone.now() if now is None else now
+
+
+class RowSerializer:
+    # values_list() lookups, in the order row() unpacks them
+    columns = ()
+
+    def rows(self, queryset):
+        """`queryset` as named rows for serialize(); the paginators accept it too."""
+        return queryset.values_list(*self.columns, named=True)
+
+    def serialize(self, rows, now=None):
+        """Rows as dicts; pass request_now() as `now` so time_ago matches the DRF path."""
+        with metrics.phase('serializer'):
+            tz = timezone.get_current_timezone()
+            now = rendered_at(now)
+            return [self.row(row, tz, now) for row in rows]
+
+    def iterate(self, rows, now=None):
+        """serialize() STREAM_CHUNK_SIZE rows at a time, for streaming."""
+        chunk_size = streaming.STREAM_CHUNK_SIZE
+        now = rendered_at(now)
+        rows = rows.iterator(chunk_size=chunk_size)
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            yield from self.serialize(chunk, now)
+
+
+class NoteReplyRows(RowSerializer):
+    """NoteReplySerializer. Author names and avatars come from api/authors.py."""
+    columns = ('id', 'content', 'created_at', 'updated_at', 'author_id', 'edited')
+
+    def __init__(self, request=None):
+        self.request = request
+
+    def serialize(self, rows, now=None):
+        with metrics.phase('serializer'):
+            tz = timezone.get_current_timezone()
+            now = rendered_at(now)
+            users = authors.load(self.request, {row.author_id for row in rows})
+            return [self.row(row, tz, now, users) for row in rows]
+
+    def row(self, row, tz, now, users):
+        id, content, created_at, updated_at, author_id, edited = row
+        username, avatar = users[author_id]
+        return {
+            'id': id,
+            'content': content,
+            'created_at': iso_datetime(created_at, tz),
+            'updated_at': iso_datetime(updated_at, tz),
+            'author_username': username,
+            'author_avatar': avatar,
+            'time_ago': None if now is None else time_ago(created_at, now),
+            'edited': edited,
+        }
+
+
+class NoteRows(RowSerializer):
+    """
+    NoteSerializer, replies included. `replies_limit` works like the
+    serializer context of the same name: at most that many replies per
+    thread, plus replies_next_cursor.
+    """
+    # version isn't rendered; api/fragments.py keys cached threads by it
+    columns = ('id', 'title', 'content', 'created_at', 'updated_at', 'author_id', 'edited', 'reply_count',
+               'last_activity_at', 'parent_id', 'movie_id', 'movie__title', 'version')
+
+    def __init__(self, replies_limit=None, request=None):
+        self.replies_limit = replies_limit
+        self.request = request
+        self.reply_rows = NoteReplyRows(request)
+
+    def load_replies(self, thread_ids):
+        """Replies of `thread_ids`, newest first, by thread; one query."""
+        if not thread_ids:
+            return {}
+        replies = Note.objects.filter(parent_id__in=thread_ids)
+        if self.replies_limit is not None:
+            # One extra row tells whether more replies exist
+            replies = replies.annotate(position=Window(
+                RowNumber(), partition_by=F('parent_id'), order_by=[F('created_at').desc(), F('id').desc()],
+            )).filter(position__lte=self.replies_limit + 1)
+        replies = replies.order_by('-created_at', '-id').values_list('parent_id', *self.reply_rows.columns)
+        by_thread = {}
+        for parent_id, *reply in replies:
+            by_thread.setdefault(parent_id, []).append(reply)
+        return by_thread
+
+    def serialize(self, rows, now=None):
+        with metrics.phase('serializer'):
+            tz = timezone.get_current_timezone()
+            now = rendered_at(now)
+            replies = self.load_replies([row.id for row in rows if row.parent_id is None])
+            # reply[4] is the author_id in NoteReplyRows.columns
+            users = authors.load(self.request, {row.author_id for row in rows}
+                                 | {reply[4] for thread in replies.values() for reply in thread})
+            return [self.row(row, tz, now, users, replies.get(row.id, [])) for row in rows]
+
+    def row(self, row, tz, now, users, replies):
+        (id, title, content, created_at, updated_at, author_id, edited, reply_count, last_activity_at,
+         parent_id, movie_id, movie_title, _) = row
+        username, avatar = users[author_id]
+        is_thread = parent_id is None
+        shown = replies if self.replies_limit is None else replies[:self.replies_limit]
+        data = {
+            'id': id,
+            'title': title,
+            'content': content,
+            'created_at': iso_datetime(created_at, tz),
+            'updated_at': iso_datetime(updated_at, tz),
+            'author': author_id,
+            'author_username': username,
+            'author_id': author_id,
+            'author_avatar': avatar,
+            'time_ago': None if now is None else time_ago(created_at, now),
+            'edited': edited,
+            'replies': [self.reply_rows.row(reply, tz, now, users) for reply in shown] if is_thread else [],
+            'reply_count': reply_count if is_thread else 0,
+            'last_activity_at': iso_datetime(last_activity_at, tz),
+            'parent': parent_id,
+            'movie_imdb_id': movie_id,
+            'movie_title': movie_title,
+        }
+        if self.replies_limit is not None:
+            data['replies_next_cursor'] = None
+            if is_thread and len(replies) > self.replies_limit:
+                last = replies[self.replies_limit - 1] if self.replies_limit else None
+                # Reply rows follow NoteReplyRows.columns: id, content, created_at, ...
+                data['replies_next_cursor'] = encode_cursor(last[2], last[0]) if last else ''
+        return data
+
+
+class WatchlistItemRows(RowSerializer):
+    """WatchlistItemSerializer."""
+    columns = ('id', 'movie_id', 'movie__title', 'movie__year', 'movie__poster', 'added_at', 'watched',
+               'rating', 'notes', 'movie__imdb_rating')
+
+    def row(self, row, tz, now):
+        id, imdb_id, title, year, poster, added_at, watched, rating, notes, imdb_rating = row
+        return {
+            'id': id,
+            'imdb_id': imdb_id,
+            'title': title,
+            'year': year,
+            'poster': poster,
+            'added_at': iso_datetime(added_at, tz),
+            'watched': watched,
+            'rating': rating,
+            'notes': notes,
+            'imdb_rating': imdb_rating,
+        }
@@ -0,0 +1,278 @@
+"""
+Local full-text search over catalog movies and notes.
+
+On Postgres each table gets a generated `search_vector` column with a GIN
+index; on SQLite, FTS5 tables kept in sync by triggers. Neither is known
+to the models: migration 0014 installs them through install(), and other
+databases fall back to (unindexed) icontains lookups. Postgres won't alter
+a column a generated one depends on, so a migration changing Movie.title
+or Note.title/content has to uninstall() first.
+
+Every word of the query is matched as a prefix, so results come back while
+the last word is still being typed. Ranking (ts_rank / bm25, titles
+weighted over note bodies) only looks at the first SEARCH_RANK_CANDIDATES
+matches, which bounds the cost of very common prefixes.
+"""
+import os
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+from .models import Movie, Note
+
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 50))
+SEARCH_RANK_CANDIDATES = int(os.getenv('SEARCH_RANK_CANDIDATES', 1000))
+# Words beyond this are ignored; each one is another index lookup
+SEARCH_MAX_TERMS = 8
+
+
+def query_terms(text):
+    """Lower-cased words of `text`, split the way both indexes tokenize."""
+    return re.findall(r'[^\W_]+', text.lower())[:SEARCH_MAX_TERMS]
+
+
+class PostgresSearch:
+    vendor = 'postgresql'
+
+    install_sql = [
+        """ALTER TABLE api_movie ADD COLUMN IF NOT EXISTS search_vector tsvector
+           GENERATED ALWAYS AS (to_tsvector('simple', title)) STORED""",
+        "CREATE INDEX IF NOT EXISTS movie_search_idx ON api_movie USING GIN (search_vector)",
+        """ALTER TABLE api_note ADD COLUMN IF NOT EXISTS search_vector tsvector
+           GENERATED ALWAYS AS (setweight(to_tsvector('simple', title), 'A') ||
+                                setweight(to_tsvector('simple', content), 'B')) STORED""",
+        "CREATE INDEX IF NOT EXISTS note_search_idx ON api_note USING GIN (search_vector)",
+    ]
+    uninstall_sql = [
+        "ALTER TABLE api_movie DROP COLUMN IF EXISTS search_vector",
+        "ALTER TABLE api_note DROP COLUMN IF EXISTS search_vector",
+    ]
+    # The candidate subquery has no ORDER BY so it can stop after
+    # SEARCH_RANK_CANDIDATES index matches
+    search_sql = """
+        SELECT {pk} FROM (
+            SELECT {pk}, search_vector FROM {table}
+            WHERE search_vector @@ to_tsquery('simple', %s) LIMIT %s
+        ) candidates
+        ORDER BY ts_rank(search_vector, to_tsquery('simple', %s)) DESC, {pk} DESC
+        LIMIT %s
+    """
+
+    def installed(self, cursor):
+        cursor.execute(
+            "SELECT count(*) FROM pg_indexes WHERE indexname IN ('movie_search_idx', 'note_search_idx')"
+        )
+        return cursor.fetchone()[0] == 2
+
+    def rebuild(self, cursor):
+        # Generated columns are always current
+        pass
+
+    def search(self, cursor, table, pk, terms, limit):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        cursor.execute(self.search_sql.format(table=table, pk=pk),
+                       [query, SEARCH_RANK_CANDIDATES, query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+    def search_movies(self, cursor, terms, limit):
+        return self.search(cursor, 'api_movie', 'imdb_id', terms, limit)
+
+    def search_notes(self, cursor, terms, limit):
+        return self.search(cursor, 'api_note', 'id', terms, limit)
+
+
+class SQLiteSearch:
+    vendor = 'sqlite'
+
+    # api_movie's rowid isn't stable (no integer primary key), so the movie
+    # index keeps its own copy of the title and is matched on imdb_id.
+    # Notes use api_note itself as external content, keyed by id.
+    install_sql = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS api_movie_fts USING fts5(
+               imdb_id, title, tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+        """CREATE TRIGGER IF NOT EXISTS api_movie_fts_insert AFTER INSERT ON api_movie BEGIN
+               INSERT INTO api_movie_fts(imdb_id, title) VALUES (new.imdb_id, new.title);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS api_movie_fts_delete AFTER DELETE ON api_movie BEGIN
+               DELETE FROM api_movie_fts WHERE rowid IN (
+                   SELECT rowid FROM api_movie_fts
+                   WHERE api_movie_fts MATCH 'imdb_id : "' || replace(old.imdb_id, '"', '""') || '"'
+               );
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS api_movie_fts_update AFTER UPDATE OF title ON api_movie
+           WHEN old.title IS NOT new.title BEGIN
+               UPDATE api_movie_fts SET title = new.title WHERE rowid IN (
+                   SELECT rowid FROM api_movie_fts
+                   WHERE api_movie_fts MATCH 'imdb_id : "' || replace(old.imdb_id, '"', '""') || '"'
+               );
+           END""",
+        """CREATE VIRTUAL TABLE IF NOT EXISTS api_note_fts USING fts5(
+               title, content, content='api_note', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+        """CREATE TRIGGER IF NOT EXISTS api_note_fts_insert AFTER INSERT ON api_note BEGIN
+               INSERT INTO api_note_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS api_note_fts_delete AFTER DELETE ON api_note BEGIN
+               INSERT INTO api_note_fts(api_note_fts, rowid, title, content)
+               VALUES ('delete', old.id, old.title, old.content);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS api_note_fts_update AFTER UPDATE OF title, content ON api_note BEGIN
+               INSERT INTO api_note_fts(api_note_fts, rowid, title, content)
+               VALUES ('delete', old.id, old.title, old.content);
+               INSERT INTO api_note_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+           END""",
+    ]
+    triggers = [
+        'api_movie_fts_insert', 'api_movie_fts_delete', 'api_movie_fts_update',
+        'api_note_fts_insert', 'api_note_fts_delete', 'api_note_fts_update',
+    ]
+    # Triggers first: left behind, they'd fail every write to the tables
+    uninstall_sql = [f'DROP TRIGGER IF EXISTS {name}' for name in triggers] + [
+        'DROP TABLE IF EXISTS api_movie_fts',
+        'DROP TABLE IF EXISTS api_note_fts',
+    ]
+    # FTS5 walks rowids in order cheaply, so the newest matches are ranked
+    movie_sql = """
+        SELECT imdb_id FROM (
+            SELECT imdb_id, title, bm25(api_movie_fts, 0.0, 1.0) AS score FROM api_movie_fts
+            WHERE api_movie_fts MATCH %s ORDER BY rowid DESC LIMIT %s
+        ) ORDER BY score, title LIMIT %s
+    """
+    note_sql = """
+        SELECT id FROM (
+            SELECT rowid AS id, bm25(api_note_fts, 4.0, 1.0) AS score FROM api_note_fts
+            WHERE api_note_fts MATCH %s ORDER BY rowid DESC LIMIT %s
+        ) ORDER BY score, id DESC LIMIT %s
+    """
+
+    def installed(self, cursor):
+        # Django rebuilds SQLite tables to alter them, which drops their
+        # triggers
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+            % ', '.join(['%s'] * len(self.triggers)),
+            self.triggers,
+        )
+        return cursor.fetchone()[0] == len(self.triggers)
+
+    def rebuild(self, cursor):
+        cursor.execute('DELETE FROM api_movie_fts')
+        cursor.execute('INSERT INTO api_movie_fts(imdb_id, title) SELECT imdb_id, title FROM api_movie')
+        cursor.execute("INSERT INTO api_note_fts(api_note_fts) VALUES ('rebuild')")
+
+    def match(self, terms, column=None):
+        query = ' AND '.join('"%s"*' % term for term in terms)
+        return f'{column} : ({query})' if column else query
+
+    def search_movies(self, cursor, terms, limit):
+        cursor.execute(self.movie_sql, [self.match(terms, 'title'), SEARCH_RANK_CANDIDATES, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+    def search_notes(self, cursor, terms, limit):
+        cursor.execute(self.note_sql, [self.match(terms), SEARCH_RANK_CANDIDATES, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {backend.vendor: backend for backend in (PostgresSearch(), SQLiteSearch())}
+
+
+def get_backend(connection=None):
+    return BACKENDS.get((connection or default_connection).vendor)
+
+
+def install(connection=None):
+    """
+    Create the search columns/tables, indexes and triggers if missing, and
+    reindex when anything had to be recreated. Returns True if it did.
+    """
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    if backend is None:
+        return False
+    with connection.cursor() as cursor:
+        if backend.installed(cursor):
+            return False
+        for sql in backend.install_sql:
+            cursor.execute(sql)
+        backend.rebuild(cursor)
+    return True
+
+
+def uninstall(connection=None):
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            for sql in backend.uninstall_sql:
+                cursor.execute(sql)
+
+
+def rebuild(connection=None):
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.rebuild(cursor)
+
+
+def ensure_installed(sender, using, **kwargs):
+    """post_migrate handler: put back triggers a table rebuild dropped."""
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+
+    connection = connections[using]
+    if ('api', '0014_search_indexes') in MigrationRecorder(connection).applied_migrations():
+        install(connection)
+
+
+def _in_order(ids, objects):
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def _fallback(queryset, fields, terms):
+    for term in terms:
+        match = Q()
+        for field in fields:
+            match |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(match)
+    return queryset
+
+
+def search_movies(text, limit=10, queryset=None):
+    """
+    Catalog movies whose title has every word of `text` as a prefix, best
+    match first. `queryset` narrows the results; the index is asked for a
+    few extra so that filtering rarely leaves the page short.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return []
+    limit = min(limit, SEARCH_MAX_RESULTS)
+    filtered = queryset is not None
+    queryset = queryset if filtered else Movie.objects.all()
+    backend = get_backend()
+    if backend is None:
+        return list(_fallback(queryset, ['title'], terms).order_by('title')[:limit])
+    with default_connection.cursor() as cursor:
+        ids = backend.search_movies(cursor, terms, limit * 3 if filtered else limit)
+    movies = _in_order(ids, queryset.in_bulk(ids))
+    # An exact title beats any score
+    title = ' '.join(terms)
+    movies.sort(key=lambda movie: ' '.join(query_terms(movie.title)) != title)
+    return movies[:limit]
+
+
+def search_notes(text, limit=10, queryset=None):
+    """Notes and replies matching every word of `text` as a prefix, best match first."""
+    terms = query_terms(text)
+    if not terms:
+        return []
+    limit = min(limit, SEARCH_MAX_RESULTS)
+    queryset = Note.objects.all() if queryset is None else queryset
+    backend = get_backend()
+    if backend is None:
+        return list(_fallback(queryset, ['title', 'content'], terms).order_by('-created_at')[:limit])
+    with default_connection.cursor() as cursor:
+        ids = backend.search_notes(cursor, terms, limit)
+    return _in_order(ids, queryset.in_bulk(ids))
@@ -1,13 +1,65 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.db import models
 from rest_framework import serializers
-from .models import Note, UserProfile, WatchlistItem
+from . import authors, catalog, metrics
+from .models import MovieDiscussionStats, Note, UserProfile, WatchlistItem, time_ago
+from .pagination import encode_cursor
 
-class UserProfileSerializer(serializers.ModelSerializer):
+
+def request_now(request):
+    """The time a request is rendered as of; read once, shared by every note in it."""
+    if not hasattr(request, '_rendered_at'):
+        request._rendered_at = timezone.now()
+    return request._rendered_at
+
+
+class TimeAgoField(serializers.ReadOnlyField):
+    """
+    Note.time_since_created, as of request_now() instead of a fresh clock
+    read per note. Null with SERVER_TIME_AGO off: clients format created_at
+    themselves and the payload no longer depends on when it was rendered.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'created_at'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not settings.SERVER_TIME_AGO:
+            return None
+        request = self.context.get('request')
+        if request is None:
+            # Rendered outside a request; the serializer context stands in
+            if 'now' not in self.context:
+                self.context['now'] = timezone.now()
+            return time_ago(value, self.context['now'])
+        return time_ago(value, request_now(request))
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer whose output counts as the `serializer` phase in api/metrics.py."""
+
+    def to_representation(self, instance):
+        with metrics.phase('serializer'):
+            return super().to_representation(instance)
+
+class AuthorListSerializer(serializers.ListSerializer):
+    """Loads the authors of all the notes it renders with one authors.load()."""
+
+    def to_representation(self, data):
+        notes = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        user_ids = {user_id for note in notes for user_id in self.child.author_ids(note)}
+        authors.load(self.context.get('request'), user_ids)
+        return super().to_representation(notes)
+
+class UserProfileSerializer(TimedModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['avatar', 'bio']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     profile = UserProfileSerializer(read_only=True)
     
     class Meta:
@@ -18,64 +70,181 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         UserProfile.objects.create(user=user)
+        authors.invalidate(user.pk)
         return user
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(TimedModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_id = serializers.IntegerField(source='author.id', read_only=True)
-    time_ago = serializers.CharField(source='time_since_created', read_only=True)
+    time_ago = TimeAgoField()
     replies = serializers.SerializerMethodField()
     reply_count = serializers.SerializerMethodField()
     author_avatar = serializers.SerializerMethodField()
+    movie_imdb_id = serializers.CharField(source='movie_id', max_length=20, required=False,
+                                          allow_null=True, allow_blank=True)
+    movie_title = serializers.CharField(source='movie.title', max_length=200, required=False,
+                                        allow_null=True, allow_blank=True)
 
     class Meta:
         model = Note
         fields = ["id", "title", "content", "created_at", "updated_at", "author",
                  "author_username", "author_id", "author_avatar", "time_ago",
-                 "edited", "replies", "reply_count", "parent", "movie_imdb_id", "movie_title"]
-        extra_kwargs = {"author": {"read_only": True}}
+                 "edited", "replies", "reply_count", "last_activity_at", "parent", "movie_imdb_id", "movie_title"]
+        list_serializer_class = AuthorListSerializer
+        extra_kwargs = {"author": {"read_only": True}, "last_activity_at": {"read_only": True}}
+
+    def _resolve_movie(self, validated_data):
+        # The movie itself lives in the catalog; movie_title only names it
+        # the first time anyone mentions it
+        movie = validated_data.pop('movie', {})
+        if 'movie_id' in validated_data:
+            imdb_id = validated_data.pop('movie_id')
+            validated_data['movie'] = (
+                catalog.get_or_create(imdb_id, title=movie.get('title')) if imdb_id else None
+            )
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._resolve_movie(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._resolve_movie(validated_data))
+
+    def author_ids(self, note):
+        """Whose avatars `note` shows: its author's and, if already loaded, its replies' authors'."""
+        replies = getattr(note, 'capped_replies', None)
+        if replies is None:
+            replies = getattr(note, '_prefetched_objects_cache', {}).get('replies', ())
+        return {note.author_id, *(reply.author_id for reply in replies)}
+
+    def _loaded_replies(self, obj):
+        # NoteListCreate stores replies in capped_replies when ?replies=N
+        # limits them, with one extra row to detect that more exist
+        if hasattr(obj, 'capped_replies'):
+            return obj.capped_replies
+        return obj.replies.all()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        replies_limit = self.context.get('replies_limit')
+        if replies_limit is not None:
+            data['replies_next_cursor'] = None
+            replies = self._loaded_replies(instance)
+            if instance.parent_id is None and len(replies) > replies_limit:
+                last = replies[replies_limit - 1] if replies_limit else None
+                data['replies_next_cursor'] = (
+                    encode_cursor(last.created_at, last.pk) if last else ''
+                )
+        return data
 
     def get_replies(self, obj):
-        if obj.parent is None:  # Only get replies for parent notes
-            replies = obj.replies.all()
-            return NoteReplySerializer(replies, many=True).data
+        if obj.parent_id is None:  # Only get replies for parent notes
+            replies = self._loaded_replies(obj)
+            replies_limit = self.context.get('replies_limit')
+            if replies_limit is not None:
+                replies = list(replies)[:replies_limit]
+            return NoteReplySerializer(replies, many=True, context=self.context).data
         return []
 
     def get_reply_count(self, obj):
-        if obj.parent is None:
-            return obj.replies.count()
+        if obj.parent_id is None:
+            return obj.reply_count
         return 0
 
     def get_author_avatar(self, obj):
-        try:
-            return obj.author.profile.avatar
-        except UserProfile.DoesNotExist:
-            return f'https://api.dicebear.com/7.x/initials/svg?seed={obj.author.username}&backgroundColor=9370DB'
+        return authors.load(self.context.get('request'), [obj.author_id])[obj.author_id][1]
 
-class NoteReplySerializer(serializers.ModelSerializer):
+class NoteReplySerializer(TimedModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar = serializers.SerializerMethodField()
-    time_ago = serializers.CharField(source='time_since_created', read_only=True)
+    time_ago = TimeAgoField()
 
     class Meta:
         model = Note
         fields = ["id", "content", "created_at", "updated_at", "author_username",
                  "author_avatar", "time_ago", "edited"]
+        list_serializer_class = AuthorListSerializer
+
+    def author_ids(self, note):
+        return {note.author_id}
 
     def get_author_avatar(self, obj):
-        try:
-            return obj.author.profile.avatar
-        except UserProfile.DoesNotExist:
-            return f'https://api.dicebear.com/7.x/initials/svg?seed={obj.author.username}&backgroundColor=9370DB'
+        return authors.load(self.context.get('request'), [obj.author_id])[obj.author_id][1]
+
+class WatchlistItemSerializer(TimedModelSerializer):
+    # Movie details come from the shared catalog; what the client sends
+    # only seeds it for movies it doesn't have yet
+    imdb_id = serializers.CharField(source='movie_id', max_length=20)
+    title = serializers.CharField(source='movie.title', max_length=200)
+    year = serializers.CharField(source='movie.year', max_length=4)
+    poster = serializers.URLField(source='movie.poster', max_length=500)
+    imdb_rating = serializers.CharField(source='movie.imdb_rating', max_length=4, required=False,
+                                        allow_null=True, allow_blank=True)
 
-class WatchlistItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = WatchlistItem
         fields = ['id', 'imdb_id', 'title', 'year', 'poster', 'added_at', 'watched', 'rating', 'notes', 'imdb_rating']
         read_only_fields = ['id', 'added_at']
         extra_kwargs = {
-            'imdb_rating': {'required': False},
             'notes': {'required': False},
             'rating': {'required': False},
             'watched': {'required': False}
-        }
\ No newline at end of file
+        }
+
+    def _resolve_movie(self, validated_data):
+        movie = validated_data.pop('movie', {})
+        if 'movie_id' in validated_data:
+            validated_data['movie'] = catalog.get_or_create(validated_data.pop('movie_id'), **movie)
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._resolve_movie(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._resolve_movie(validated_data))
+
+class MovieDiscussionStatsSerializer(TimedModelSerializer):
+    movie_imdb_id = serializers.CharField(source='movie_id', read_only=True)
+    movie_title = serializers.CharField(source='movie.title', read_only=True)
+
+    class Meta:
+        model = MovieDiscussionStats
+        fields = ['movie_imdb_id', 'movie_title', 'thread_count', 'reply_count',
+                  'author_count', 'last_activity_at']
+
+class NoteSearchResultSerializer(TimedModelSerializer):
+    author_username = serializers.CharField(source='author.username', read_only=True)
+    movie_imdb_id = serializers.CharField(source='movie_id', read_only=True)
+    movie_title = serializers.CharField(source='movie.title', read_only=True, default=None)
+
+    class Meta:
+        model = Note
+        fields = ['id', 'title', 'content', 'created_at', 'author_username', 'parent',
+                  'movie_imdb_id', 'movie_title']
+
+class WatchlistImportSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of watchlist items in one pass.
+
+    Unlike a plain many=True serializer the valid items are kept when others
+    fail: `validated_data` has None for each rejected item and
+    `item_errors` the matching errors.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('child', WatchlistItemSerializer())
+        super().__init__(*args, **kwargs)
+        self.item_errors = []
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError('Expected a list of watchlist items.')
+        validated, self.item_errors = [], []
+        for item in data:
+            try:
+                validated.append(self.child.run_validation(item))
+                self.item_errors.append({})
+            except serializers.ValidationError as exc:
+                validated.append(None)
+                self.item_errors.append(exc.detail)
+        return validated
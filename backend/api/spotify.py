@@ -0,0 +1,372 @@
+import asyncio
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+import hashlib
+import math
+import os
+import threading
+import time
+import weakref
+
+from django.core.cache import caches
+
+from . import http_client
+from .cache import TieredCache
+
+SPOTIFY_TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1')
+# Refresh this many seconds before Spotify says the token expires
+SPOTIFY_TOKEN_MARGIN = int(os.getenv('SPOTIFY_TOKEN_MARGIN', 60))
+# Share the token between workers through the Django cache
+SPOTIFY_SHARE_TOKEN = os.getenv('SPOTIFY_SHARE_TOKEN', 'true').lower() == 'true'
+
+# Playlist results are refetched after SPOTIFY_SEARCH_FRESH, but kept for
+# SPOTIFY_SEARCH_TTL so there is something to serve while rate limited
+SPOTIFY_SEARCH_FRESH = int(os.getenv('SPOTIFY_SEARCH_FRESH', 60 * 60 * 6))
+SPOTIFY_SEARCH_TTL = int(os.getenv('SPOTIFY_SEARCH_TTL', 60 * 60 * 24 * 7))
+playlist_cache = TieredCache(
+    'spotify:playlists',
+    max_entries=int(os.getenv('SPOTIFY_SEARCH_CACHE_SIZE', 1000)),
+    ttl=SPOTIFY_SEARCH_TTL,
+    local_ttl=SPOTIFY_SEARCH_FRESH,
+)
+
+
+class SpotifyAuthError(Exception):
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class SpotifySearchError(Exception):
+    pass
+
+
+class SpotifyRateLimited(SpotifySearchError):
+    def __init__(self, retry_after):
+        super().__init__('Spotify rate limit reached')
+        self.retry_after = retry_after
+
+
+def get_credentials():
+    return os.getenv('SPOTIFY_CLIENT_ID'), os.getenv('SPOTIFY_CLIENT_SECRET')
+
+
+def credentials_configured():
+    client_id, client_secret = get_credentials()
+    return bool(client_id and client_secret)
+
+
+class TokenManager:
+    """
+    Caches the client-credentials access token until shortly before it
+    expires.
+
+    Only one thread per process refreshes at a time; the others wait for it
+    and reuse the new token. With `shared` set, the token is also stored in
+    the Django cache so other workers don't fetch their own.
+    """
+
+    cache_key = 'spotify:token'
+
+    def __init__(self, token_url=None, margin=SPOTIFY_TOKEN_MARGIN,
+                 shared=SPOTIFY_SHARE_TOKEN, cache_alias='default'):
+        self.token_url = token_url or SPOTIFY_TOKEN_URL
+        self.margin = margin
+        self.shared = shared
+        self.cache_alias = cache_alias
+        self._token = None
+        self._lock = threading.Lock()
+        # asyncio locks belong to one event loop
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    def _usable(self, token):
+        return token is not None and token['expires_at'] - self.margin > time.time()
+
+    def _public(self, token):
+        return {
+            'access_token': token['access_token'],
+            'token_type': token['token_type'],
+            'expires_in': int(token['expires_at'] - time.time()),
+        }
+
+    def get_token(self):
+        """Return {'access_token', 'token_type', 'expires_in'}, fetching only if needed."""
+        token = self._token
+        if not self._usable(token):
+            with self._lock:
+                token = self._token
+                if not self._usable(token):
+                    token = self._load_shared() or self._fetch()
+                    self._token = token
+        return self._public(token)
+
+    async def aget_token(self):
+        """get_token() for async callers; one coroutine per loop refreshes."""
+        token = self._token
+        if not self._usable(token):
+            loop = asyncio.get_running_loop()
+            lock = self._async_locks.setdefault(loop, asyncio.Lock())
+            async with lock:
+                token = self._token
+                if not self._usable(token):
+                    token = await self._aload_shared() or await self._afetch()
+                    self._token = token
+        return self._public(token)
+
+    async def aget_access_token(self):
+        return (await self.aget_token())['access_token']
+
+    def get_access_token(self):
+        return self.get_token()['access_token']
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Spotify rejects it with a 401."""
+        with self._lock:
+            self._token = None
+            if self.shared:
+                caches[self.cache_alias].delete(self.cache_key)
+
+    async def ainvalidate(self):
+        with self._lock:
+            self._token = None
+        if self.shared:
+            await caches[self.cache_alias].adelete(self.cache_key)
+
+    def _load_shared(self):
+        if not self.shared:
+            return None
+        token = caches[self.cache_alias].get(self.cache_key)
+        return token if self._usable(token) else None
+
+    async def _aload_shared(self):
+        if not self.shared:
+            return None
+        token = await caches[self.cache_alias].aget(self.cache_key)
+        return token if self._usable(token) else None
+
+    def _token_request(self):
+        client_id, client_secret = get_credentials()
+        if not client_id or not client_secret:
+            raise SpotifyAuthError('Spotify credentials not configured')
+        return {
+            'data': {
+                'grant_type': 'client_credentials'
+            },
+            'auth': (client_id, client_secret),
+        }
+
+    def _parse_token(self, auth_response):
+        if auth_response.status_code != 200:
+            try:
+                details = auth_response.json()
+            except ValueError:
+                details = auth_response.text or 'No error details available'
+            raise SpotifyAuthError('Failed to authenticate with Spotify', details)
+
+        data = auth_response.json()
+        return {
+            'access_token': data['access_token'],
+            'token_type': data.get('token_type', 'Bearer'),
+            'expires_at': time.time() + int(data.get('expires_in', 3600)),
+        }
+
+    def _shared_timeout(self, token):
+        """How long other workers may reuse `token`, if at all."""
+        return int(token['expires_at'] - time.time()) - self.margin if self.shared else 0
+
+    def _fetch(self):
+        token = self._parse_token(http_client.post(self.token_url, **self._token_request()))
+        timeout = self._shared_timeout(token)
+        if timeout > 0:
+            caches[self.cache_alias].set(self.cache_key, token, timeout)
+        return token
+
+    async def _afetch(self):
+        token = self._parse_token(await http_client.apost(self.token_url, **self._token_request()))
+        timeout = self._shared_timeout(token)
+        if timeout > 0:
+            await caches[self.cache_alias].aset(self.cache_key, token, timeout)
+        return token
+
+
+token_manager = TokenManager()
+
+
+def _search_params(query):
+    return {
+        'q': query,
+        'type': 'playlist',
+        'limit': 5
+    }
+
+
+def search_playlists(query, manager=None):
+    """
+    Search Spotify playlists with a cached access token.
+
+    A 401 means the token was revoked or expired early, so it is dropped and
+    the search retried once with a fresh one.
+    """
+    manager = manager or token_manager
+    for _ in range(2):
+        search_response = http_client.get(
+            f'{SPOTIFY_API_URL}/search',
+            params=_search_params(query),
+            headers={
+                'Authorization': f'Bearer {manager.get_access_token()}'
+            }
+        )
+        if search_response.status_code != 401:
+            break
+        manager.invalidate()
+    return search_response
+
+
+async def asearch_playlists(query, manager=None):
+    manager = manager or token_manager
+    for _ in range(2):
+        search_response = await http_client.aget(
+            f'{SPOTIFY_API_URL}/search',
+            params=_search_params(query),
+            headers={
+                'Authorization': f'Bearer {await manager.aget_access_token()}'
+            }
+        )
+        if search_response.status_code != 401:
+            break
+        await manager.ainvalidate()
+    return search_response
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def _playlist_key(query):
+    return hashlib.md5(normalize_query(query).encode()).hexdigest()
+
+
+def _seconds_left(until):
+    return max(int(until - time.time()), 0) if until else 0
+
+
+def rate_limited_for():
+    """Seconds left on the last Retry-After Spotify sent us, across workers."""
+    return _seconds_left(caches['default'].get('spotify:retry_after'))
+
+
+async def arate_limited_for():
+    return _seconds_left(await caches['default'].aget('spotify:retry_after'))
+
+
+def _back_off(retry_after):
+    caches['default'].set('spotify:retry_after', time.time() + retry_after, retry_after)
+
+
+async def _aback_off(retry_after):
+    await caches['default'].aset('spotify:retry_after', time.time() + retry_after, retry_after)
+
+
+def _fresh_data(entry, force):
+    if entry is not None and not force and entry['fresh_until'] > time.time():
+        return entry['data']
+    return None
+
+
+def _cached_playlists(query, force):
+    """Return (cache key, cached entry or None, fresh data or None)."""
+    key = _playlist_key(query)
+    entry = playlist_cache.get(key)
+    return key, entry, _fresh_data(entry, force)
+
+
+async def _acached_playlists(query, force):
+    key = _playlist_key(query)
+    entry = await playlist_cache.aget(key)
+    return key, entry, _fresh_data(entry, force)
+
+
+def parse_retry_after(value, default=1):
+    """
+    Seconds to wait from a Retry-After header, which is either
+    delta-seconds or an HTTP date; `default` when missing or unparseable.
+    """
+    if not value:
+        return default
+    try:
+        seconds = int(value)
+    except ValueError:
+        try:
+            until = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        if until.tzinfo is None:
+            # HTTP dates are always GMT
+            until = until.replace(tzinfo=timezone.utc)
+        seconds = math.ceil(until.timestamp() - time.time())
+    return max(seconds, 1)
+
+
+def _fallback(entry, error):
+    if entry is not None:
+        return entry['data']
+    raise error
+
+
+def _store_playlists(key, entry, search_response):
+    if search_response.status_code == 429:
+        retry_after = parse_retry_after(search_response.headers.get('Retry-After'))
+        _back_off(retry_after)
+        return _fallback(entry, SpotifyRateLimited(retry_after))
+    if search_response.status_code != 200:
+        return _fallback(entry, SpotifySearchError('Failed to search Spotify'))
+
+    data = search_response.json()
+    playlist_cache.set(key, {'data': data, 'fresh_until': time.time() + SPOTIFY_SEARCH_FRESH})
+    return data
+
+
+async def _astore_playlists(key, entry, search_response):
+    if search_response.status_code == 429:
+        retry_after = parse_retry_after(search_response.headers.get('Retry-After'))
+        await _aback_off(retry_after)
+        return _fallback(entry, SpotifyRateLimited(retry_after))
+    if search_response.status_code != 200:
+        return _fallback(entry, SpotifySearchError('Failed to search Spotify'))
+
+    data = search_response.json()
+    await playlist_cache.aset(key, {'data': data, 'fresh_until': time.time() + SPOTIFY_SEARCH_FRESH})
+    return data
+
+
+def cached_search_playlists(query, force=False):
+    """
+    Playlist search results for `query`, from the cache while fresh.
+
+    While Spotify is rate limiting us (429 + Retry-After) or failing, stale
+    results are served instead; SpotifyRateLimited/SpotifySearchError are
+    only raised when there is nothing cached to fall back on.
+    """
+    key, entry, data = _cached_playlists(query, force)
+    if data is not None:
+        return data
+
+    retry_after = rate_limited_for()
+    if retry_after:
+        return _fallback(entry, SpotifyRateLimited(retry_after))
+
+    return _store_playlists(key, entry, search_playlists(normalize_query(query)))
+
+
+async def acached_search_playlists(query, force=False):
+    """Async cached_search_playlists()."""
+    key, entry, data = await _acached_playlists(query, force)
+    if data is not None:
+        return data
+
+    retry_after = await arate_limited_for()
+    if retry_after:
+        return _fallback(entry, SpotifyRateLimited(retry_after))
+
+    return await _astore_playlists(key, entry, await asearch_playlists(normalize_query(query)))
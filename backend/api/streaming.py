@@ -0,0 +1,101 @@
+import csv
+import itertools
+import os
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+# Rows fetched per database round trip while streaming
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+
+
+class Echo:
+    """File-like object for csv.writer that hands each line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    """Yield a header line and then one CSV line per dict in `rows`."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row.get(field, '') for field in fields])
+
+
+def json_array(rows):
+    """
+    Yield `rows` as the pieces of one JSON array, byte for byte what
+    JSONRenderer would produce for the whole list.
+    """
+    from .renderers import FastJSONRenderer
+    render = FastJSONRenderer().render
+    yield b'['
+    for i, row in enumerate(rows):
+        yield (b',' if i else b'') + render(row)
+    yield b']'
+
+
+def ndjson_lines(rows):
+    """Yield `rows` as newline-delimited JSON, one object per line."""
+    from .renderers import FastJSONRenderer
+    render = FastJSONRenderer().render
+    for row in rows:
+        yield render(row) + b'\n'
+
+
+def serialized_rows(queryset, serializer_class, context=None):
+    """Serialize `queryset` row by row, fetching STREAM_CHUNK_SIZE rows per query."""
+    serializer = serializer_class(context=context or {})
+    for instance in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield serializer.to_representation(instance)
+
+
+async def _async_chunks(chunks):
+    # The generator runs queries, so it has to stay on the request's
+    # database thread; pulling a batch per hop keeps the switches cheap
+    next_batch = sync_to_async(lambda: list(itertools.islice(chunks, STREAM_CHUNK_SIZE)))
+    while batch := await next_batch():
+        for chunk in batch:
+            yield chunk
+
+
+def streaming_response(request, chunks, content_type, filename=None):
+    """
+    StreamingHttpResponse over the generator `chunks`.
+
+    Under ASGI Django buffers a sync iterator into a list before sending it,
+    so there the generator is wrapped in an async one instead.
+    """
+    if isinstance(request, ASGIRequest) or isinstance(getattr(request, '_request', None), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def stream_requested(request):
+    """Whether the client asked for ?stream=true or an NDJSON response."""
+    return (request.accepted_renderer.format == 'ndjson' or
+            request.query_params.get('stream', '').lower() in ('1', 'true'))
+
+
+def stream_list(request, queryset, serializer_class, context=None):
+    """
+    Stream a serialized queryset as NDJSON when that was negotiated,
+    otherwise as the same JSON array a plain Response would render.
+
+    Only one chunk of rows is held in memory at a time, instead of the
+    instances, the serialized list and the rendered body all at once.
+    """
+    return stream_rows(request, serialized_rows(queryset, serializer_class, context))
+
+
+def stream_rows(request, rows):
+    """stream_list() for rows that are already serialized, e.g. by api.rows."""
+    if request.accepted_renderer.format == 'ndjson':
+        return streaming_response(request, ndjson_lines(rows), 'application/x-ndjson')
+    return streaming_response(request, json_array(rows), 'application/json')
@@ -1,10 +1,44 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from email.utils import format_datetime
+from decimal import Decimal
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APIClient
-from .models import UserProfile, WatchlistItem, Note
-from .serializers import UserSerializer, WatchlistItemSerializer, NoteSerializer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import (FeedVersion, Movie, MovieDiscussionAuthor, MovieDiscussionStats, Note, UserProfile,
+                     WatchlistItem, default_avatar)
+from .cache import TieredCache
+from .renderers import FastJSONRenderer
+from .rows import NoteReplyRows, NoteRows, WatchlistItemRows
+from .serializers import NoteReplySerializer, UserSerializer, WatchlistItemSerializer, NoteSerializer
+from . import authors, catalog, fragments, http_client, metrics, omdb, search, spotify, views
+
+
+def add_to_watchlist(user, imdb_id, title='m', year='2000', poster='https://example.com/p.jpg', **fields):
+    movie, _ = Movie.objects.get_or_create(imdb_id=imdb_id, defaults={
+        'title': title, 'year': year, 'poster': poster, 'imdb_rating': fields.pop('imdb_rating', None),
+    })
+    return WatchlistItem.objects.create(user=user, movie=movie, **fields)
+
 
 class APITestCase(TestCase):
     def setUp(self):
@@ -16,9 +50,9 @@ class APITestCase(TestCase):
         )
         self.client.force_authenticate(user=self.user)
         
-        self.watchlist_item = WatchlistItem.objects.create(
-            user=self.user,
-            imdb_id='tt0111161',
+        self.watchlist_item = add_to_watchlist(
+            self.user,
+            'tt0111161',
             title='The Shawshank Redemption',
             year='1994',
             poster='https://example.com/poster.jpg',
@@ -116,3 +150,1755 @@ class APITestCase(TestCase):
         
         response = unauthorized_client.get(reverse('user-profile'))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+
+def fake_omdb_get(delays=None):
+    """Stand-in for requests.get that answers like OMDb, optionally slowly."""
+    delays = delays or {}
+
+    def get(url, params=None, **kwargs):
+        if 's' in params:
+            return FakeResponse({'Search': [
+                {'imdbID': f'tt{i:07d}'} for i in range(5)
+            ]})
+        imdb_id = params['i']
+        time.sleep(delays.get(imdb_id, 0))
+        return FakeResponse({
+            'imdbID': imdb_id,
+            'Title': f'Movie {imdb_id}',
+            'Year': '2000',
+            'Poster': f'https://example.com/{imdb_id}.jpg',
+            'imdbRating': '7.0',
+        })
+    return get
+
+
+class OMDbSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for tiered in (omdb.detail_cache, omdb.search_cache):
+            tiered.clear_local()
+            tiered.reset_stats()
+        # These cover the caches alone; several fetch from other threads,
+        # whose writes would outlive the test transaction
+        patcher = mock.patch.multiple(catalog, lookup=mock.Mock(return_value={}), store=mock.Mock(),
+                                      search=mock.Mock(return_value=[]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_details_keep_search_order(self):
+        """Concurrent lookups come back in the order OMDb listed them"""
+        delays = {'tt0000000': 0.2, 'tt0000001': 0.1}
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get(delays)):
+            results = omdb.search_movies('movie')
+        self.assertEqual(
+            [movie['imdbID'] for movie in results],
+            [f'tt{i:07d}' for i in range(5)]
+        )
+
+    def test_partial_results_after_deadline(self):
+        """Lookups that miss the deadline are dropped, the rest are returned"""
+        delays = {'tt0000002': 1}
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get(delays)), \
+                mock.patch('api.omdb.OMDB_SEARCH_DEADLINE', 0.3):
+            started = time.monotonic()
+            results = omdb.search_movies('movie')
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual(
+            [movie['imdbID'] for movie in results],
+            ['tt0000000', 'tt0000001', 'tt0000003', 'tt0000004']
+        )
+
+    def test_deadline_bounds_search_request(self):
+        """The s= request counts against the deadline too, without retries"""
+        calls = []
+        answer = fake_omdb_get()
+
+        def fake_get(url, params=None, **kwargs):
+            calls.append((params, kwargs))
+            return answer(url, params)
+
+        with mock.patch('api.http_client.get', side_effect=fake_get), \
+                mock.patch('api.omdb.OMDB_SEARCH_DEADLINE', 0.5):
+            omdb.search_movies('movie')
+        self.assertEqual(len(calls), 6)
+        for params, kwargs in calls:
+            self.assertLessEqual(max(kwargs['timeout']), 0.5, params)
+            self.assertIs(kwargs['retry'], False)
+
+        # Nothing is sent once the budget is spent
+        with mock.patch('api.http_client.get') as get, \
+                self.assertRaises(requests.Timeout):
+            omdb.search('movie', deadline=time.monotonic())
+        get.assert_not_called()
+
+    def test_detail_cache_skips_network(self):
+        """Repeat searches only hit OMDb for the s= lookup"""
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            first = omdb.search_movies('movie')
+            self.assertEqual(fake_get.call_count, 6)
+            second = omdb.search_movies('another movie')
+            self.assertEqual(fake_get.call_count, 7)
+        self.assertEqual(first, second)
+
+        stats = omdb.detail_cache.stats()
+        self.assertEqual(stats['misses'], 5)
+        self.assertEqual(stats['local_hits'], 5)
+
+    def test_shared_tier_refills_local_tier(self):
+        """A cold process picks up detail records from the shared cache"""
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()):
+            omdb.search_movies('movie')
+        for tiered in (omdb.detail_cache, omdb.search_cache):
+            tiered.clear_local()
+            tiered.reset_stats()
+
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            omdb.search_movies('another movie')
+        self.assertEqual(fake_get.call_count, 1)
+        self.assertEqual(omdb.detail_cache.stats()['shared_hits'], 5)
+
+    def test_normalized_query_cache(self):
+        """Queries differing only in case and spacing share a cache entry"""
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            first = omdb.search_movies('The Matrix')
+            second = omdb.search_movies('  the   MATRIX ')
+        self.assertEqual(fake_get.call_count, 6)
+        self.assertEqual(first, second)
+
+    def test_concurrent_queries_share_one_fetch(self):
+        """Identical queries in flight at the same time make one upstream fetch"""
+        fake_get = mock.Mock(side_effect=fake_omdb_get({'tt0000000': 0.3}))
+        results = []
+        with mock.patch('api.http_client.get', fake_get):
+            threads = [
+                threading.Thread(target=lambda: results.append(omdb.search_movies('alien')))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(fake_get.call_count, 6)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_stale_entry_served_while_refreshing(self):
+        """A stale entry answers immediately and is refreshed in the background"""
+        key = omdb._search_key('heat')
+        omdb.search_cache.set(key, {'results': [{'imdbID': 'old'}], 'fresh_until': 0})
+
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            self.assertEqual(omdb.search_movies('Heat'), [{'imdbID': 'old'}])
+            for _ in range(50):
+                if omdb.search_cache.get(key)['results'] != [{'imdbID': 'old'}]:
+                    break
+                time.sleep(0.02)
+        self.assertEqual(len(omdb.search_cache.get(key)['results']), 5)
+
+
+class MovieCatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for tiered in (omdb.detail_cache, omdb.search_cache):
+            tiered.clear_local()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cataloger', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+
+    def fetched(self, imdb_id, title, age=timedelta(0)):
+        return Movie.objects.create(imdb_id=imdb_id, title=title, year='2000',
+                                    poster=f'https://example.com/{imdb_id}.jpg', imdb_rating='7.0',
+                                    fetched_at=timezone.now() - age)
+
+    def test_fetched_details_fill_catalog(self):
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()):
+            results = omdb.search_movies('movie')
+        self.assertEqual(Movie.objects.exclude(fetched_at=None).count(), 5)
+
+        # A cold cache answers detail lookups from the catalog
+        cache.clear()
+        omdb.detail_cache.clear_local()
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            details, complete = omdb.fetch_details([movie['imdbID'] for movie in results], 1)
+        self.assertEqual(fake_get.call_count, 0)
+        self.assertTrue(complete)
+        self.assertEqual(details, results)
+
+    def test_search_answered_from_catalog(self):
+        for i in range(12):
+            self.fetched(f'tt{i:07d}', f'Alien {i}')
+        self.fetched('tt0078748', 'Alien')
+        self.fetched('tt0090605', 'Aliens')
+        Movie.objects.create(imdb_id='tt9999999', title='Alien from user input')
+
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get), \
+                mock.patch.object(catalog, 'CATALOG_MIN_RESULTS', 10):
+            response = self.client.get(reverse('search-movies'), {'q': 'ALIEN'})
+        self.assertEqual(fake_get.call_count, 0)
+        results = response.json()['Search']
+        self.assertEqual(len(results), omdb.MAX_RESULTS)
+        # Exact title first; never-fetched rows are not search results
+        self.assertEqual(results[0], Movie.objects.get(pk='tt0078748').as_search_result())
+        self.assertNotIn('tt9999999', [movie['imdbID'] for movie in results])
+
+    def test_too_few_matches_go_upstream(self):
+        self.fetched('tt0078748', 'Movie tt0078748')
+        fake_get = mock.Mock(side_effect=fake_omdb_get())
+        with mock.patch('api.http_client.get', fake_get):
+            results = omdb.search_movies('movie')
+        self.assertEqual(fake_get.call_count, 6)
+        self.assertEqual(len(results), 5)
+
+    def test_stale_rows_served_and_refreshed(self):
+        self.fetched('tt0000001', 'Old title', age=timedelta(seconds=catalog.CATALOG_REFRESH_AGE + 60))
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()), \
+                mock.patch.object(omdb, '_refresh_catalog_in_background') as refresh:
+            details, _ = omdb.fetch_details(['tt0000001'], 1)
+        self.assertEqual(details[0]['Title'], 'Old title')
+        refresh.assert_called_once_with(['tt0000001'])
+
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()):
+            self.assertEqual(omdb.refresh_catalog(['tt0000001']), 1)
+        movie = Movie.objects.get(pk='tt0000001')
+        self.assertEqual(movie.title, 'Movie tt0000001')
+        self.assertFalse(catalog.is_stale(movie))
+
+    def test_store_outdates_threads_only_on_shown_changes(self):
+        same = Movie.objects.create(imdb_id='tt0000001', title='Movie tt0000001', year='2000',
+                                    poster='https://example.com/tt0000001.jpg')
+        Movie.objects.create(imdb_id='tt0000002', title='Typed in')
+        threads = {movie_id: Note.objects.create(title='t', content='c', author=self.user, movie_id=movie_id)
+                   for movie_id in ('tt0000001', 'tt0000002')}
+        versions = dict(Note.objects.values_list('pk', 'version'))
+        feed = FeedVersion.objects.get(scope=FeedVersion.FEED).version
+
+        # tt0000001 only gains a rating; tt0000002 gets its real title;
+        # tt0000003 is new, so nothing shows it yet
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()), \
+                CaptureQueriesContext(connection) as queries:
+            details, complete = omdb.fetch_details(['tt0000001', 'tt0000002', 'tt0000003'], 1)
+        self.assertTrue(complete)
+        self.assertEqual(len(details), 3)
+        self.assertEqual(Movie.objects.get(pk='tt0000001').imdb_rating, '7.0')
+        self.assertNotEqual(same.fetched_at, Movie.objects.get(pk='tt0000001').fetched_at)
+        self.assertEqual(Note.objects.get(pk=threads['tt0000001'].pk).version, versions[threads['tt0000001'].pk])
+        self.assertEqual(Note.objects.get(pk=threads['tt0000002'].pk).version,
+                         versions[threads['tt0000002'].pk] + 1)
+        self.assertGreater(FeedVersion.objects.get(scope=FeedVersion.FEED).version, feed)
+
+        # The catalog rows are read once, and an unchanged refresh writes
+        # nothing but the upsert
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if query['sql'].startswith('SELECT') and 'api_movie' in query['sql']]), 1)
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()), \
+                self.assertNumQueries(2):
+            omdb.refresh_catalog(['tt0000001', 'tt0000002'])
+
+    def test_refresh_command_fills_client_rows(self):
+        add_to_watchlist(self.user, 'tt0000003', title='Typed in', poster='')
+        with mock.patch('api.http_client.get', side_effect=fake_omdb_get()):
+            call_command('refresh_movie_catalog', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.client.get(reverse('watchlist')).data[0]['poster'],
+                         'https://example.com/tt0000003.jpg')
+
+    def test_watchlist_and_notes_share_catalog_row(self):
+        movie = self.fetched('tt0000004', 'Shared')
+        self.client.post(reverse('watchlist'), {
+            'imdb_id': 'tt0000004', 'title': 'Client title', 'year': '1999',
+            'poster': 'https://example.com/client.jpg',
+        }, format='json')
+        self.client.post(reverse('note-list'), {
+            'title': 't', 'content': 'c', 'movie_imdb_id': 'tt0000004', 'movie_title': 'Other title',
+        }, format='json')
+        etag = self.client.get(reverse('watchlist'))['ETag']
+
+        movie.title = 'Renamed'
+        movie.save()
+        response = self.client.get(reverse('watchlist'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['title'], 'Renamed')
+        self.assertEqual(self.client.get(reverse('note-list')).data[0]['movie_title'], 'Renamed')
+
+
+class StubServer:
+    """
+    Local HTTP/1.1 server for outbound-client tests.
+
+    `responses` is a list of (status, body) or (status, body, headers)
+    returned in turn (the last one repeats), or a function of the request
+    path returning one; every request records the client port it arrived on.
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses if callable(responses) else list(responses or [(200, {'ok': True})])
+        self.client_ports = []
+        self.paths = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                stub.client_ports.append(self.client_address[1])
+                stub.paths.append(self.path)
+                if callable(stub.responses):
+                    reply = stub.responses(self.path)
+                else:
+                    reply = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                status, data, *headers = reply
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                for name, value in (headers[0] if headers else {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HTTPClientTestCase(TestCase):
+    def test_connections_are_reused(self):
+        """Sequential calls to one host share a single keep-alive connection"""
+        session = http_client.build_session()
+        with StubServer() as stub:
+            for _ in range(5):
+                response = session.get(f'{stub.url}/search')
+                self.assertEqual(response.status_code, 200)
+            session.post(f'{stub.url}/token', data={'grant_type': 'client_credentials'})
+        self.assertEqual(len(stub.client_ports), 6)
+        self.assertEqual(len(set(stub.client_ports)), 1)
+
+    def test_retries_unavailable_upstream(self):
+        """GETs answered with 503 are retried before giving up"""
+        session = http_client.build_session(retries=2, backoff=0)
+        with StubServer([(503, {}), (503, {}), (200, {'ok': True})]) as stub:
+            response = session.get(f'{stub.url}/search')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stub.paths), 3)
+
+        with StubServer([(503, {}), (200, {'ok': True})]) as stub:
+            response = http_client.get(f'{stub.url}/search', retry=False)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(stub.paths), 1)
+
+
+@mock.patch.dict(os.environ, {'SPOTIFY_CLIENT_ID': 'id', 'SPOTIFY_CLIENT_SECRET': 'secret'})
+class SpotifyTokenTestCase(TestCase):
+    token = {'access_token': 'abc', 'token_type': 'Bearer', 'expires_in': 3600}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_token_fetched_once(self):
+        """Repeated and concurrent callers reuse one token request"""
+        with StubServer([(200, self.token)]) as stub:
+            manager = spotify.TokenManager(token_url=f'{stub.url}/api/token')
+            threads = [threading.Thread(target=manager.get_token) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(manager.get_access_token(), 'abc')
+        self.assertEqual(stub.paths, ['/api/token'])
+
+    def test_token_refreshed_before_expiry(self):
+        """A token inside the refresh margin is replaced"""
+        responses = [
+            (200, dict(self.token, expires_in=30)),
+            (200, dict(self.token, access_token='def')),
+        ]
+        with StubServer(responses) as stub:
+            manager = spotify.TokenManager(token_url=f'{stub.url}/api/token', margin=60, shared=False)
+            self.assertEqual(manager.get_access_token(), 'abc')
+            self.assertEqual(manager.get_access_token(), 'def')
+            self.assertEqual(manager.get_access_token(), 'def')
+        self.assertEqual(len(stub.paths), 2)
+
+    def test_token_shared_between_workers(self):
+        """A second process picks up the token from the shared cache"""
+        with StubServer([(200, self.token)]) as stub:
+            spotify.TokenManager(token_url=f'{stub.url}/api/token').get_token()
+            token = spotify.TokenManager(token_url=f'{stub.url}/api/token').get_token()
+        self.assertEqual(token['access_token'], 'abc')
+        self.assertEqual(len(stub.paths), 1)
+
+    def test_auth_failure(self):
+        """Rejected credentials surface Spotify's error details"""
+        with StubServer([(400, {'error': 'invalid_client'})]) as stub:
+            manager = spotify.TokenManager(token_url=f'{stub.url}/api/token')
+            with self.assertRaises(spotify.SpotifyAuthError) as raised:
+                manager.get_token()
+        self.assertEqual(raised.exception.details, {'error': 'invalid_client'})
+
+
+@mock.patch.dict(os.environ, {'SPOTIFY_CLIENT_ID': 'id', 'SPOTIFY_CLIENT_SECRET': 'secret'})
+@mock.patch('api.spotify.token_manager.aget_access_token', new=mock.AsyncMock(return_value='abc'))
+@mock.patch('api.spotify.token_manager.get_access_token', return_value='abc')
+class SpotifyPlaylistCacheTestCase(TestCase):
+    playlists = {'playlists': {'items': [{'id': '1', 'name': 'Heat Soundtrack'}]}}
+
+    def setUp(self):
+        cache.clear()
+        spotify.playlist_cache.clear_local()
+
+    def expire_cached(self, query):
+        key = spotify._playlist_key(query)
+        entry = spotify.playlist_cache.get(key)
+        spotify.playlist_cache.set(key, dict(entry, fresh_until=0))
+
+    def test_results_cached_by_normalized_query(self, _token):
+        """Equivalent queries are answered from one upstream search"""
+        with StubServer([(200, self.playlists)]) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            spotify.cached_search_playlists('Heat soundtrack')
+            data = spotify.cached_search_playlists('  heat   SOUNDTRACK')
+        self.assertEqual(data, self.playlists)
+        self.assertEqual(len(stub.paths), 1)
+
+    def test_rate_limit_serves_stale(self, _token):
+        """A 429 falls back to stale results and backs off for Retry-After"""
+        responses = [(200, self.playlists), (429, {}, {'Retry-After': '30'})]
+        with StubServer(responses) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            spotify.cached_search_playlists('Heat soundtrack')
+            self.expire_cached('Heat soundtrack')
+            self.assertEqual(spotify.cached_search_playlists('Heat soundtrack'), self.playlists)
+            self.assertEqual(spotify.cached_search_playlists('Heat soundtrack'), self.playlists)
+            with self.assertRaises(spotify.SpotifyRateLimited) as raised:
+                spotify.cached_search_playlists('Alien soundtrack')
+        self.assertEqual(len(stub.paths), 2)
+        self.assertGreater(raised.exception.retry_after, 0)
+
+    def test_rate_limit_http_date(self, _token):
+        """Retry-After may be an HTTP date instead of delta-seconds"""
+        until = format_datetime(datetime.now(dt_timezone.utc) + timedelta(seconds=30), usegmt=True)
+        with StubServer([(429, {}, {'Retry-After': until})]) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            with self.assertRaises(spotify.SpotifyRateLimited) as raised:
+                spotify.cached_search_playlists('Heat soundtrack')
+        self.assertTrue(25 <= raised.exception.retry_after <= 31)
+
+    def test_parse_retry_after(self, _token):
+        past = format_datetime(datetime.now(dt_timezone.utc) - timedelta(hours=1), usegmt=True)
+        self.assertEqual(spotify.parse_retry_after('30'), 30)
+        self.assertEqual(spotify.parse_retry_after(past), 1)
+        self.assertEqual(spotify.parse_retry_after('soon'), 1)
+        self.assertEqual(spotify.parse_retry_after(None), 1)
+
+    def test_view_reports_rate_limit(self, _token):
+        """Without cached results the view passes Retry-After on"""
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='listener', password='pass12345'))
+        with StubServer([(429, {}, {'Retry-After': '12'})]) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            response = client.get(reverse('spotify-search'), {'q': 'Heat soundtrack'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '12')
+
+    def test_sync_view_reports_rate_limit(self, _token):
+        request = APIRequestFactory().get('/api/spotify/search/', {'q': 'Heat soundtrack'})
+        force_authenticate(request, user=User.objects.create_user(username='listener', password='pass12345'))
+        with StubServer([(429, {}, {'Retry-After': '12'})]) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            response = views.SpotifySearchView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '12')
+
+    def test_warm_up_command(self, _token):
+        """warm_soundtracks prefetches the most popular movies"""
+        user = User.objects.create_user(username='viewer', password='pass12345')
+        Note.objects.create(title='t', content='c', author=user,
+                            movie=Movie.objects.create(imdb_id='tt0113277', title='Heat'))
+        with StubServer([(200, self.playlists)]) as stub, \
+                mock.patch('api.spotify.SPOTIFY_API_URL', stub.url):
+            call_command('warm_soundtracks', stdout=open(os.devnull, 'w'))
+            spotify.cached_search_playlists('Heat soundtrack')
+        self.assertEqual(len(stub.paths), 1)
+
+
+class NoteListQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+
+    def create_threads(self, count):
+        movie, _ = Movie.objects.get_or_create(imdb_id='tt0111161', defaults={'title': 'Shawshank'})
+        for i in range(count):
+            author = User.objects.create_user(username=f'author{Note.objects.count()}', password='pass12345')
+            if i % 2:
+                UserProfile.objects.create(user=author)
+            note = Note.objects.create(title=f'Thread {i}', content='c', author=author, movie=movie)
+            for j in range(3):
+                Note.objects.create(title='re', content=f'Reply {j}', author=author, parent=note)
+
+    @override_settings(THREAD_CACHE=False)
+    def test_note_list_query_count_is_constant(self):
+        """Listing threads costs the same number of queries for any page size"""
+        # The ETag validator counters, threads, their replies, then the
+        # authors api/authors.py doesn't have yet
+        self.create_threads(2)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('note-list'))
+        self.assertEqual(len(response.data), 2)
+
+        self.create_threads(8)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('note-list'))
+        self.assertEqual(len(response.data), 10)
+        self.assertTrue(all(note['reply_count'] == 3 for note in response.data))
+        self.assertTrue(all(len(note['replies']) == 3 for note in response.data))
+
+        with self.assertNumQueries(3):
+            self.client.get(reverse('note-list'), {'movie_imdb_id': 'tt0111161'})
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pager', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+
+    def collect(self, url, **params):
+        items, cursor = [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            items.extend(response.data['results'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                return items
+
+    def test_notes_pages_are_stable(self):
+        """Paging walks every thread once, newest first, ties broken by id"""
+        notes = [Note.objects.create(title=f'n{i}', content='c', author=self.user) for i in range(7)]
+        Note.objects.filter(pk__in=[notes[2].pk, notes[3].pk, notes[4].pk]).update(
+            created_at=notes[3].created_at
+        )
+
+        first = self.client.get(reverse('note-list'), {'limit': 3})
+        self.assertEqual(len(first.data['results']), 3)
+        # A thread posted mid-scroll must not shift the following pages
+        Note.objects.create(title='late', content='c', author=self.user)
+
+        seen = [note['id'] for note in first.data['results']]
+        cursor = first.data['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('note-list'), {'limit': 3, 'cursor': cursor})
+            seen.extend(note['id'] for note in response.data['results'])
+            cursor = response.data['next_cursor']
+        expected = sorted(
+            Note.objects.filter(pk__in=[note.pk for note in notes]),
+            key=lambda note: (note.created_at, note.pk), reverse=True
+        )
+        self.assertEqual(seen, [note.pk for note in expected])
+
+    def test_unpaginated_without_params(self):
+        """Clients that don't ask for a page still get a plain list"""
+        Note.objects.create(title='n', content='c', author=self.user)
+        response = self.client.get(reverse('note-list'))
+        self.assertIsInstance(response.data, list)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('note-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_replies_capped_with_more_cursor(self):
+        """Embedded replies are capped and the rest load from the replies endpoint"""
+        thread = Note.objects.create(title='t', content='c', author=self.user)
+        replies = [
+            Note.objects.create(title='re', content=f'r{i}', author=self.user, parent=thread)
+            for i in range(5)
+        ]
+        response = self.client.get(reverse('note-list'), {'limit': 10, 'replies': 2})
+        note = response.data['results'][0]
+        self.assertEqual(note['reply_count'], 5)
+        self.assertEqual([r['id'] for r in note['replies']], [replies[4].pk, replies[3].pk])
+
+        more = self.collect(reverse('note-replies', args=[thread.pk]), cursor=note['replies_next_cursor'], limit=2)
+        self.assertEqual([r['id'] for r in more], [replies[2].pk, replies[1].pk, replies[0].pk])
+
+    def test_watchlist_pages(self):
+        for i in range(5):
+            add_to_watchlist(self.user, f'tt{i}', title=f'm{i}')
+        items = self.collect(reverse('watchlist'), limit=2)
+        self.assertEqual([item['imdb_id'] for item in items], [f'tt{i}' for i in reversed(range(5))])
+
+
+class NoteActivityTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='poster', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        self.thread = Note.objects.create(title='Thread', content='c', author=self.user)
+
+    def reply(self, content):
+        response = self.client.post(reverse('note-list'), {
+            'title': 'Reply', 'content': content, 'parent': self.thread.id
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Note.objects.get(pk=response.data['id'])
+
+    def test_counters_follow_replies(self):
+        """Creating and deleting replies keeps reply_count and last_activity_at in sync"""
+        first = self.reply('first')
+        second = self.reply('second')
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 2)
+        self.assertEqual(self.thread.last_activity_at, second.created_at)
+
+        response = self.client.delete(reverse('note-delete', args=[second.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 1)
+        self.assertEqual(self.thread.last_activity_at, first.created_at)
+
+        self.client.delete(reverse('note-delete', args=[first.id]))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 0)
+        self.assertEqual(self.thread.last_activity_at, self.thread.created_at)
+
+    def test_sort_by_activity(self):
+        """?sort=activity lists the most recently replied-to thread first"""
+        newer = Note.objects.create(title='Newer', content='c', author=self.user)
+        self.reply('bump')
+        response = self.client.get(reverse('note-list'), {'sort': 'activity'})
+        self.assertEqual([note['id'] for note in response.data], [self.thread.id, newer.id])
+        response = self.client.get(reverse('note-list'), {'sort': 'activity', 'limit': 1})
+        self.assertEqual(response.data['results'][0]['id'], self.thread.id)
+
+    def test_refresh_command_repairs_drift(self):
+        """refresh_note_activity recomputes counters from the replies table"""
+        self.reply('one')
+        self.reply('two')
+        Note.objects.filter(pk=self.thread.pk).update(reply_count=7, last_activity_at=self.thread.created_at)
+        call_command('refresh_note_activity', batch_size=1, stdout=open(os.devnull, 'w'))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 2)
+        self.assertEqual(self.thread.last_activity_at, self.thread.replies.latest('created_at').created_at)
+
+
+def fake_omdb_route(path):
+    """StubServer route answering OMDb s= and i= lookups."""
+    if 's=' in path:
+        return 200, {'Search': [{'imdbID': f'tt{i:07d}'} for i in range(3)]}
+    imdb_id = path.split('i=')[1].split('&')[0]
+    return 200, {'imdbID': imdb_id, 'Title': f'Movie {imdb_id}', 'Year': '2000',
+                 'Poster': f'https://example.com/{imdb_id}.jpg', 'imdbRating': '7.0'}
+
+
+class AsyncUpstreamViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for tiered in (omdb.detail_cache, omdb.search_cache):
+            tiered.clear_local()
+        self.user = User.objects.create_user(username='async', password='pass12345')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_search_matches_sync_view(self):
+        """The async search view answers byte-for-byte like SearchOMDbView"""
+        with StubServer(fake_omdb_route) as stub, mock.patch('api.omdb.OMDB_URL', f'{stub.url}/'):
+            response = self.client.get(reverse('search-movies'), {'q': 'Alien'})
+            self.assertEqual(len(stub.paths), 4)
+
+            cache.clear()
+            omdb.search_cache.clear_local()
+            request = APIRequestFactory().get('/api/search/', {'q': 'Alien'})
+            force_authenticate(request, user=self.user)
+            sync_response = views.SearchOMDbView.as_view()(request)
+            sync_response.render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [movie['imdbID'] for movie in response.json()['Search']],
+            ['tt0000000', 'tt0000001', 'tt0000002']
+        )
+        self.assertEqual(response.content, sync_response.content)
+
+    def test_search_uses_async_cache_api(self):
+        """Cache lookups and writes on the event loop go through the async API"""
+        blocking = mock.Mock(side_effect=AssertionError('sync cache call on the event loop'))
+        with StubServer(fake_omdb_route) as stub, mock.patch('api.omdb.OMDB_URL', f'{stub.url}/'), \
+                mock.patch.multiple(TieredCache, get=blocking, get_many=blocking, set=blocking):
+            for _ in range(2):
+                response = self.client.get(reverse('search-movies'), {'q': 'Alien'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(stub.paths), 4)
+        self.assertEqual(omdb.search_cache.stats()['local_hits'], 1)
+
+    def test_wsgi_requests_close_their_client(self):
+        """Each WSGI request runs on a new event loop, so its client can't outlive it"""
+        clients = []
+        build = http_client.build_async_client
+
+        def tracked_build(*args, **kwargs):
+            clients.append(build(*args, **kwargs))
+            return clients[-1]
+
+        with StubServer(fake_omdb_route) as stub, mock.patch('api.omdb.OMDB_URL', f'{stub.url}/'), \
+                mock.patch.object(http_client, 'build_async_client', side_effect=tracked_build):
+            for query in ('Alien', 'Heat', 'Alien'):
+                self.client.get(reverse('search-movies'), {'q': query})
+        # The cache hit never opened one
+        self.assertEqual(len(clients), 2)
+        self.assertTrue(all(client.is_closed for client in clients))
+
+    def test_requires_authentication(self):
+        response = APIClient().get(reverse('search-movies'), {'q': 'Alien'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = client.get(reverse('spotify-search'), {'q': 'Alien'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @mock.patch.dict(os.environ, {'SPOTIFY_CLIENT_ID': 'id', 'SPOTIFY_CLIENT_SECRET': 'secret'})
+    def test_spotify_token(self):
+        """The async token view goes through the shared token manager"""
+        token = {'access_token': 'abc', 'token_type': 'Bearer', 'expires_in': 3600}
+        with StubServer([(200, token)]) as stub, \
+                mock.patch('api.spotify.token_manager', spotify.TokenManager(token_url=f'{stub.url}/api/token')):
+            first = self.client.get(reverse('spotify-token'))
+            second = self.client.get(reverse('spotify-token'))
+        self.assertEqual(first.json()['access_token'], 'abc')
+        self.assertEqual(second.json()['access_token'], 'abc')
+        self.assertEqual(len(stub.paths), 1)
+
+
+class AsyncUpstreamRefreshTestCase(TransactionTestCase):
+    """Refreshes run on the pool's own threads and database connections"""
+
+    def setUp(self):
+        cache.clear()
+        omdb.search_cache.clear_local()
+        self.user = User.objects.create_user(username='async', password='pass12345')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_wsgi_stale_entry_refreshed_off_the_request_loop(self):
+        """A refresh can't run on a loop that closes with the request"""
+        key = omdb._search_key('alien')
+        omdb.search_cache.set(key, {'results': [{'imdbID': 'old'}], 'fresh_until': 0})
+        refreshes = []
+        run_in_background = omdb._run_in_background
+
+        def tracked_run(*args):
+            refreshes.append(run_in_background(*args))
+            return refreshes[-1]
+
+        with StubServer(fake_omdb_route) as stub, mock.patch('api.omdb.OMDB_URL', f'{stub.url}/'), \
+                mock.patch.object(omdb, '_run_in_background', side_effect=tracked_run):
+            response = self.client.get(reverse('search-movies'), {'q': 'Alien'})
+            self.assertEqual(response.json()['Search'], [{'imdbID': 'old'}])
+            self.assertEqual(len(refreshes), 1)
+            refreshes[0].result(timeout=10)
+        self.assertEqual(len(omdb.search_cache.get(key)['results']), 3)
+
+
+class WatchlistImportExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        omdb.detail_cache.clear_local()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='importer', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        add_to_watchlist(self.user, 'tt0000001', title='Old', year='1990',
+                         poster='https://example.com/old.jpg', rating=3)
+
+    def item(self, imdb_id, **extra):
+        return dict({'imdb_id': imdb_id, 'title': f'Movie {imdb_id}', 'year': '2000',
+                     'poster': f'https://example.com/{imdb_id}.jpg'}, **extra)
+
+    def test_json_import_outcomes(self):
+        items = [self.item('tt0000002'), self.item('tt0000001'), self.item('tt0000002'),
+                 {'imdb_id': 'tt0000003', 'title': 'No poster or year'}]
+        with mock.patch('api.http_client.get', fake_omdb_get()):
+            response = self.client.post(reverse('watchlist-import'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'exists', 'duplicate', 'created']
+        )
+        # Missing fields are filled in from OMDb
+        self.assertEqual(WatchlistItem.objects.get(movie='tt0000003').movie.year, '2000')
+        self.assertEqual(WatchlistItem.objects.get(movie='tt0000001').movie.title, 'Old')
+
+    def test_invalid_items_reported_per_item(self):
+        items = [self.item('tt0000002'), {'title': 'No id'}, 'not an object']
+        response = self.client.post(reverse('watchlist-import'), items, format='json')
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid', 'invalid'])
+        self.assertIn('imdb_id', results[1]['errors'])
+        self.assertEqual(response.data['counts']['created'], 1)
+
+    def test_query_count_independent_of_batch_size(self):
+        def import_queries(ids):
+            items = [self.item(imdb_id) for imdb_id in ids]
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(reverse('watchlist-import'), items, format='json')
+            return len(queries)
+
+        small = import_queries([f'tt1{i:06d}' for i in range(3)])
+        # SQLite splits inserts into batches of ~999 parameters
+        large = import_queries([f'tt2{i:06d}' for i in range(60)])
+        self.assertEqual(small, large)
+        self.assertEqual(WatchlistItem.objects.filter(user=self.user).count(), 64)
+
+    def test_csv_import_with_imdb_columns(self):
+        body = ('﻿Position,Const,Title,Year,Your Rating,Description\n'
+                '1,tt0000005,Alien,1979,9,\n'
+                '2,tt0000001,Old,1990,8,\n')
+        with mock.patch('api.http_client.get', fake_omdb_get()):
+            response = self.client.post(reverse('watchlist-import') + '?on_conflict=update',
+                                        body, content_type='text/csv')
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'updated'])
+        # Looking up the poster put OMDb's record in the catalog, which wins
+        # over the titles in the file
+        alien = WatchlistItem.objects.get(movie='tt0000005')
+        self.assertEqual((alien.movie.title, alien.rating, alien.movie.poster),
+                         ('Movie tt0000005', 9, 'https://example.com/tt0000005.jpg'))
+        self.assertEqual(WatchlistItem.objects.get(movie='tt0000001').rating, 8)
+
+    def test_import_lookups_stay_off_the_search_pool(self):
+        """Imports look movies up on their own few workers"""
+        lock, running, peak, threads = threading.Lock(), [0], [0], set()
+
+        def fetch_detail(imdb_id, deadline=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                threads.add(threading.current_thread().name.split('_')[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return {'imdbID': imdb_id, 'Title': 'Looked up', 'Year': '2001',
+                    'Poster': f'https://example.com/{imdb_id}.jpg', 'imdbRating': 'N/A'}
+
+        with mock.patch('api.omdb.fetch_detail', fetch_detail):
+            response = self.client.post(reverse('watchlist-import'),
+                                        [{'imdb_id': f'tt3{i:06d}'} for i in range(20)], format='json')
+        self.assertEqual(response.data['counts']['created'], 20)
+        self.assertEqual(threads, {'omdb-import'})
+        self.assertLessEqual(peak[0], omdb.import_pool._max_workers)
+
+    def test_import_limit(self):
+        with mock.patch.object(views, 'WATCHLIST_IMPORT_MAX', 2):
+            response = self.client.post(reverse('watchlist-import'),
+                                        [self.item(f'tt{i}') for i in range(3)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_add_rejects_duplicate(self):
+        response = self.client.post(reverse('watchlist'), self.item('tt0000001'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Movie already in watchlist'})
+
+    def test_export_round_trip(self):
+        self.client.post(reverse('watchlist-import'), [self.item('tt0000002')], format='json')
+
+        response = self.client.get(reverse('watchlist-export'))
+        self.assertTrue(response.streaming)
+        exported = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([item['imdb_id'] for item in exported], ['tt0000002', 'tt0000001'])
+        self.assertEqual(exported, self.client.get(reverse('watchlist')).json())
+
+        response = self.client.get(reverse('watchlist-export'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        csv_body = b''.join(response.streaming_content).decode()
+        self.assertTrue(csv_body.startswith('id,imdb_id,title,'))
+
+        WatchlistItem.objects.filter(user=self.user).delete()
+        response = self.client.post(reverse('watchlist-import'), csv_body.encode(), content_type='text/csv')
+        self.assertEqual(response.data['counts']['created'], 2)
+
+
+class StreamingListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='streamer', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            thread = Note.objects.create(title=f't{i}', content='ünïcode', author=self.user)
+            Note.objects.create(title='re', content=f'r{i}', author=self.user, parent=thread)
+            add_to_watchlist(self.user, f'tt{i}', title=f'm{i}')
+
+    def test_streamed_array_matches_plain_response(self):
+        for name in ('note-list', 'watchlist'):
+            plain = self.client.get(reverse(name))
+            streamed = self.client.get(reverse(name), {'stream': 'true'})
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(b''.join(streamed.streaming_content), plain.content)
+
+    def test_ndjson_by_accept_header(self):
+        response = self.client.get(reverse('watchlist'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['imdb_id'] for line in lines],
+                         [f'tt{i}' for i in reversed(range(5))])
+
+        response = self.client.get(reverse('note-list'), {'format': 'ndjson', 'replies': 1})
+        threads = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([len(thread['replies']) for thread in threads], [1] * 5)
+
+    def test_rows_fetched_in_chunks(self):
+        """Threads come from one cursor; replies are prefetched per chunk"""
+        with mock.patch('api.streaming.STREAM_CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('note-list'), {'stream': 'true'})
+            threads = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(threads), 5)
+        self.assertEqual(len(queries), 1 + 1 + 3)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cond', password='pass12345')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.item = add_to_watchlist(self.user, 'tt1', title='m')
+        self.thread = Note.objects.create(title='t', content='c', author=self.user)
+        # The feed's ETag moves with the minute; hold it still unless a test
+        # advances it
+        self.now = timezone.now()
+        patcher = mock.patch('api.views.request_now', return_value=self.now)
+        self.feed_clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def revalidate(self, name, etag, **extra):
+        return self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag, **extra)
+
+    def test_not_modified_without_rendering(self):
+        for name in ('user-profile', 'watchlist', 'note-list'):
+            etag = self.client.get(reverse(name))['ETag']
+            # Only the validators run; nothing is serialized
+            with self.assertNumQueries(1):
+                response = self.revalidate(name, etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_watchlist_changes_invalidate(self):
+        etag = self.client.get(reverse('watchlist'))['ETag']
+        self.client.put(reverse('watchlist-detail', args=[self.item.pk]), {'watched': True}, format='json')
+        response = self.revalidate('watchlist', etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data[0]['watched'])
+
+        etag = response['ETag']
+        self.client.delete(reverse('watchlist-detail', args=[self.item.pk]))
+        self.assertEqual(self.revalidate('watchlist', etag).status_code, status.HTTP_200_OK)
+        # Deletions don't move a timestamp, so there is no Last-Modified
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_feed_changes_invalidate(self):
+        etag = self.client.get(reverse('note-list'))['ETag']
+        self.client.post(reverse('note-list'), {'title': 're', 'content': 'r', 'parent': self.thread.pk},
+                         format='json')
+        response = self.revalidate('note-list', etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['reply_count'], 1)
+
+        etag = response['ETag']
+        self.client.put(reverse('user-profile'), {'avatar': 'https://example.com/new.png'}, format='json')
+        response = self.revalidate('note-list', etag)
+        self.assertEqual(response.data[0]['author_avatar'], 'https://example.com/new.png')
+
+        changes = [
+            lambda: self.client.put(reverse('note-detail', args=[self.thread.pk]), {'title': 't', 'content': 'e'}),
+            lambda: self.client.delete(reverse('note-delete', args=[self.thread.replies.get().pk])),
+            lambda: self.client.delete(reverse('note-delete', args=[self.thread.pk])),
+        ]
+        for change in changes:
+            etag = self.client.get(reverse('note-list'))['ETag']
+            change()
+            self.assertEqual(self.revalidate('note-list', etag).status_code, status.HTTP_200_OK)
+
+    def test_feed_scoped_to_movie(self):
+        Movie.objects.create(imdb_id='tt2', title='Two')
+        Note.objects.create(title='m', content='c', author=self.user, movie_id='tt2')
+        url = reverse('note-list') + '?movie_imdb_id=tt2'
+        etag = self.client.get(url)['ETag']
+        # Threads about other movies leave this movie's feed alone
+        Note.objects.create(title='other', content='c', author=self.user, movie_id='tt1')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        # Moving a thread to the movie changes it, and moving it back again
+        for movie_id in ('tt2', 'tt1'):
+            self.client.put(reverse('note-detail', args=[self.thread.pk]),
+                            {'title': 't', 'content': 'c', 'movie_imdb_id': movie_id})
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, movie_id)
+            etag = response['ETag']
+        self.assertEqual(len(response.data), 1)
+
+    def test_feed_revalidates_as_time_ago_moves_on(self):
+        response = self.client.get(reverse('note-list'))
+        self.assertEqual(response.data[0]['time_ago'], 'just now')
+        later = self.now + timedelta(minutes=5)
+        self.feed_clock.return_value = later
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.revalidate('note-list', response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['time_ago'], '5m ago')
+
+        # Without server-rendered ages the body doesn't depend on the clock
+        with override_settings(SERVER_TIME_AGO=False):
+            etag = self.client.get(reverse('note-list'))['ETag']
+            self.feed_clock.return_value = later + timedelta(hours=1)
+            self.assertEqual(self.revalidate('note-list', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_representations_have_distinct_etags(self):
+        plain = self.client.get(reverse('watchlist'))
+        ndjson = self.client.get(reverse('watchlist'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertNotEqual(plain['ETag'], ndjson['ETag'])
+        self.assertEqual(self.revalidate('watchlist', plain['ETag'],
+                                         HTTP_ACCEPT='application/x-ndjson').status_code, status.HTTP_200_OK)
+
+    def test_profile_if_modified_since(self):
+        response = self.client.get(reverse('user-profile'))
+        last_modified = response['Last-Modified']
+        response = self.client.get(reverse('user-profile'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        UserProfile.objects.filter(user=self.user).update(
+            updated_at=self.user.profile.updated_at + timedelta(seconds=5)
+        )
+        response = self.client.get(reverse('user-profile'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class WatchlistCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        views.watchlist_cache.clear_local()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cached', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        self.items = [
+            add_to_watchlist(self.user, f'tt{i}', title=f'm{i}')
+            for i in range(3)
+        ]
+
+    def get(self, **params):
+        response = self.client.get(reverse('watchlist'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data if not params else response.data['results']
+
+    def assert_fresh(self):
+        """Both the full list and the first page match the database"""
+        expected = list(WatchlistItemSerializer(
+            WatchlistItem.objects.filter(user=self.user), many=True
+        ).data)
+        self.assertEqual(self.get(), expected)
+        self.assertEqual(self.get(limit=2), expected[:2])
+
+    def test_hit_skips_list_query(self):
+        self.get()
+        with self.assertNumQueries(1):
+            self.get()
+
+    def check_writes_never_stale(self):
+        item = self.items[0]
+
+        def edit_elsewhere():
+            # Another worker writing straight to the database
+            other = WatchlistItem.objects.get(pk=item.pk)
+            other.watched = True
+            other.save()
+
+        writes = [
+            lambda: self.client.post(reverse('watchlist'), {
+                'imdb_id': 'tt9', 'title': 'new', 'year': '2001', 'poster': 'https://example.com/n.jpg'
+            }, format='json'),
+            lambda: self.client.put(reverse('watchlist-detail', args=[item.pk]), {'rating': 4}, format='json'),
+            lambda: self.client.delete(reverse('watchlist-detail', args=[self.items[1].pk])),
+            lambda: self.client.post(reverse('watchlist-import'), [{
+                'imdb_id': 'tt10', 'title': 'bulk', 'year': '2002', 'poster': 'https://example.com/b.jpg'
+            }], format='json'),
+            edit_elsewhere,
+            lambda: WatchlistItem.objects.filter(pk=self.items[2].pk).delete(),
+        ]
+        for write in writes:
+            self.assert_fresh()
+            write()
+            self.assert_fresh()
+
+    def test_writes_never_stale_locmem(self):
+        self.check_writes_never_stale()
+
+    def test_writes_never_stale_shared_backend(self):
+        with tempfile.TemporaryDirectory() as path, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': path,
+        }}):
+            self.check_writes_never_stale()
+
+    def test_users_do_not_share_entries(self):
+        self.get()
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.get(), [])
+
+
+class MovieDiscussionStatsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username='alice', password='pass12345')
+        self.bob = User.objects.create_user(username='bob', password='pass12345')
+
+    def post(self, user, movie=None, parent=None):
+        self.client.force_authenticate(user=user)
+        data = {'title': 't', 'content': 'c'}
+        if movie:
+            data.update(movie_imdb_id=movie, movie_title=f'Movie {movie}')
+        if parent:
+            data['parent'] = parent
+        response = self.client.post(reverse('note-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def snapshot(self):
+        return list(MovieDiscussionStats.objects.order_by('pk').values())
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        MovieDiscussionStats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        return {row['movie_id']: row for row in incremental}
+
+    def test_counts_follow_creates_and_deletes(self):
+        first = self.post(self.alice, 'tt1')
+        reply = self.post(self.bob, parent=first)
+        self.post(self.alice, parent=first)
+        second = self.post(self.bob, 'tt1')
+        self.post(self.alice, 'tt2')
+        self.post(self.alice)  # No movie, not counted
+
+        stats = self.assert_matches_rebuild()
+        self.assertEqual(
+            [stats['tt1'][key] for key in ('thread_count', 'reply_count', 'author_count')], [2, 2, 2]
+        )
+        self.assertEqual(stats['tt1']['last_activity_at'], Note.objects.get(pk=second).last_activity_at)
+
+        self.client.force_authenticate(user=self.bob)
+        self.client.delete(reverse('note-delete', args=[reply]))
+        self.client.delete(reverse('note-delete', args=[second]))
+        stats = self.assert_matches_rebuild()
+        # Bob has nothing left on tt1
+        self.assertEqual(stats['tt1']['author_count'], 1)
+        self.assertEqual(stats['tt1']['reply_count'], 1)
+
+        # Deleting a thread takes its replies; the last one drops the row
+        self.client.force_authenticate(user=self.alice)
+        self.client.delete(reverse('note-delete', args=[first]))
+        stats = self.assert_matches_rebuild()
+        self.assertNotIn('tt1', stats)
+        self.assertFalse(MovieDiscussionAuthor.objects.filter(movie_imdb_id='tt1').exists())
+
+    def test_counts_follow_thread_to_new_movie(self):
+        thread = self.post(self.alice, 'tt1')
+        self.post(self.bob, parent=thread)
+        self.post(self.bob, 'tt2')
+
+        def move(movie):
+            self.client.force_authenticate(user=self.alice)
+            response = self.client.put(reverse('note-detail', args=[thread]), {
+                'title': 't', 'content': 'moved', 'movie_imdb_id': movie, 'movie_title': f'Movie {movie}'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return self.assert_matches_rebuild()
+
+        stats = move('tt2')
+        self.assertNotIn('tt1', stats)
+        self.assertFalse(MovieDiscussionAuthor.objects.filter(movie_imdb_id='tt1').exists())
+        self.assertEqual(
+            [stats['tt2'][key] for key in ('thread_count', 'reply_count', 'author_count')], [2, 1, 2]
+        )
+        # Into a movie nobody has discussed yet, and an edit that keeps it
+        stats = move('tt3')
+        self.assertEqual(
+            [stats['tt3'][key] for key in ('thread_count', 'reply_count', 'author_count')], [1, 1, 2]
+        )
+        self.assertEqual(stats['tt2']['author_count'], 1)
+        self.assertEqual(move('tt3'), stats)
+
+    def test_trending(self):
+        self.post(self.alice, 'tt1')
+        self.post(self.alice, 'tt1')
+        self.post(self.bob, 'tt2')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies-trending'))
+        self.assertEqual([movie['movie_imdb_id'] for movie in response.data], ['tt2', 'tt1'])
+
+        response = self.client.get(reverse('movies-trending'), {'sort': 'threads', 'limit': 1})
+        self.assertEqual(response.data, [dict(response.data[0], movie_imdb_id='tt1', thread_count=2)])
+
+    def test_movie_discussion(self):
+        self.post(self.alice, 'tt1')
+        response = self.client.get(reverse('movie-discussion', args=['tt1']))
+        self.assertEqual(response.data['thread_count'], 1)
+        response = self.client.get(reverse('movie-discussion', args=['tt404']))
+        self.assertEqual(response.data['thread_count'], 0)
+
+
+class LocalSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        for imdb_id, title in [('tt1', 'The Matrix'), ('tt2', 'The Matrix Reloaded'),
+                               ('tt3', 'Matrimony'), ('tt4', 'Alien')]:
+            Movie.objects.create(imdb_id=imdb_id, title=title)
+
+    def titles(self, text):
+        return [movie.title for movie in search.search_movies(text)]
+
+    def test_prefixes_of_every_word(self):
+        self.assertEqual(set(self.titles('matr')), {'The Matrix', 'The Matrix Reloaded', 'Matrimony'})
+        self.assertEqual(self.titles('matrix rel'), ['The Matrix Reloaded'])
+        self.assertEqual(self.titles('RELOADED the'), ['The Matrix Reloaded'])
+        self.assertEqual(self.titles('"; DROP'), [])
+        self.assertEqual(self.titles('  '), [])
+
+    def test_exact_title_first(self):
+        self.assertEqual(self.titles('the matrix')[0], 'The Matrix')
+        self.assertEqual(self.titles('matrimony'), ['Matrimony'])
+
+    def test_index_follows_updates_and_deletes(self):
+        Movie.objects.filter(pk='tt4').update(title='Aliens')
+        self.assertEqual(self.titles('aliens'), ['Aliens'])
+        Movie.objects.filter(pk='tt4').delete()
+        self.assertEqual(self.titles('alien'), [])
+
+        note = Note.objects.create(title='Thoughts', content='loved the ending', author=self.user)
+        self.assertEqual(search.search_notes('ending'), [note])
+        note.content = 'hated the ending'
+        note.save()
+        self.assertEqual(search.search_notes('lov'), [])
+        self.assertEqual(search.search_notes('hat'), [note])
+        note.delete()
+        self.assertEqual(search.search_notes('hat'), [])
+
+    def test_titles_rank_above_content(self):
+        in_content = Note.objects.create(title='Weekend', content='finally watched heat', author=self.user)
+        in_title = Note.objects.create(title='Heat', content='a classic', author=self.user)
+        self.assertEqual(search.search_notes('heat'), [in_title, in_content])
+
+    def test_endpoint(self):
+        note = Note.objects.create(title='Matrix night', content='red pill', author=self.user,
+                                   movie=Movie.objects.get(pk='tt1'))
+        response = self.client.get(reverse('search-local'), {'q': 'matrix'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['movies'][0], Movie.objects.get(pk='tt1').as_search_result())
+        self.assertEqual(response.data['notes'], [{
+            'id': note.id, 'title': 'Matrix night', 'content': 'red pill',
+            'created_at': response.data['notes'][0]['created_at'], 'author_username': 'searcher',
+            'parent': None, 'movie_imdb_id': 'tt1', 'movie_title': 'The Matrix',
+        }])
+
+        response = self.client.get(reverse('search-local'), {'q': 'matrix', 'type': 'movies', 'limit': 1})
+        self.assertEqual(list(response.data), ['movies'])
+        self.assertEqual(len(response.data['movies']), 1)
+        response = self.client.get(reverse('search-local'), {'q': 'matrix', 'type': 'people'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_triggers_restored_after_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER api_movie_fts_insert')
+        search.ensure_installed(sender=None, using='default')
+        Movie.objects.create(imdb_id='tt5', title='Heat')
+        self.assertEqual(self.titles('heat'), ['Heat'])
+        # Rebuilding kept the existing rows indexed
+        self.assertEqual(self.titles('alien'), ['Alien'])
+
+
+class SearchMigrationTestCase(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state(target).apps
+
+    def test_writes_work_after_reversing_search_indexes(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('api')[0]
+        apps = self.migrate(('api', '0013_movie_catalog'))
+        try:
+            author = apps.get_model('auth', 'User').objects.create(username='reverted')
+            movie = apps.get_model('api', 'Movie').objects.create(imdb_id='tt5', title='Heat')
+            apps.get_model('api', 'Note').objects.create(title='Heat', content='c', author=author, movie=movie)
+            apps.get_model('api', 'Movie').objects.filter(pk='tt5').update(title='Heat (1995)')
+        finally:
+            self.migrate(latest)
+        self.assertEqual([movie.title for movie in search.search_movies('heat')], ['Heat (1995)'])
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        for metric in metrics.REGISTRY:
+            metric.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='measured', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        Note.objects.create(title='t', content='c', author=self.user)
+
+    def test_sampled_request_timed_by_phase(self):
+        with mock.patch.object(metrics, 'METRICS_SAMPLE_RATE', 1):
+            response = self.client.get(reverse('note-list'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(header, r'serializer;dur=[\d.]+')
+        self.assertRegex(header, r'total;dur=[\d.]+$')
+        self.assertEqual(metrics.requests_total.value('GET', 'api/notes/', '200'), 1)
+        self.assertEqual(metrics.phase_duration.count('api/notes/', 'db'), 1)
+        self.assertEqual(metrics.db_queries.count('api/notes/'), 1)
+
+    def test_unsampled_request_only_counted(self):
+        with mock.patch.object(metrics, 'METRICS_SAMPLE_RATE', 0):
+            response = self.client.get(reverse('note-detail', args=[1234]))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.requests_total.value('GET', 'api/notes/<int:pk>/', '404'), 1)
+        self.assertEqual(metrics.request_duration.count('GET', 'api/notes/<int:pk>/'), 1)
+        self.assertEqual(metrics.db_queries.count('api/notes/<int:pk>/'), 0)
+
+    def test_phases_count_overlapping_calls_once(self):
+        timings, token = metrics.start_request(sample_rate=1)
+        try:
+            fake_session = mock.Mock()
+            fake_session.get.side_effect = lambda *args, **kwargs: time.sleep(0.02)
+            with mock.patch.object(http_client, 'session', fake_session), metrics.phase('http'):
+                http_client.get('https://example.com')
+        finally:
+            metrics.end_request(token)
+        self.assertGreaterEqual(timings.durations()['http'], 0.02)
+        self.assertLess(timings.durations()['http'], 0.04)
+        self.assertIsNone(metrics.current())
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('note-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE flicks_http_request_duration_seconds histogram', body)
+        self.assertIn('flicks_http_requests_total{method="GET",route="api/notes/",status="200"} 1', body)
+        self.assertIn('flicks_http_request_duration_seconds_bucket{method="GET",route="api/notes/",le="+Inf"} 1',
+                      body)
+
+        client = APIClient()
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 'scrape-secret'):
+            self.assertEqual(client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RowSerializerTestCase(TestCase):
+    """The values_list() serializers render byte for byte like the DRF ones"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='rows', password='pass12345')
+        UserProfile.objects.create(user=self.user, avatar='https://example.com/a.png')
+        # No profile: falls back to the initials avatar
+        self.other = User.objects.create_user(username='no-profile', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+
+        movie = Movie.objects.create(imdb_id='tt1', title='Amélie \u2028 "quoted"')
+        Movie.objects.create(imdb_id='tt2', title='')
+        self.threads = []
+        for i in range(5):
+            thread = Note.objects.create(title=f'Thread {i}', content='line\nbreak\ttab \x00 ✓',
+                                         author=self.user if i % 2 else self.other,
+                                         movie=movie if i % 3 == 0 else None)
+            for j in range(i):
+                Note.objects.create(title='Reply', content=f'reply {j}', author=self.other if j % 2 else self.user,
+                                    parent=thread)
+            self.threads.append(thread)
+        self.threads[1].content = 'edited'
+        self.threads[1].save()
+        Note.objects.create(title='On tt2', content='c', author=self.user, movie_id='tt2')
+
+        add_to_watchlist(self.user, 'tt1', title='ignored')
+        add_to_watchlist(self.user, 'tt3', title='Third', rating=4, notes='good', watched=True)
+        WatchlistItem.objects.create(user=self.user, movie=Movie.objects.create(imdb_id='tt4', title='Unrated'))
+
+    def both(self, name, args=(), **params):
+        """Response bodies from the DRF serializers and from api.rows, clock frozen."""
+        headers = {key: params.pop(key) for key in list(params) if key.startswith('HTTP_')}
+        bodies = []
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            for fast in (False, True):
+                cache.clear()
+                views.watchlist_cache.clear_local()
+                fragments.thread_cache.clear_local()
+                with override_settings(FAST_LIST_SERIALIZERS=fast):
+                    response = self.client.get(reverse(name, args=args), params, **headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                bodies.append(body)
+        return bodies
+
+    def test_note_feed(self):
+        cursor = self.client.get(reverse('note-list'), {'limit': 2}).data['next_cursor']
+        for params in ({}, {'limit': 2}, {'limit': 2, 'cursor': cursor}, {'replies': 0}, {'replies': 2},
+                       {'limit': 3, 'replies': 1}, {'sort': 'activity', 'limit': 4, 'replies': 3},
+                       {'movie_imdb_id': 'tt1'}, {'stream': 'true'}, {'stream': 'true', 'replies': 1},
+                       {'HTTP_ACCEPT': 'application/x-ndjson'}):
+            drf, rows = self.both('note-list', **params)
+            self.assertEqual(drf, rows, params)
+
+    def test_replies(self):
+        drf, rows = self.both('note-replies', args=[self.threads[4].id], limit=3)
+        self.assertEqual(drf, rows)
+        cursor = json.loads(rows)['next_cursor']
+        self.assertEqual(*self.both('note-replies', args=[self.threads[4].id], limit=3, cursor=cursor))
+
+    def test_watchlist(self):
+        for params in ({}, {'limit': 2}, {'stream': 'true'}, {'HTTP_ACCEPT': 'application/x-ndjson'}):
+            drf, rows = self.both('watchlist', **params)
+            self.assertEqual(drf, rows, params)
+
+    def test_renderer_matches_json_renderer(self):
+        """FastJSONRenderer writes the same bytes as the JSONRenderer it replaces"""
+        now = timezone.now()
+        payloads = [
+            {'text': 'Amélie ✓ 日本語 😀', 'separators': 'a\u2028b\u2029c',
+             'controls': 'line\nbreak\ttab \x00 "q" \\', 'html': '<script>&</script>', 'empty': '', 'none': None,
+             'flags': [True, False], 'ints': [0, -1, 2 ** 53, 2 ** 63 - 1], 'nested': {'list': [{}, []]}, 1: 'int key'},
+            {'aware': now, 'microseconds': now.replace(microsecond=0), 'naive': datetime(2024, 2, 29, 23, 59, 59, 1),
+             'date': date(2024, 2, 29), 'time': dt_time(12, 30, 15, 500), 'duration': timedelta(days=1, seconds=5),
+             'decimal': Decimal('7.5'), 'whole_decimal': Decimal('10'), 'uuid': uuid.UUID(int=1)},
+            [], {}, 'just a string',
+        ]
+        for fast in (False, True):
+            with override_settings(FAST_LIST_SERIALIZERS=fast), \
+                    mock.patch('django.utils.timezone.now', return_value=now):
+                payloads.append(self.client.get(reverse('note-list'), {'replies': 2}).data)
+                payloads.append(self.client.get(reverse('watchlist')).data)
+        for payload in payloads:
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload), payload)
+
+    def test_fields_follow_serializers(self):
+        for rows, serializer in ((NoteRows(), NoteSerializer), (NoteReplyRows(), NoteReplySerializer),
+                                 (WatchlistItemRows(), WatchlistItemSerializer)):
+            data = rows.serialize(rows.rows(serializer.Meta.model.objects.all()))
+            self.assertEqual(list(data[0]), serializer.Meta.fields)
+
+    def test_one_clock_read_per_request(self):
+        # Every clock read is an hour later than the one before it
+        start = timezone.now() + timedelta(hours=2)
+        clock = (start + timedelta(hours=i) for i in range(1000))
+        for fast in (False, True):
+            with override_settings(FAST_LIST_SERIALIZERS=fast), \
+                    mock.patch('django.utils.timezone.now', side_effect=lambda: next(clock)):
+                notes = self.client.get(reverse('note-list')).json()
+            ages = {note['time_ago'] for note in notes} | {reply['time_ago'] for note in notes
+                                                            for reply in note['replies']}
+            self.assertEqual(len(ages), 1, ages)
+
+    def test_client_time_ago(self):
+        with override_settings(SERVER_TIME_AGO=False):
+            drf, rows = self.both('note-list', replies=2)
+            self.assertEqual(drf, rows)
+            with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=3)):
+                later = self.client.get(reverse('note-list'), {'replies': 2}).content
+        self.assertEqual(later, rows)
+        notes = json.loads(rows)
+        self.assertEqual({note['time_ago'] for note in notes} | {reply['time_ago'] for note in notes
+                                                                   for reply in note['replies']}, {None})
+
+
+class ThreadFragmentCacheTestCase(TestCase):
+    """Feed threads come from api/fragments.py until something they show changes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        UserProfile.objects.create(user=self.user, avatar='https://example.com/reader.png')
+        self.other = User.objects.create_user(username='replier', password='pass12345')
+        UserProfile.objects.create(user=self.other, avatar='https://example.com/replier.png')
+        self.client.force_authenticate(user=self.user)
+        Movie.objects.create(imdb_id='tt1', title='Old title')
+        self.threads = []
+        for i in range(3):
+            thread = Note.objects.create(title=f'Thread {i}', content='c', author=self.user,
+                                         movie_id='tt1' if i == 0 else None)
+            for j in range(2):
+                Note.objects.create(title='re', content=f'Reply {j}', author=self.other if i == 1 else self.user,
+                                    parent=thread)
+            self.threads.append(thread)
+        cache.clear()
+        fragments.thread_cache.clear_local()
+        fragments.thread_cache.reset_stats()
+
+    def feed(self, **params):
+        return self.client.get(reverse('note-list'), params).content
+
+    def assertFresh(self, **params):
+        """The cached feed matches one rendered from scratch, in both serializer modes."""
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            for fast in (False, True):
+                with override_settings(FAST_LIST_SERIALIZERS=fast):
+                    cached = self.feed(**params)
+                    with override_settings(THREAD_CACHE=False):
+                        self.assertEqual(cached, self.feed(**params), (fast, params))
+
+    def test_unchanged_threads_are_not_rendered_again(self):
+        for fast in (False, True):
+            fragments.thread_cache.clear_local()
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZERS=fast):
+                with CaptureQueriesContext(connection) as first:
+                    body = self.feed(replies=1)
+                # Threads only; neither their replies nor authors are loaded again
+                with self.assertNumQueries(len(first) - 2):
+                    self.assertEqual(self.feed(replies=1), body)
+        self.assertEqual(fragments.thread_cache.stats()['local_hits'], 6)
+
+    def test_keyed_by_replies_limit_and_page(self):
+        self.feed()
+        self.assertFresh(replies=1)
+        self.assertFresh(limit=2, replies=0)
+        self.assertFresh()
+
+    def replier_changes_avatar(self):
+        # Only replies on threads[1] are by this user
+        self.client.force_authenticate(user=self.other)
+        self.client.put(reverse('user-profile'), {'avatar': 'https://example.com/x.png'}, format='json')
+        self.client.force_authenticate(user=self.user)
+
+    def test_changes_show_up(self):
+        thread, replied = self.threads[0], self.threads[1]
+        changes = [
+            lambda: self.client.put(reverse('note-detail', args=[thread.id]), {'title': 'T', 'content': 'edited'}),
+            lambda: self.client.put(reverse('note-detail', args=[thread.replies.first().id]),
+                                    {'title': 're', 'content': 'edited reply'}),
+            lambda: self.client.post(reverse('note-list'), {'title': 're', 'content': 'new', 'parent': thread.id}),
+            lambda: self.client.delete(reverse('note-delete', args=[thread.replies.first().id])),
+            lambda: self.client.put(reverse('user-profile'), {'avatar': 'https://example.com/new.png'},
+                                    format='json'),
+            self.replier_changes_avatar,
+            lambda: catalog.store([{'imdbID': 'tt1', 'Title': 'New title', 'Year': '2001', 'Poster': 'N/A'}]),
+        ]
+        for change in changes:
+            self.feed()
+            self.feed(replies=1)
+            change()
+            self.assertFresh()
+            self.assertFresh(replies=1)
+        self.assertNotIn(b'Old title', self.feed())
+        self.assertIn(b'x.png', self.client.get(reverse('note-replies', args=[replied.id]), {'limit': 5}).content)
+
+    def test_reused_id(self):
+        newest = Note.objects.create(title='No replies', content='old', author=self.user)
+        self.feed()
+        newest_id = newest.id
+        newest.delete()
+        # Same id and version, as after a database reset under a shared cache
+        Note.objects.bulk_create([Note(id=newest_id, title='No replies either', content='new', author=self.user)])
+        self.assertFresh()
+
+    def test_time_ago_on_hits(self):
+        self.feed()
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=3)):
+            notes = json.loads(self.feed())
+        self.assertEqual({note['time_ago'] for note in notes}, {'3d ago'})
+        self.assertEqual({reply['time_ago'] for note in notes for reply in note['replies']}, {'3d ago'})
+        self.assertFresh()
+
+    def test_restamp_z_suffix(self):
+        # Both serializer modes cache created_at as '...Z', which
+        # datetime.fromisoformat() rejects before Python 3.11
+        for fast in (False, True):
+            fragments.thread_cache.clear_local()
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZERS=fast):
+                self.feed(replies=1)
+                cached = fragments.thread_cache.get_many(
+                    [fragments.fragment_key(thread, 1) for thread in Note.objects.filter(parent=None)])
+                self.assertTrue(cached)
+                for data in cached.values():
+                    self.assertTrue(data['created_at'].endswith('Z'), data['created_at'])
+                    now = timezone.now() + timedelta(hours=2)
+                    restamped = fragments.restamp(data, now)
+                    self.assertEqual(restamped['time_ago'], '2h ago')
+                    self.assertEqual({reply['time_ago'] for reply in restamped['replies']}, {'2h ago'})
+                hits = fragments.thread_cache.stats()['local_hits']
+                self.assertEqual(self.client.get(reverse('note-list'), {'replies': 1}).status_code, 200)
+                self.assertGreater(fragments.thread_cache.stats()['local_hits'], hits)
+
+
+class AuthorCacheTestCase(TestCase):
+    """api/authors.py: names and avatars by author id, per request and shared"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='writer', password='pass12345')
+        UserProfile.objects.create(user=self.user, avatar='https://example.com/writer.png')
+        self.other = User.objects.create_user(username='no-profile', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        for i in range(4):
+            thread = Note.objects.create(title=f'Thread {i}', content='c', author=self.user)
+            Note.objects.create(title='re', content='r', author=self.other, parent=thread)
+
+    def test_load(self):
+        request = APIRequestFactory().get('/')
+        with self.assertNumQueries(1):
+            users = authors.load(request, [self.user.pk, self.other.pk])
+        self.assertEqual(users[self.user.pk], ('writer', 'https://example.com/writer.png'))
+        self.assertEqual(users[self.other.pk], ('no-profile', default_avatar('no-profile')))
+        # Same request: no cache round trip either
+        with self.assertNumQueries(0), mock.patch.object(authors.cache, 'get_many') as get_many:
+            authors.load(request, [self.user.pk])
+        get_many.assert_not_called()
+        # Another request: from the shared cache
+        with self.assertNumQueries(0):
+            self.assertEqual(authors.load(None, [self.other.pk])[self.other.pk][0], 'no-profile')
+
+    @override_settings(THREAD_CACHE=False)
+    def test_one_query_per_page(self):
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZERS=fast):
+                with CaptureQueriesContext(connection) as cold:
+                    self.client.get(reverse('note-list'))
+                with self.assertNumQueries(len(cold) - 1):
+                    self.client.get(reverse('note-list'))
+            self.assertEqual(len([query for query in cold.captured_queries
+                                  if 'auth_user' in query['sql'] and 'api_note' not in query['sql']]), 1, fast)
+
+    def test_avatar_change(self):
+        self.client.get(reverse('note-list'))
+        self.client.put(reverse('user-profile'), {'avatar': 'https://example.com/new.png'}, format='json')
+        for fast in (False, True):
+            with override_settings(FAST_LIST_SERIALIZERS=fast):
+                notes = self.client.get(reverse('note-list')).data
+            self.assertEqual({note['author_avatar'] for note in notes}, {'https://example.com/new.png'})
+
+    def test_new_user(self):
+        user_id = User.objects.latest('id').id + 1
+        cache.set(authors.make_key(user_id), ('someone-else', 'https://example.com/old.png'))
+        response = self.client.post(reverse('create-user'), {'username': 'newcomer', 'password': 'pass12345'})
+        self.assertEqual(response.data['id'], user_id)
+        self.assertEqual(authors.load(None, [user_id])[user_id][0], 'newcomer')
+
+
+class ReplyTreeTestCase(TestCase):
+    """/api/notes/<id>/tree/: nested replies of any depth in one query"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='nester', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        self.root = Note.objects.create(title='Root', content='root', author=self.user)
+        # root -> a, b, c; a -> a1, a2; a1 -> a1x -> a1xx
+        self.notes = {}
+        for name, parent in (('a', 'root'), ('b', 'root'), ('c', 'root'), ('a1', 'a'), ('a2', 'a'),
+                             ('a1x', 'a1'), ('a1xx', 'a1x')):
+            parent = self.root if parent == 'root' else self.notes[parent]
+            self.notes[name] = Note.objects.create(title='re', content=name, author=self.user, parent=parent)
+
+    def tree(self, note=None, **params):
+        response = self.client.get(reverse('note-tree', args=[(note or self.root).id]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def shape(self, node):
+        return {node['content']: [self.shape(reply) for reply in node['replies']]}
+
+    def size(self, node):
+        return 1 + sum(self.size(reply) for reply in node['replies'])
+
+    def test_whole_tree(self):
+        data = self.tree()
+        self.assertFalse(data['truncated'])
+        # Newest first at every level
+        self.assertEqual(self.shape(data['note']), {'root': [
+            {'c': []}, {'b': []}, {'a': [{'a2': []}, {'a1': [{'a1x': [{'a1xx': []}]}]}]},
+        ]})
+        a = data['note']['replies'][2]
+        self.assertEqual((a['parent'], a['reply_count']), (self.root.id, 2))
+        self.assertEqual(set(a), set(NoteReplySerializer.Meta.fields) | {'parent', 'reply_count', 'replies'})
+        self.assertEqual(self.shape(self.tree(self.notes['a1'])['note']), {'a1': [{'a1x': [{'a1xx': []}]}]})
+
+    def test_one_query_at_any_size(self):
+        self.tree()
+        with self.assertNumQueries(1):
+            self.tree()
+        parent = self.notes['a1xx']
+        for i in range(15):
+            parent = Note.objects.create(title='re', content=f'deep {i}', author=self.user, parent=parent)
+            for j in range(3):
+                Note.objects.create(title='re', content=f'leaf {i}.{j}', author=self.user, parent=parent)
+        with self.assertNumQueries(1):
+            data = self.tree()
+        self.assertFalse(data['truncated'])
+        self.assertEqual(self.size(data['note']), 8 + 15 * 4)
+
+    def test_depth_limit(self):
+        data = self.tree(depth=1)
+        self.assertTrue(data['truncated'])
+        self.assertEqual(self.shape(data['note']), {'root': [{'c': []}, {'b': []}, {'a': []}]})
+        self.assertEqual(data['note']['replies'][2]['reply_count'], 2)
+        self.assertEqual(self.shape(self.tree(depth=0)['note']), {'root': []})
+        self.assertFalse(self.tree(depth=4)['truncated'])
+
+    def test_size_limit(self):
+        # Breadth first, so the deepest replies go first, then the oldest
+        data = self.tree(limit=4)
+        self.assertTrue(data['truncated'])
+        self.assertEqual(self.shape(data['note']), {'root': [{'c': []}, {'b': []}, {'a': [{'a2': []}]}]})
+        self.assertFalse(self.tree(limit=7)['truncated'])
+
+    def test_errors(self):
+        response = self.client.get(reverse('note-tree', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('note-tree', args=[self.root.id]), {'depth': 'deep'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.tree(depth=10 ** 6, limit=10 ** 6)['truncated'])
@@ -0,0 +1,75 @@
+"""
+Reply trees of any depth in one query.
+
+Note.parent lets replies nest without limit, but the feed and
+NoteReplyList only go one level down, and walking further that way costs a
+query per level or per note. load() finds a note's descendants with a
+recursive CTE (SQLite and Postgres both have WITH RECURSIVE) and fetches
+them in the same query. Replies are taken breadth first, newest first
+within a level, so the depth and size limits drop the deepest and then the
+oldest replies and never keep a reply without its parent.
+"""
+import os
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import authors, metrics
+from .models import Note
+from .rows import NoteReplyRows, rendered_at
+from .serializers import request_now
+
+# Upper bounds for ?depth= and ?limit= on /api/notes/<id>/tree/
+REPLY_TREE_MAX_DEPTH = int(os.getenv('REPLY_TREE_MAX_DEPTH', 20))
+REPLY_TREE_MAX_NODES = int(os.getenv('REPLY_TREE_MAX_NODES', 2000))
+
+# Walks api_note's (parent, created_at) index one level per step
+DESCENDANTS_SQL = """
+    WITH RECURSIVE tree (id, depth, created_at) AS (
+        SELECT id, 0, created_at FROM api_note WHERE id = %s
+        UNION ALL
+        SELECT reply.id, tree.depth + 1, reply.created_at
+        FROM api_note reply JOIN tree ON reply.parent_id = tree.id
+        WHERE tree.depth < %s
+    )
+    SELECT id FROM tree WHERE depth > 0 ORDER BY depth, created_at DESC, id DESC LIMIT %s
+"""
+
+
+def load(note_id, max_depth, max_nodes):
+    """
+    `note_id` and up to `max_nodes` replies at most `max_depth` levels
+    below it, as (parent_id, reply_count, *NoteReplyRows.columns) rows,
+    newest first. Empty if the note doesn't exist.
+    """
+    descendants = RawSQL(DESCENDANTS_SQL, (note_id, max_depth, max_nodes))
+    return list(
+        Note.objects.filter(Q(pk=note_id) | Q(pk__in=descendants))
+        .order_by('-created_at', '-id')
+        .values_list('parent_id', 'reply_count', *NoteReplyRows.columns)
+    )
+
+
+def render(rows, note_id, request=None):
+    """
+    load() rows as nested NoteReplySerializer dicts, each with its parent,
+    its reply_count and the replies that were loaded, and whether the limits
+    left any out (a reply_count above the number of replies shows where).
+    Returns (None, False) for no rows.
+    """
+    with metrics.phase('serializer'):
+        reply_rows = NoteReplyRows(request)
+        tz = timezone.get_current_timezone()
+        now = rendered_at(None if request is None else request_now(request))
+        # Row layout: parent_id, reply_count, then NoteReplyRows.columns
+        users = authors.load(request, {row[6] for row in rows})
+        nodes, children = {}, {}
+        for parent_id, reply_count, *row in rows:
+            node = reply_rows.row(row, tz, now, users)
+            node.update(parent=parent_id, reply_count=reply_count, replies=children.setdefault(row[0], []))
+            nodes[row[0]] = node
+            if row[0] != note_id:
+                children.setdefault(parent_id, []).append(node)
+        truncated = any(node['reply_count'] > len(node['replies']) for node in nodes.values())
+        return nodes.get(note_id), truncated
@@ -1,15 +1,34 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_UPSTREAM_VIEWS:
+    search_view = views.search_omdb_async
+    spotify_token_view = views.spotify_token_async
+    spotify_search_view = views.spotify_search_async
+else:
+    search_view = views.SearchOMDbView.as_view()
+    spotify_token_view = views.SpotifyTokenView.as_view()
+    spotify_search_view = views.SpotifySearchView.as_view()
+
 urlpatterns = [
     path("notes/", views.NoteListCreate.as_view(), name="note-list"),
     path("notes/<int:pk>/", views.NoteDetail.as_view(), name="note-detail"),
+    path("notes/<int:pk>/replies/", views.NoteReplyList.as_view(), name="note-replies"),
+    path("notes/<int:pk>/tree/", views.NoteTreeView.as_view(), name="note-tree"),
     path("notes/delete/<int:pk>/", views.NoteDelete.as_view(), name="note-delete"),
+    path("movies/trending/", views.TrendingMoviesView.as_view(), name="movies-trending"),
+    path("movies/<str:imdb_id>/discussion/", views.MovieDiscussionView.as_view(), name="movie-discussion"),
     path("users/create/", views.CreateUserView.as_view(), name="create-user"),
     path("profile/", views.UserProfileView.as_view(), name="user-profile"),
-    path("search/", views.SearchOMDbView.as_view(), name="search-movies"),
-    path("spotify/token/", views.SpotifyTokenView.as_view(), name="spotify-token"),
-    path("spotify/search/", views.SpotifySearchView.as_view(), name="spotify-search"),
+    path("search/", search_view, name="search-movies"),
+    path("search/local/", views.LocalSearchView.as_view(), name="search-local"),
+    path("search/stats/", views.OMDbCacheStatsView.as_view(), name="search-stats"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("spotify/token/", spotify_token_view, name="spotify-token"),
+    path("spotify/search/", spotify_search_view, name="spotify-search"),
     path("watchlist/", views.WatchlistView.as_view(), name="watchlist"),
+    path("watchlist/import/", views.WatchlistImportView.as_view(), name="watchlist-import"),
+    path("watchlist/export/", views.WatchlistExportView.as_view(), name="watchlist-export"),
     path("watchlist/<int:pk>/", views.WatchlistItemDetailView.as_view(), name="watchlist-detail"),
 ]
\ No newline at end of file
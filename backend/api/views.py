@@ -1,35 +1,273 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status
-from .serializers import UserSerializer, NoteSerializer, UserProfileSerializer, WatchlistItemSerializer
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .cache import TieredCache
+from .conditional import conditional_get
+from .pagination import (ActivityCursorPagination, NoteCursorPagination, ReplyCursorPagination,
+                         WatchlistCursorPagination)
+from .parsers import CSVParser
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .rows import NoteReplyRows, NoteRows, WatchlistItemRows
+from .serializers import (UserSerializer, NoteSerializer, NoteReplySerializer,
+                          MovieDiscussionStatsSerializer, NoteSearchResultSerializer, UserProfileSerializer,
+                          WatchlistImportSerializer, request_now,
+                          WatchlistItemSerializer)
+from .streaming import (csv_lines, json_array, serialized_rows, stream_list, stream_requested,
+                        stream_rows, streaming_response)
 from rest_framework.views import APIView
 from rest_framework.response import Response
+import functools
+import hashlib
+import httpx
 import requests
-from .models import Note, UserProfile, WatchlistItem
+from .models import FeedVersion, Movie, MovieDiscussionStats, Note, UserProfile, WatchlistItem
+from . import authors, fragments, http_client, metrics, omdb, search, spotify, tree
+import hmac
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+def feed_validators(request):
+    # Counters bumped by every write the feed shows (see FeedVersion); a
+    # movie's feed only moves with its own threads, titles and any avatar
+    movie_imdb_id = request.query_params.get('movie_imdb_id')
+    scope = FeedVersion.movie_scope(movie_imdb_id) if movie_imdb_id else FeedVersion.FEED
+    versions = dict(FeedVersion.objects.filter(scope__in=[scope, FeedVersion.AUTHORS])
+                    .values_list('scope', 'version'))
+    version = f'{scope}:{versions.get(scope, 0)}:{versions.get(FeedVersion.AUTHORS, 0)}'
+    if settings.SERVER_TIME_AGO:
+        # time_ago moves on at most once a minute, so a 304 never keeps a
+        # client's "just now" for longer than that
+        version += f':{int(request_now(request).timestamp()) // 60}'
+    return version, None
+
+
+def watchlist_version(request):
+    """
+    Changes with every add, edit or delete in the user's watchlist, since
+    each one moves the item count or the latest updated_at, and when the
+    catalog refreshes one of its movies.
+
+    Computed once per request; the ETag and the response cache share it.
+    """
+    if not hasattr(request, '_watchlist_version'):
+        items = WatchlistItem.objects.filter(user=request.user).aggregate(
+            count=Count('id'), latest=Max('updated_at'), movies=Max('movie__updated_at')
+        )
+        latest = items['latest'].timestamp() if items['latest'] else 0
+        movies = items['movies'].timestamp() if items['movies'] else 0
+        request._watchlist_version = f"{request.user.pk}:{items['count']}:{latest}:{movies}"
+    return request._watchlist_version
+
+
+def watchlist_validators(request):
+    return watchlist_version(request), None
+
+
+def profile_validators(request):
+    user = request.user
+    updated_at = UserProfile.objects.filter(user=user).values_list('updated_at', flat=True).first()
+    return f'{user.pk}:{user.username}:{user.email}:{updated_at}', updated_at
+
+
+# The list endpoints carry no floats, which FastJSONRenderer can't match
+# JSONRenderer on
+LIST_RENDERERS = [FastJSONRenderer if renderer is JSONRenderer else renderer
+                  for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+# ?stream=true or Accept: application/x-ndjson streams the unpaginated list
+STREAMING_RENDERERS = LIST_RENDERERS + [NDJSONRenderer]
+
+
 class NoteListCreate(generics.ListCreateAPIView):
     serializer_class = NoteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = STREAMING_RENDERERS
+
+    @conditional_get(feed_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def sort_by_activity(self):
+        return self.request.query_params.get('sort') == 'activity'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = ActivityCursorPagination if self.sort_by_activity() else NoteCursorPagination
+            self._paginator = pagination_class()
+        return self._paginator
+
+    def get_replies_limit(self):
+        # ?replies=N embeds at most N replies per thread; the rest are
+        # fetched from NoteReplyList with the thread's replies_next_cursor
+        replies = self.request.query_params.get('replies')
+        if replies is None or self.request.method != 'GET':
+            return None
+        try:
+            return max(int(replies), 0)
+        except ValueError:
+            raise ValidationError({'replies': 'A valid integer is required.'})
 
-    def get_queryset(self):
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['replies_limit'] = self.get_replies_limit()
+        return context
+
+    def get_threads(self):
+        queryset = Note.objects.filter(parent=None)
         movie_imdb_id = self.request.query_params.get('movie_imdb_id', None)
         if movie_imdb_id:
-            return Note.objects.filter(
-                parent=None,
-                movie_imdb_id=movie_imdb_id
-            ).order_by('-created_at')
-        return Note.objects.filter(parent=None).order_by('-created_at')
+            queryset = queryset.filter(movie_id=movie_imdb_id)
+        if self.sort_by_activity():
+            return queryset.order_by('-last_activity_at', '-id')
+        return queryset.order_by('-created_at')
+
+    def get_replies_prefetch(self):
+        replies = Note.objects.select_related('author').order_by('-created_at', '-id')
+        replies_limit = self.get_replies_limit()
+        if replies_limit is None:
+            return Prefetch('replies', queryset=replies)
+        # One extra row tells the serializer whether more replies exist
+        return Prefetch('replies', queryset=replies[:replies_limit + 1], to_attr='capped_replies')
 
-    def perform_create(self, serializer):
-        movie_imdb_id = self.request.data.get('movie_imdb_id')
-        movie_title = self.request.data.get('movie_title')
-        serializer.save(
-            author=self.request.user,
-            movie_imdb_id=movie_imdb_id,
-            movie_title=movie_title
+    def get_queryset(self):
+        # Authors and replies are loaded up front so NoteSerializer doesn't
+        # query per thread; avatars come from api/authors.py
+        return self.get_threads().select_related('author', 'movie').prefetch_related(
+            self.get_replies_prefetch()
         )
 
+    def render_threads(self, threads, render_misses):
+        """Threads from the fragment cache, rendering only the ones that changed."""
+        return fragments.render_threads(threads, render_misses, self.get_replies_limit(),
+                                        request_now(self.request))
+
+    def list(self, request, *args, **kwargs):
+        if settings.FAST_LIST_SERIALIZERS:
+            return self.list_rows(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if not self.paginator.is_requested(request) and stream_requested(request):
+            return stream_list(request, queryset, self.get_serializer_class(),
+                               self.get_serializer_context())
+
+        # Replies are only loaded for the threads the cache doesn't have
+        threads = self.get_threads().select_related('author', 'movie')
+        page = self.paginate_queryset(threads)
+
+        def render_misses(misses):
+            prefetch_related_objects(misses, self.get_replies_prefetch())
+            return self.get_serializer(misses, many=True).data
+
+        if page is None:
+            return Response(self.render_threads(list(threads), render_misses))
+        return self.get_paginated_response(self.render_threads(page, render_misses))
+
+    def list_rows(self, request):
+        """list(), rendered from values_list() rows by NoteRows."""
+        serializer = NoteRows(replies_limit=self.get_replies_limit(), request=request)
+        rows = serializer.rows(self.get_threads())
+        now = request_now(request)
+        page = self.paginate_queryset(rows)
+        if page is None and stream_requested(request):
+            return stream_rows(request, serializer.iterate(rows, now))
+        render_misses = functools.partial(serializer.serialize, now=now)
+        if page is None:
+            return Response(self.render_threads(list(rows), render_misses))
+        return self.get_paginated_response(self.render_threads(page, render_misses))
+
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user)
+
+class TrendingMoviesView(generics.ListAPIView):
+    """
+    Most discussed movies from MovieDiscussionStats: by latest activity, or
+    by thread count with ?sort=threads. Reads the top `limit` rows off an
+    index instead of grouping notes.
+    """
+    serializer_class = MovieDiscussionStatsSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 50
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = min(max(limit, 1), self.max_limit)
+        if self.request.query_params.get('sort') == 'threads':
+            ordering = ['-thread_count', '-last_activity_at']
+        else:
+            ordering = ['-last_activity_at']
+        return MovieDiscussionStats.objects.select_related('movie').order_by(*ordering)[:limit]
+
+
+class MovieDiscussionView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, imdb_id):
+        stats = MovieDiscussionStats.objects.select_related('movie').filter(pk=imdb_id).first()
+        if stats is None:
+            # Nothing posted yet
+            movie = Movie.objects.filter(pk=imdb_id).first() or Movie(imdb_id=imdb_id)
+            stats = MovieDiscussionStats(movie=movie)
+        return Response(MovieDiscussionStatsSerializer(stats).data)
+
+
+class NoteReplyList(generics.ListAPIView):
+    serializer_class = NoteReplySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReplyCursorPagination
+    renderer_classes = LIST_RENDERERS
+
+    def get_queryset(self):
+        return Note.objects.filter(parent_id=self.kwargs['pk']).select_related('author')
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        serializer = NoteReplyRows(request)
+        page = self.paginate_queryset(serializer.rows(Note.objects.filter(parent_id=self.kwargs['pk'])))
+        return self.get_paginated_response(serializer.serialize(page, request_now(request)))
+
+class NoteTreeView(APIView):
+    """
+    A note with its replies nested to any depth, loaded in one query by
+    api/tree.py. ?depth= (levels below the note) and ?limit= (replies in
+    all) default to and are capped at REPLY_TREE_MAX_DEPTH and
+    REPLY_TREE_MAX_NODES; `truncated` says whether they left replies out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = LIST_RENDERERS
+
+    def get_bound(self, name, maximum):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return maximum
+        try:
+            return min(max(int(value), 0), maximum)
+        except ValueError:
+            raise ValidationError({name: 'A valid integer is required.'})
+
+    def get(self, request, pk):
+        rows = tree.load(pk, self.get_bound('depth', tree.REPLY_TREE_MAX_DEPTH),
+                         self.get_bound('limit', tree.REPLY_TREE_MAX_NODES))
+        note, truncated = tree.render(rows, pk, request)
+        if note is None:
+            raise Http404
+        return Response({'note': note, 'truncated': truncated})
+
 class NoteDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
@@ -54,15 +292,23 @@ class CreateUserView(generics.CreateAPIView):
 class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional_get(profile_validators)
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
     def put(self, request):
         profile = request.user.profile
+        avatar = profile.avatar
         serializer = UserProfileSerializer(profile, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            if profile.avatar != avatar:
+                # Cached threads show the old one. Authors go first, so a
+                # thread rendered for a bumped version finds the new avatar
+                authors.invalidate(request.user.pk)
+                Note.objects.bump_author_threads(request.user.pk)
+                FeedVersion.bump(FeedVersion.AUTHORS)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -77,58 +323,8 @@ class SearchOMDbView(APIView):
                 status=status.HTTP_200_OK
             )
             
-        api_key = '1e75925c'
         try:
-            # First get search results
-            search_response = requests.get(
-                'http://www.omdbapi.com/',
-                params={
-                    's': query,
-                    'apikey': api_key,
-                    'type': 'movie',
-                },
-                timeout=5
-            )
-            search_response.raise_for_status()
-            search_data = search_response.json()
-            
-            if search_data.get('Response') == 'False':
-                return Response(
-                    {'Search': []},
-                    status=status.HTTP_200_OK
-                )
-            
-            # Get detailed info for first 10 movies
-            detailed_results = []
-            if 'Search' in search_data:
-                for movie in search_data['Search'][:10]:  # Limit to first 10 results
-                    # Get additional movie details including rating
-                    detail_response = requests.get(
-                        'http://www.omdbapi.com/',
-                        params={
-                            'i': movie['imdbID'],
-                            'apikey': api_key,
-                        },
-                        timeout=5
-                    )
-                    if detail_response.status_code == 200:
-                        detail_data = detail_response.json()
-                        # Only include movies with posters and required fields
-                        if (detail_data.get('Poster', 'N/A') != 'N/A' and 
-                            detail_data.get('Title') and 
-                            detail_data.get('Year')):
-                            detailed_results.append({
-                                'imdbID': detail_data['imdbID'],
-                                'Title': detail_data['Title'],
-                                'Year': detail_data['Year'],
-                                'Poster': detail_data['Poster'],
-                                'imdbRating': detail_data.get('imdbRating', 'N/A')
-                            })
-                            if len(detailed_results) >= 10:  # Ensure we never exceed 10 results
-                                break
-                
-            return Response({'Search': detailed_results})
-            
+            return Response({'Search': omdb.search_movies(query)})
         except requests.Timeout:
             return Response(
                 {'error': 'Search request timed out. Please try again.'},
@@ -140,52 +336,89 @@ class SearchOMDbView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class SpotifyTokenView(APIView):
+class LocalSearchView(APIView):
+    """
+    As-you-type search over the local catalog and notes, answered from the
+    full-text index without calling OMDb. ?type=movies or ?type=notes
+    limits it to one of them.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    max_limit = search.SEARCH_MAX_RESULTS
 
     def get(self, request):
+        query = request.GET.get('q', '').strip()
+        kind = request.GET.get('type', 'all')
+        if kind not in ('all', 'movies', 'notes'):
+            raise ValidationError({'type': 'Must be one of all, movies, notes.'})
         try:
-            client_id = os.getenv('SPOTIFY_CLIENT_ID')
-            client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+            limit = int(request.GET.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = min(max(limit, 1), self.max_limit)
+
+        data = {}
+        if kind in ('all', 'movies'):
+            data['movies'] = [movie.as_search_result() for movie in search.search_movies(query, limit)]
+        if kind in ('all', 'notes'):
+            notes = search.search_notes(query, limit, queryset=Note.objects.select_related('author', 'movie'))
+            data['notes'] = NoteSearchResultSerializer(notes, many=True).data
+        return Response(data)
+
+class OMDbCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'detail_cache': omdb.detail_cache.stats(),
+            'search_cache': omdb.search_cache.stats(),
+            'playlist_cache': spotify.playlist_cache.stats(),
+        })
 
-            print("Spotify credentials check:", {
-                'client_id_exists': bool(client_id),
-                'client_secret_exists': bool(client_secret)
-            })
+class HasMetricsToken(permissions.BasePermission):
+    def has_permission(self, request, view):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode(), f'Bearer {metrics.METRICS_TOKEN}'.encode())
 
-            if not client_id or not client_secret:
-                return Response(
-                    {'error': 'Spotify credentials not configured'}, 
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE
-                )
 
-            # Get access token from Spotify
-            auth_response = requests.post(
-                'https://accounts.spotify.com/api/token',
-                data={
-                    'grant_type': 'client_credentials'
-                },
-                auth=(client_id, client_secret)
-            )
+class MetricsView(APIView):
+    """
+    Prometheus metrics for this process (see api/metrics.py). Scrapers send
+    METRICS_TOKEN as a bearer token; without one configured, staff only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_authenticators(self):
+        # The scrape token isn't a JWT
+        return [] if metrics.METRICS_TOKEN else super().get_authenticators()
 
-            print("Spotify auth response:", {
-                'status_code': auth_response.status_code,
-                'content': auth_response.text
-            })
+    def get_permissions(self):
+        return [HasMetricsToken()] if metrics.METRICS_TOKEN else super().get_permissions()
 
-            if auth_response.status_code != 200:
-                error_details = auth_response.json() if auth_response.text else 'No error details available'
+    def get(self, request):
+        return HttpResponse(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class SpotifyTokenView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            if not spotify.credentials_configured():
                 return Response(
-                    {
-                        'error': 'Failed to authenticate with Spotify',
-                        'details': error_details
-                    }, 
+                    {'error': 'Spotify credentials not configured'}, 
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
 
-            return Response(auth_response.json())
+            return Response(spotify.token_manager.get_token())
+        except spotify.SpotifyAuthError as e:
+            return Response(
+                {
+                    'error': str(e),
+                    'details': e.details
+                }, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
-            print("Spotify token error:", str(e))
+            logger.exception("Spotify token error")
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -203,81 +436,94 @@ class SpotifySearchView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            client_id = os.getenv('SPOTIFY_CLIENT_ID')
-            client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
-
-            if not client_id or not client_secret:
+            if not spotify.credentials_configured():
                 return Response(
                     {'error': 'Spotify credentials not configured'}, 
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
 
-            auth_response = requests.post(
-                'https://accounts.spotify.com/api/token',
-                data={
-                    'grant_type': 'client_credentials'
-                },
-                auth=(client_id, client_secret)
-            )
-
-            if auth_response.status_code != 200:
+            try:
+                return Response(spotify.cached_search_playlists(query))
+            except spotify.SpotifyAuthError:
                 return Response(
                     {'error': 'Failed to authenticate with Spotify'}, 
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
-
-            access_token = auth_response.json()['access_token']
-
-            search_response = requests.get(
-                'https://api.spotify.com/v1/search',
-                params={
-                    'q': query,
-                    'type': 'playlist',
-                    'limit': 5
-                },
-                headers={
-                    'Authorization': f'Bearer {access_token}'
-                }
-            )
-
-            if search_response.status_code != 200:
+            except spotify.SpotifyRateLimited as e:
+                return Response(
+                    {'error': 'Spotify rate limit reached, try again later'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(e.retry_after)}
+                )
+            except spotify.SpotifySearchError:
                 return Response(
                     {'error': 'Failed to search Spotify'}, 
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
-
-            return Response(search_response.json())
         except Exception as e:
-            print("Spotify search error:", str(e))
+            logger.exception("Spotify search error")
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+# Serialized watchlists and pages, keyed by watchlist_version() so writes
+# never need to find and delete old entries; those just expire
+watchlist_cache = TieredCache(
+    'watchlist',
+    max_entries=int(os.getenv('WATCHLIST_CACHE_SIZE', 500)),
+    ttl=int(os.getenv('WATCHLIST_CACHE_TTL', 60 * 60)),
+)
+
+
 class WatchlistView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = STREAMING_RENDERERS
 
+    @conditional_get(watchlist_validators)
     def get(self, request):
-        watchlist = WatchlistItem.objects.filter(user=request.user)
-        serializer = WatchlistItemSerializer(watchlist, many=True)
-        return Response(serializer.data)
+        fast = settings.FAST_LIST_SERIALIZERS
+        if fast:
+            rows = WatchlistItemRows()
+            watchlist = rows.rows(WatchlistItem.objects.filter(user=request.user))
+        else:
+            watchlist = WatchlistItem.objects.filter(user=request.user).select_related('movie')
+        paginator = WatchlistCursorPagination()
+        if not paginator.is_requested(request) and stream_requested(request):
+            if fast:
+                return stream_rows(request, rows.iterate(watchlist))
+            return stream_list(request, watchlist, WatchlistItemSerializer)
+
+        # The version is read before the list, so a write landing in
+        # between can only put newer data under an already outdated key
+        params = request.query_params
+        key = hashlib.md5(
+            f"{watchlist_version(request)}:{params.get('limit')}:{params.get('cursor')}".encode()
+        ).hexdigest()
+        data = watchlist_cache.get(key)
+        if data is None:
+            page = paginator.paginate_queryset(watchlist, request, view=self)
+            if page is not None:
+                items = rows.serialize(page) if fast else WatchlistItemSerializer(page, many=True).data
+                data = dict(paginator.get_paginated_response(items).data)
+            else:
+                data = rows.serialize(watchlist) if fast else list(WatchlistItemSerializer(watchlist, many=True).data)
+            watchlist_cache.set(key, data)
+        return Response(data)
 
     def post(self, request):
-        # Add imdb_id validation
-        existing = WatchlistItem.objects.filter(
-            user=request.user, 
-            imdb_id=request.data.get('imdb_id')
-        ).first()
-        
-        if existing:
-            return Response(
-                {'error': 'Movie already in watchlist'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         serializer = WatchlistItemSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            # unique_together catches duplicates in the same round trip as
+            # the insert, and without racing a concurrent add
+            try:
+                with transaction.atomic():
+                    serializer.save(user=request.user)
+            except IntegrityError:
+                return Response(
+                    {'error': 'Movie already in watchlist'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -285,7 +531,7 @@ class WatchlistItemDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self, pk, user):
-        return get_object_or_404(WatchlistItem, pk=pk, user=user)
+        return get_object_or_404(WatchlistItem.objects.select_related('movie'), pk=pk, user=user)
 
     def put(self, request, pk):
         watchlist_item = self.get_object(pk, request.user)
@@ -298,4 +544,274 @@ class WatchlistItemDetailView(APIView):
     def delete(self, request, pk):
         watchlist_item = self.get_object(pk, request.user)
         watchlist_item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# Largest batch /api/watchlist/import/ accepts in one request
+WATCHLIST_IMPORT_MAX = int(os.getenv('WATCHLIST_IMPORT_MAX', 1000))
+# Column names used by IMDb's list and ratings CSV exports
+IMPORT_COLUMN_ALIASES = {
+    'const': 'imdb_id',
+    'imdbid': 'imdb_id',
+    'imdb id': 'imdb_id',
+    'your rating': 'rating',
+    'imdb rating': 'imdb_rating',
+}
+# Fields an upsert import is allowed to overwrite on existing items; movie
+# details belong to the catalog and are never overwritten by an import
+IMPORT_UPDATE_FIELDS = ['watched', 'rating', 'notes']
+
+
+def fill_from_omdb(rows):
+    """
+    Fill in title, year and poster from OMDb for rows that only have an
+    IMDb id. The lookups also add those movies to the catalog; they run on
+    omdb.import_pool, and rows not looked up by the deadline keep just their id.
+    """
+    wanted = [row['imdb_id'] for row in rows
+              if isinstance(row.get('imdb_id'), str)
+              and not all(row.get(field) for field in ('title', 'year', 'poster'))]
+    if not wanted:
+        return
+    details, _ = omdb.fetch_details(list(dict.fromkeys(wanted)), omdb.OMDB_SEARCH_DEADLINE, omdb.import_pool)
+    details = {detail['imdbID']: detail for detail in details}
+    for row in rows:
+        detail = details.get(row.get('imdb_id'))
+        if not detail:
+            continue
+        for field, value in (('title', detail['Title']), ('year', detail['Year'][:4]),
+                             ('poster', detail['Poster']), ('imdb_rating', detail['imdbRating'])):
+            if not row.get(field) and value != 'N/A':
+                row[field] = value
+
+
+class WatchlistImportView(APIView):
+    """
+    Add many movies to the watchlist at once.
+
+    Takes a JSON array of watchlist items or a CSV with the same columns;
+    IMDb list exports work as-is, with posters looked up on OMDb. Every item
+    is validated in one pass and the valid ones inserted with a single
+    bulk query. `?on_conflict=update` overwrites movies already on the
+    list instead of skipping them. Returns an outcome per input item.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser, CSVParser]
+
+    def post(self, request):
+        on_conflict = request.query_params.get('on_conflict', 'skip')
+        if on_conflict not in ('skip', 'update'):
+            raise ValidationError({'on_conflict': 'Must be "skip" or "update".'})
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError('Expected a list of watchlist items.')
+        if len(rows) > WATCHLIST_IMPORT_MAX:
+            raise ValidationError(f'At most {WATCHLIST_IMPORT_MAX} items can be imported at once.')
+
+        rows = [
+            {IMPORT_COLUMN_ALIASES.get(key, key): value for key, value in row.items()}
+            if isinstance(row, dict) else row
+            for row in rows
+        ]
+        fill_from_omdb([row for row in rows if isinstance(row, dict)])
+
+        serializer = WatchlistImportSerializer(data=rows)
+        serializer.is_valid(raise_exception=True)
+
+        results, items = [], {}
+        for index, (data, errors) in enumerate(zip(serializer.validated_data, serializer.item_errors)):
+            result = {'index': index, 'imdb_id': data['movie_id'] if data else None}
+            if data is None:
+                result.update(status='invalid', errors=errors)
+            elif data['movie_id'] in items:
+                result['status'] = 'duplicate'
+            else:
+                items[data['movie_id']] = (result, data)
+            results.append(result)
+
+        with transaction.atomic():
+            # Movies the catalog doesn't have yet are seeded from the import
+            Movie.objects.bulk_create([
+                Movie(imdb_id=imdb_id, **{field: value for field, value in data['movie'].items() if value})
+                for imdb_id, (_, data) in items.items()
+            ], ignore_conflicts=True)
+            existing = set(WatchlistItem.objects.filter(
+                user=request.user, movie__in=list(items)
+            ).values_list('movie', flat=True))
+            objs = [
+                WatchlistItem(user=request.user, **{field: value for field, value in data.items() if field != 'movie'})
+                for _, data in items.values()
+            ]
+            # Only overwrite fields every item actually supplied, so a bare
+            # imdb_id row can't reset someone's rating or watched flag
+            update_fields = [
+                field for field in IMPORT_UPDATE_FIELDS
+                if objs and all(field in data for _, data in items.values())
+            ]
+            if on_conflict == 'update' and update_fields:
+                WatchlistItem.objects.bulk_create(
+                    objs, update_conflicts=True, unique_fields=['user', 'movie'],
+                    update_fields=update_fields + ['updated_at'],
+                )
+            else:
+                # A movie added concurrently since the lookup above is
+                # skipped here but still reported as created
+                WatchlistItem.objects.bulk_create(objs, ignore_conflicts=True)
+
+        for imdb_id, (result, _) in items.items():
+            if imdb_id not in existing:
+                result['status'] = 'created'
+            else:
+                result['status'] = 'updated' if on_conflict == 'update' and update_fields else 'exists'
+
+        counts = {name: 0 for name in ('created', 'updated', 'exists', 'duplicate', 'invalid')}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({'counts': counts, 'results': results})
+
+
+class WatchlistExportView(APIView):
+    """The whole watchlist as a JSON array, or CSV with ?format=csv, streamed."""
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, CSVRenderer]
+
+    def get(self, request):
+        items = WatchlistItem.objects.filter(user=request.user).select_related('movie').order_by('-added_at', '-id')
+        rows = serialized_rows(items, WatchlistItemSerializer)
+        if request.accepted_renderer.format == 'csv':
+            fields = WatchlistItemSerializer.Meta.fields
+            return streaming_response(request, csv_lines(fields, rows), 'text/csv; charset=utf-8',
+                                      filename='watchlist.csv')
+        return streaming_response(request, json_array(rows), 'application/json',
+                                  filename='watchlist.json')
+
+
+# Async versions of the upstream-bound views, used when running under ASGI
+# (see ASYNC_UPSTREAM_VIEWS in settings). DRF views are sync only, so these
+# are plain Django views that keep the same JWT auth and JSON responses.
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # Rendered by DRF so the bytes match the sync views
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        content_type='application/json', headers=headers)
+
+
+async def authenticate_async(request):
+    """Return (user, None) or (None, 401 response), like IsAuthenticated."""
+    # Honour APIClient.force_authenticate() the way DRF's Request does
+    user = getattr(request, '_force_auth_user', None)
+    if user is not None:
+        return user, None
+
+    authenticator = JWTAuthentication()
+    headers = {'WWW-Authenticate': authenticator.authenticate_header(request)}
+    try:
+        result = await sync_to_async(authenticator.authenticate)(request)
+    except AuthenticationFailed as e:
+        detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+        return None, json_response(detail, status.HTTP_401_UNAUTHORIZED, headers)
+    if result is None:
+        return None, json_response(
+            {'detail': 'Authentication credentials were not provided.'},
+            status.HTTP_401_UNAUTHORIZED, headers
+        )
+    return result[0], None
+
+
+def async_api_view(view):
+    """GET-only, authenticated async view."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response(
+                {'detail': f'Method "{request.method}" not allowed.'},
+                status.HTTP_405_METHOD_NOT_ALLOWED, {'Allow': 'GET'}
+            )
+        user, error = await authenticate_async(request)
+        if error is not None:
+            return error
+        request.user = user
+        if isinstance(request, ASGIRequest):
+            return await view(request, *args, **kwargs)
+        # Under WSGI this loop ends with the request, and its client with it
+        async with http_client.request_client():
+            return await view(request, *args, **kwargs)
+    return wrapper
+
+@async_api_view
+async def search_omdb_async(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return json_response({'Search': []})
+
+    try:
+        return json_response({'Search': await omdb.asearch_movies(query)})
+    except httpx.TimeoutException:
+        return json_response(
+            {'error': 'Search request timed out. Please try again.'},
+            status.HTTP_504_GATEWAY_TIMEOUT
+        )
+    except httpx.HTTPError as e:
+        return json_response(
+            {'error': f'Failed to fetch movies: {str(e)}'},
+            status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@async_api_view
+async def spotify_token_async(request):
+    try:
+        if not spotify.credentials_configured():
+            return json_response(
+                {'error': 'Spotify credentials not configured'},
+                status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        return json_response(await spotify.token_manager.aget_token())
+    except spotify.SpotifyAuthError as e:
+        return json_response(
+            {
+                'error': str(e),
+                'details': e.details
+            },
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        logger.exception("Spotify token error")
+        return json_response({'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@async_api_view
+async def spotify_search_async(request):
+    try:
+        query = request.GET.get('q', '')
+        if not query:
+            return json_response(
+                {'error': 'Search query is required'},
+                status.HTTP_400_BAD_REQUEST
+            )
+
+        if not spotify.credentials_configured():
+            return json_response(
+                {'error': 'Spotify credentials not configured'},
+                status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        try:
+            return json_response(await spotify.acached_search_playlists(query))
+        except spotify.SpotifyAuthError:
+            return json_response(
+                {'error': 'Failed to authenticate with Spotify'},
+                status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except spotify.SpotifyRateLimited as e:
+            return json_response(
+                {'error': 'Spotify rate limit reached, try again later'},
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                {'Retry-After': str(e.retry_after)}
+            )
+        except spotify.SpotifySearchError:
+            return json_response(
+                {'error': 'Failed to search Spotify'},
+                status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+    except Exception as e:
+        logger.exception("Spotify search error")
+        return json_response({'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
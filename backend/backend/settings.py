@@ -63,6 +63,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below (see api/metrics.py)
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -71,7 +73,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Async-capable wrapper so async views stay on the event loop under ASGI
+    'api.middleware.AsyncWhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -93,6 +96,23 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Serve /api/search/ and /api/spotify/* from async views so a slow upstream
+# doesn't pin a worker thread. Only worth it under an ASGI server
+# (render.yaml runs gunicorn with uvicorn workers).
+ASYNC_UPSTREAM_VIEWS = os.getenv("ASYNC_UPSTREAM_VIEWS", "true").lower() == "true"
+
+# Render the note, reply and watchlist lists from values_list() rows
+# (api/rows.py) instead of through the DRF serializers. Same output.
+FAST_LIST_SERIALIZERS = os.getenv("FAST_LIST_SERIALIZERS", "true").lower() == "true"
+
+# Notes carry a formatted time_ago ("3h ago"). Off, it is null and clients
+# format created_at, which keeps rendered threads the same from one request
+# to the next.
+SERVER_TIME_AGO = os.getenv("SERVER_TIME_AGO", "true").lower() == "true"
+
+# Cache each rendered feed thread until it changes (api/fragments.py)
+THREAD_CACHE = os.getenv("THREAD_CACHE", "true").lower() == "true"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -114,6 +134,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Shared across workers when REDIS_URL is set, otherwise per-process memory
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,176 @@
+"""
+Load test for the upstream-bound views against a local fake OMDb.
+
+Runs the project under uvicorn twice, once with the sync DRF views and once
+with the async ones (ASYNC_UPSTREAM_VIEWS), fires concurrent /api/search/
+requests with unique queries so every one goes upstream, and reports
+throughput and latency for each:
+
+    python benchmarks/async_load.py --requests 400 --concurrency 200 --latency 0.2
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def start_fake_omdb(latency):
+    """Threaded stand-in for omdbapi.com that answers after `latency` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            time.sleep(latency)
+            if 's' in params:
+                # Ids unique to the query so the detail cache never helps
+                seed = hashlib.md5(params['s'].encode()).hexdigest()[:6]
+                data = {'Search': [{'imdbID': f'tt{seed}{i:02d}'} for i in range(10)]}
+            else:
+                imdb_id = params['i']
+                data = {'imdbID': imdb_id, 'Title': f'Movie {imdb_id}', 'Year': '2000',
+                        'Poster': f'https://example.com/{imdb_id}.jpg', 'imdbRating': '7.0'}
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def prepare_database(db_url):
+    """Migrate a scratch database and return a JWT for a load-test user."""
+    os.environ['DB_URL'] = db_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    call_command('migrate', verbosity=0)
+    user, _ = User.objects.get_or_create(username='loadtest')
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def start_server(port, env):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+         '--port', str(port), '--log-level', 'warning', '--backlog', '2048'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/api/search/', timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+async def fire(base_url, token, label, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits,
+                                 headers={'Authorization': f'Bearer {token}'}) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get('/api/search/', params={'q': f'{label} movie {i}'})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or len(response.json()['Search']) != 10:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': requests / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake OMDb response time in seconds')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    fake_omdb = start_fake_omdb(args.latency)
+    scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    db_url = f'sqlite:///{scratch.name}'
+    token = prepare_database(db_url)
+
+    results = {}
+    try:
+        for mode in args.modes.split(','):
+            env = dict(
+                os.environ,
+                DB_URL=db_url,
+                OMDB_URL=f'http://127.0.0.1:{fake_omdb.server_port}/',
+                ASYNC_UPSTREAM_VIEWS='true' if mode == 'async' else 'false',
+                OMDB_SEARCH_DEADLINE='60',
+                OMDB_TIMEOUT='60',
+            )
+            server = start_server(args.port, env)
+            try:
+                results[mode] = asyncio.run(fire(
+                    f'http://127.0.0.1:{args.port}', token, mode, args.requests, args.concurrency
+                ))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake_omdb.shutdown()
+        os.unlink(scratch.name)
+
+    print(f'{args.requests} searches, {args.concurrency} concurrent, fake OMDb latency {args.latency}s')
+    for mode, result in results.items():
+        print(f'{mode:>6}: {result["rps"]:8.1f} req/s  p50 {result["p50_ms"]:8.1f} ms  '
+              f'p95 {result["p95_ms"]:8.1f} ms  max {result["max_ms"]:8.1f} ms  errors {result["errors"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Latency, throughput and query counts for the main API endpoints, with
+thresholds that fail the run.
+
+Seeds users, a large note feed with a few very deep reply threads, and big
+watchlists, then replays each scenario through the full middleware and view
+stack in-process (JWT auth included). /api/search/ goes to a local fake
+OMDb. Results are written as JSON so runs can be compared across commits:
+
+    python benchmarks/endpoints.py --output before.json
+    git checkout my-branch
+    python benchmarks/endpoints.py --output after.json --baseline before.json
+
+The run exits non-zero when a scenario errors, exceeds a limit in
+--thresholds (default benchmarks/thresholds.json), or with --baseline, is
+slower at p95 by more than --max-regression (and --min-regression-ms) or
+makes more queries per request than the baseline. Query limits are what catch an N+1 coming back;
+latency limits are deliberately loose since they depend on the machine.
+
+Seeds its own data, so point it at a scratch SQLite file (the default is a
+temporary one) or an empty Postgres database, never at real data.
+Concurrency is covered by benchmarks/async_load.py.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent))
+
+from async_load import start_fake_omdb  # noqa: E402
+from indexes import seed as seed_notes, setup_django  # noqa: E402
+
+DEFAULT_THRESHOLDS = BENCHMARKS_DIR / 'thresholds.json'
+
+
+def seed(args):
+    """Seed the feed and watchlists, then deep threads at the top of the feed."""
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from api.models import Note, UserProfile
+
+    sample = seed_notes(args.notes, args.users, args.movies, args.watchlist_size,
+                        args.reply_ratio, args.batch_size)
+    user_ids = list(User.objects.filter(username__startswith='bench').values_list('id', flat=True))
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in user_ids],
+                                    batch_size=args.batch_size)
+
+    now = timezone.now()
+    deep = []
+    for i in range(args.deep_threads):
+        created = now - timedelta(hours=args.deep_threads - i)
+        thread = Note.objects.create(title=f'Deep thread {i}', content='Benchmark thread',
+                                     author_id=user_ids[i % len(user_ids)], movie_id=sample['movie'],
+                                     created_at=created, updated_at=created)
+        Note.objects.bulk_create([
+            Note(title='Reply', content='Benchmark reply', author_id=user_ids[j % len(user_ids)],
+                 parent=thread, created_at=created + timedelta(seconds=j + 1),
+                 updated_at=created + timedelta(seconds=j + 1))
+            for j in range(args.deep_replies)
+        ], batch_size=args.batch_size)
+        deep.append(thread.id)
+    sample['deep_thread'] = deep[-1] if deep else sample['thread']
+    sample['users'] = user_ids[:args.sample_users]
+    return sample
+
+
+def tokens(user_ids):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return [f'Bearer {RefreshToken.for_user(user).access_token}' for user in User.objects.filter(id__in=user_ids)]
+
+
+def clear_caches():
+    from django.core.cache import cache
+    from api import fragments, omdb, views
+
+    cache.clear()
+    for tiered in (views.watchlist_cache, omdb.detail_cache, omdb.search_cache, fragments.thread_cache):
+        tiered.clear_local()
+
+
+def scenarios(sample):
+    """name -> (path, params for request i, whether caches are cleared first)."""
+    replies_path = f'/api/notes/{sample["deep_thread"]}/replies/'
+    return {
+        'notes_feed': ('/api/notes/', lambda i: {'limit': 20, 'replies': 3}, True),
+        'notes_feed_cached': ('/api/notes/', lambda i: {'limit': 20, 'replies': 3}, False),
+        'notes_activity': ('/api/notes/', lambda i: {'sort': 'activity', 'limit': 20, 'replies': 3}, True),
+        'notes_movie': ('/api/notes/', lambda i: {'movie_imdb_id': sample['movie'], 'limit': 20}, True),
+        'notes_deep_replies': (replies_path, lambda i: {'limit': 100}, True),
+        'notes_tree': (f'/api/notes/{sample["deep_thread"]}/tree/', lambda i: {}, True),
+        'watchlist': ('/api/watchlist/', lambda i: {}, True),
+        'watchlist_cached': ('/api/watchlist/', lambda i: {}, False),
+        'watchlist_page': ('/api/watchlist/', lambda i: {'limit': 50}, True),
+        'profile': ('/api/profile/', lambda i: {}, True),
+        'search': ('/api/search/', lambda i: {'q': f'benchmark query {i}'}, True),
+        'search_cached': ('/api/search/', lambda i: {'q': 'benchmark query'}, False),
+    }
+
+
+def percentile(timings, fraction):
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+def run_scenario(client, auth, path, params, clear, requests, warmup):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    if not clear:
+        # Warm the caches for every user the requests rotate through, so
+        # only hits are measured
+        warmup = max(warmup, len(auth))
+    timings, queries, errors = [], [], 0
+    total = 0.0
+    for i in range(-warmup, requests):
+        if clear:
+            clear_caches()
+        header = auth[i % len(auth)]
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(path, params(i), HTTP_AUTHORIZATION=header)
+            elapsed = time.perf_counter() - started
+        if i < 0:
+            continue
+        total += elapsed
+        timings.append(elapsed * 1000)
+        queries.append(len(captured))
+        if response.status_code != 200:
+            errors += 1
+
+    timings.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': requests / total if total else 0.0,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': timings[-1],
+        'queries': max(queries),
+    }
+
+
+def check(results, thresholds, baseline, max_regression, min_regression_ms):
+    """Messages for every limit a scenario breaks."""
+    failures = []
+    for name, result in results.items():
+        if result['errors']:
+            failures.append(f'{name}: {result["errors"]} of {result["requests"]} requests failed')
+        for metric, limit in thresholds.get(name, {}).items():
+            if result[metric] > limit:
+                failures.append(f'{name}: {metric} {result[metric]:.1f} is over the limit of {limit}')
+        before = (baseline or {}).get(name)
+        if before:
+            # Fast scenarios also have to slow down by a noticeable amount
+            slower = result['p95_ms'] - before['p95_ms']
+            if slower > before['p95_ms'] * max_regression and slower > min_regression_ms:
+                failures.append(f'{name}: p95 {result["p95_ms"]:.1f} ms against {before["p95_ms"]:.1f} ms '
+                                f'in the baseline')
+            if result['queries'] > before['queries']:
+                failures.append(f'{name}: {result["queries"]} queries against {before["queries"]} '
+                                f'in the baseline')
+    return failures
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results):
+    print(f'\n{"scenario":<20} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"errors":>7}')
+    for name, result in results.items():
+        print(f'{name:<20} {result["rps"]:>8.1f} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+              f'{result["p99_ms"]:>9.2f} {result["queries"]:>8} {result["errors"]:>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-url', help='Scratch database URL (default: temporary SQLite file)')
+    parser.add_argument('--notes', type=int, default=50_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--movies', type=int, default=2000)
+    parser.add_argument('--watchlist-size', type=int, default=300)
+    parser.add_argument('--reply-ratio', type=float, default=0.5)
+    parser.add_argument('--deep-threads', type=int, default=20)
+    parser.add_argument('--deep-replies', type=int, default=500)
+    parser.add_argument('--sample-users', type=int, default=20, help='Users the requests rotate through')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--omdb-latency', type=float, default=0.02, help='Fake OMDb response time in seconds')
+    parser.add_argument('--scenarios', help='Comma-separated subset to run')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--thresholds', default=str(DEFAULT_THRESHOLDS))
+    parser.add_argument('--baseline', help='Results JSON from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed p95 slowdown against the baseline (0.25 = 25%%)')
+    parser.add_argument('--min-regression-ms', type=float, default=5.0,
+                        help='p95 slowdowns smaller than this never fail the run')
+    args = parser.parse_args()
+
+    fake_omdb = start_fake_omdb(args.omdb_latency)
+    os.environ['OMDB_URL'] = f'http://127.0.0.1:{fake_omdb.server_port}/'
+    scratch = None
+    if not args.db_url:
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        args.db_url = f'sqlite:///{scratch.name}'
+    setup_django(args.db_url)
+
+    import django
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    try:
+        call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        sample = seed(args)
+        print(f'Seeded {args.notes} notes and {args.deep_threads}x{args.deep_replies} deep replies '
+              f'in {time.perf_counter() - started:.1f}s')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        auth = tokens(sample['users'])
+        selected = scenarios(sample)
+        if args.scenarios:
+            selected = {name: selected[name] for name in args.scenarios.split(',')}
+        client = APIClient()
+        results = {}
+        for name, (path, params, clear) in selected.items():
+            results[name] = run_scenario(client, auth, path, params, clear, args.requests, args.warmup)
+        vendor = connection.vendor
+    finally:
+        connection.close()
+        fake_omdb.shutdown()
+        if scratch:
+            os.unlink(scratch.name)
+
+    report(results)
+    output = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': {'python': platform.python_version(), 'django': django.get_version(),
+                        'database': vendor},
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('db_url', 'output', 'thresholds', 'baseline')},
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(output, indent=2) + '\n')
+
+    thresholds = json.loads(Path(args.thresholds).read_text()) if args.thresholds else {}
+    baseline = json.loads(Path(args.baseline).read_text())['results'] if args.baseline else None
+    failures = check(results, thresholds, baseline, args.max_regression, args.min_regression_ms)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Rendering 10k rows with the DRF serializers against the values_list() ones
+in api/rows.py, split into fetching, serializing and JSON encoding.
+
+    python benchmarks/serializers.py --rows 10000
+
+Exits non-zero if the two ever produce different bytes.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from indexes import setup_django  # noqa: E402
+
+
+def seed(rows, replies_per_thread, batch_size):
+    from django.contrib.auth.models import User
+    from api.models import Movie, Note, UserProfile, WatchlistItem
+
+    User.objects.bulk_create([User(username=f'bench{i}', password='!') for i in range(50)])
+    users = list(User.objects.filter(username__startswith='bench'))
+    UserProfile.objects.bulk_create([UserProfile(user=user, avatar=f'https://example.com/{user.pk}.png')
+                                     for user in users[::2]])
+    Movie.objects.bulk_create([Movie(imdb_id=f'tt{i:07d}', title=f'Movie {i}', year='2000',
+                                     poster='https://example.com/poster.jpg', imdb_rating='7.5')
+                               for i in range(rows)], batch_size=batch_size)
+
+    threads = rows // (replies_per_thread + 1)
+    Note.objects.bulk_create([Note(title=f'Thread {i}', content='Benchmark thread ' * 10,
+                                   author=users[i % len(users)], movie_id=f'tt{i:07d}', reply_count=replies_per_thread)
+                              for i in range(threads)], batch_size=batch_size)
+    thread_ids = list(Note.objects.values_list('id', flat=True))
+    Note.objects.bulk_create([Note(title='Reply', content='Benchmark reply', author=users[i % len(users)],
+                                   parent_id=thread_ids[i % threads])
+                              for i in range(rows - threads)], batch_size=batch_size)
+    WatchlistItem.objects.bulk_create([WatchlistItem(user=users[0], movie_id=f'tt{i:07d}', notes='Benchmark')
+                                       for i in range(rows)], batch_size=batch_size)
+    return users[0]
+
+
+def cases(user):
+    from django.db.models import Prefetch
+    from api.models import Note, WatchlistItem
+    from api.rows import NoteRows, WatchlistItemRows
+    from api.serializers import NoteSerializer, WatchlistItemSerializer
+
+    def drf_notes():
+        replies = Note.objects.select_related('author__profile').order_by('-created_at', '-id')
+        return list(Note.objects.filter(parent=None).select_related('author__profile', 'movie')
+                    .prefetch_related(Prefetch('replies', queryset=replies)).order_by('-created_at'))
+
+    note_rows = NoteRows()
+    watchlist_rows = WatchlistItemRows()
+    return {
+        'notes': (
+            (drf_notes, lambda page: NoteSerializer(page, many=True).data),
+            (lambda: list(note_rows.rows(Note.objects.filter(parent=None).order_by('-created_at'))),
+             note_rows.serialize),
+        ),
+        'watchlist': (
+            (lambda: list(WatchlistItem.objects.filter(user=user).select_related('movie')),
+             lambda page: WatchlistItemSerializer(page, many=True).data),
+            (lambda: list(watchlist_rows.rows(WatchlistItem.objects.filter(user=user))),
+             watchlist_rows.serialize),
+        ),
+    }
+
+
+def measure(fetch, serialize, render, repeat):
+    phases = {'fetch': [], 'serialize': [], 'render': []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = fetch()
+        fetched = time.perf_counter()
+        data = serialize(rows)
+        serialized = time.perf_counter()
+        body = render(data)
+        rendered = time.perf_counter()
+        phases['fetch'].append((fetched - started) * 1000)
+        phases['serialize'].append((serialized - fetched) * 1000)
+        phases['render'].append((rendered - serialized) * 1000)
+    return {phase: statistics.median(timings) for phase, timings in phases.items()}, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--replies-per-thread', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+    setup_django(f'sqlite:///{scratch.name}')
+
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.renderers import JSONRenderer
+    from api.renderers import FastJSONRenderer, orjson
+
+    try:
+        call_command('migrate', verbosity=0)
+        user = seed(args.rows, args.replies_per_thread, args.batch_size)
+        print(f'{args.rows} rows per list, median of {args.repeat}; JSON encoder: '
+              f'{"orjson" if orjson else "json (orjson not installed)"}')
+        for name, (drf, rows) in cases(user).items():
+            before, drf_body = measure(*drf, JSONRenderer().render, args.repeat)
+            after, rows_body = measure(*rows, FastJSONRenderer().render, args.repeat)
+            if drf_body != rows_body:
+                sys.exit(f'{name}: outputs differ')
+            print(f'\n-- {name} ({len(rows_body) / 1e6:.1f} MB)')
+            print(f'   {"":<10} {"fetch":>10} {"serialize":>10} {"render":>10} {"total":>10}')
+            for label, result in (('drf', before), ('rows', after)):
+                print(f'   {label:<10} ' + ' '.join(f'{result[phase]:>10.1f}' for phase in result)
+                      + f' {sum(result.values()):>10.1f}  ms')
+            print(f'   {sum(before.values()) / sum(after.values()):.1f}x faster')
+    finally:
+        connection.close()
+        os.unlink(scratch.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,23 @@
 import React, { useState, useEffect } from "react";
+import api from "../api";
 import "../style/Note.css"
 
+const DAY = 24 * 60 * 60 * 1000;
+
+// Same wording as the server's time_ago, for when it leaves it null
+// (SERVER_TIME_AGO off)
+function timeAgo(createdAt) {
+    const diff = Date.now() - new Date(createdAt).getTime();
+    const days = Math.floor(diff / DAY);
+    const seconds = Math.floor((diff % DAY) / 1000);
+    if (days > 365) return `${Math.floor(days / 365)}y ago`;
+    if (days > 30) return `${Math.floor(days / 30)}mo ago`;
+    if (days > 0) return `${days}d ago`;
+    if (seconds > 3600) return `${Math.floor(seconds / 3600)}h ago`;
+    if (seconds > 60) return `${Math.floor(seconds / 60)}m ago`;
+    return "just now";
+}
+
 function Note({ note, onDelete, onEdit, onReply, currentUser }) {
     const [isEditing, setIsEditing] = useState(false);
     const [editedContent, setEditedContent] = useState(note.content);
@@ -8,12 +25,31 @@ function Note({ note, onDelete, onEdit, onReply, currentUser }) {
     const [replyContent, setReplyContent] = useState("");
     const [showReplies, setShowReplies] = useState(false);
     const [localContent, setLocalContent] = useState(note.content);
+    const [replies, setReplies] = useState(note.replies || []);
+    const [repliesCursor, setRepliesCursor] = useState(note.replies_next_cursor ?? null);
 
     useEffect(() => {
         setLocalContent(note.content);
         setEditedContent(note.content);
     }, [note.content]);
 
+    useEffect(() => {
+        setReplies(note.replies || []);
+        setRepliesCursor(note.replies_next_cursor ?? null);
+    }, [note.replies, note.replies_next_cursor]);
+
+    const loadMoreReplies = async () => {
+        try {
+            const response = await api.get(`/api/notes/${note.id}/replies/`, {
+                params: { cursor: repliesCursor }
+            });
+            setReplies(prevReplies => [...prevReplies, ...response.data.results]);
+            setRepliesCursor(response.data.next_cursor);
+        } catch (error) {
+            console.error("Failed to load replies:", error);
+        }
+    };
+
     const isAuthor = currentUser && currentUser.id === note.author_id;
 
     const handleEdit = async () => {
@@ -43,7 +79,7 @@ function Note({ note, onDelete, onEdit, onReply, currentUser }) {
                         <p className="note-author">Posted by {note.author_username}</p>
                     </div>
                 </div>
-                <span className="note-time">{note.time_ago}</span>
+                <span className="note-time">{note.time_ago ?? timeAgo(note.created_at)}</span>
             </div>
 
             <div className="note-content">
@@ -122,9 +158,9 @@ function Note({ note, onDelete, onEdit, onReply, currentUser }) {
                 </div>
             )}
 
-            {showReplies && note.replies && note.replies.length > 0 && (
+            {showReplies && replies.length > 0 && (
                 <div className="replies-section">
-                    {note.replies.map(reply => (
+                    {replies.map(reply => (
                         <div key={reply.id} className="reply">
                             <div className="reply-header">
                                 <div className="author-info">
@@ -144,13 +180,18 @@ function Note({ note, onDelete, onEdit, onReply, currentUser }) {
                                             Delete
                                         </button>
                                     )}
-                                    <span className="reply-time">{reply.time_ago}</span>
+                                    <span className="reply-time">{reply.time_ago ?? timeAgo(reply.created_at)}</span>
                                 </div>
                             </div>
                             <p className="reply-content">{reply.content}</p>
                             {reply.edited && <span className="edited-tag small">(edited)</span>}
                         </div>
                     ))}
+                    {repliesCursor !== null && (
+                        <button className="show-replies-button" onClick={loadMoreReplies}>
+                            Show more replies
+                        </button>
+                    )}
                 </div>
             )}
         </div>
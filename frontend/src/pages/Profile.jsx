@@ -1,6 +1,8 @@
 import { useState, useEffect } from "react";
 import api from "../api";
 
+const WATCHLIST_PAGE_SIZE = 50;
+
 const Profile = () => {
     const [profile, setProfile] = useState(null);
     const [query, setQuery] = useState("");
@@ -8,6 +10,7 @@ const Profile = () => {
     const [error, setError] = useState("");
     const [results, setResults] = useState([]);
     const [watchlist, setWatchlist] = useState([]);
+    const [watchlistCursor, setWatchlistCursor] = useState(null);
     const [activeTab, setActiveTab] = useState("watchlist");
     const [selectedMovie, setSelectedMovie] = useState(null);
     const [movieDetails, setMovieDetails] = useState(null);
@@ -45,11 +48,15 @@ const Profile = () => {
         }
     };
 
-    const getWatchlist = async () => {
+    const getWatchlist = async (cursor = null) => {
         try {
-            const response = await api.get("/api/watchlist/");
-            setWatchlist(response.data);
-            return response.data;
+            const response = await api.get("/api/watchlist/", {
+                params: { limit: WATCHLIST_PAGE_SIZE, ...(cursor && { cursor }) }
+            });
+            const { results, next_cursor } = response.data;
+            setWatchlist(prevList => cursor ? [...prevList, ...results] : results);
+            setWatchlistCursor(next_cursor);
+            return results;
         } catch (error) {
             console.error("Failed to fetch watchlist:", error);
             throw error;
@@ -101,7 +108,8 @@ const Profile = () => {
     const removeFromWatchlist = async (id) => {
         try {
             await api.delete(`/api/watchlist/${id}/`);
-            getWatchlist();
+            // Drop it locally so pages loaded so far stay in place
+            setWatchlist(prevList => prevList.filter(item => item.id !== id));
         } catch (error) {
             alert("Failed to remove movie from watchlist");
         }
@@ -117,7 +125,7 @@ const Profile = () => {
 
         if (value.trim()) {
             const timeout = setTimeout(() => {
-                handleSearch();
+                handleSearch(value);
             }, 300);
             setTypingTimeout(timeout);
         } else {
@@ -134,8 +142,8 @@ const Profile = () => {
         }
     };
 
-    const handleSearch = async () => {
-        if (!query.trim()) {
+    const handleSearch = async (value = query) => {
+        if (!value.trim()) {
             setResults([]);
             return;
         }
@@ -143,15 +151,31 @@ const Profile = () => {
         setLoading(true);
         setError("");
 
+        // Movies already in the local catalog show up straight away; OMDb's
+        // results are merged in when they arrive
+        let local = [];
+        try {
+            const response = await api.get(`/api/search/local/`, {
+                params: { q: value, type: "movies" }
+            });
+            local = response.data.movies || [];
+            if (local.length) setResults(local);
+        } catch (error) {
+            local = [];
+        }
+
         try {
             const response = await api.get(`/api/search/`, {
-                params: { q: query }
+                params: { q: value }
             });
             const data = response.data;
-            setResults(data.Search || []);
+            const seen = new Set(local.map((movie) => movie.imdbID));
+            setResults([...local, ...(data.Search || []).filter((movie) => !seen.has(movie.imdbID))]);
         } catch (error) {
-            setError("Failed to fetch movies.");
-            setResults([]);
+            if (!local.length) {
+                setError("Failed to fetch movies.");
+                setResults([]);
+            }
         } finally {
             setLoading(false);
         }
@@ -238,7 +262,8 @@ const Profile = () => {
                                 setQuery(e.target.value);
                                 if (typingTimeout) clearTimeout(typingTimeout);
                                 if (e.target.value.trim()) {
-                                    const timeout = setTimeout(() => handleSearch(), 300);
+                                    const value = e.target.value;
+                                    const timeout = setTimeout(() => handleSearch(value), 300);
                                     setTypingTimeout(timeout);
                                 } else {
                                     setResults([]);
@@ -356,6 +381,14 @@ const Profile = () => {
                                 <p>No movies in your {activeTab === "watchlist" ? "watchlist" : "watched list"} yet.</p>
                             </div>
                         )}
+                        {watchlistCursor && (
+                            <button
+                                className="action-button watch-button"
+                                onClick={() => getWatchlist(watchlistCursor)}
+                            >
+                                Load more
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>
@@ -5,8 +5,12 @@ import SoundtrackWidget from "../components/SoundtrackWidget"
 import "../style/Home.css"
 import "../style/MovieReviews.css"
 
+const REVIEWS_PAGE_SIZE = 10;
+const REPLIES_PER_REVIEW = 3;
+
 const Spotlight = () => {
     const [posts, setPosts] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [postContent, setPostContent] = useState("");
     const [postTitle, setPostTitle] = useState("");
     const [dailyMovie, setDailyMovie] = useState(null);
@@ -68,12 +72,19 @@ const Spotlight = () => {
         }
     };
 
-    const getMovieReviews = async (imdbId) => {
+    const getMovieReviews = async (imdbId, cursor = null) => {
         try {
             const response = await api.get("/api/notes/", {
-                params: { movie_imdb_id: imdbId }
+                params: {
+                    movie_imdb_id: imdbId,
+                    limit: REVIEWS_PAGE_SIZE,
+                    replies: REPLIES_PER_REVIEW,
+                    ...(cursor && { cursor })
+                }
             });
-            setPosts(response.data);
+            const { results, next_cursor } = response.data;
+            setPosts(prevPosts => cursor ? [...prevPosts, ...results] : results);
+            setNextCursor(next_cursor);
         } catch (err) {
             console.error("Failed to fetch movie reviews:", err);
         }
@@ -229,6 +240,14 @@ const Spotlight = () => {
                         ) : (
                             <p className="empty-state">No reviews yet. Be the first to share your thoughts!</p>
                         )}
+                        {nextCursor && (
+                            <button
+                                className="show-replies-button"
+                                onClick={() => getMovieReviews(dailyMovie.imdbID, nextCursor)}
+                            >
+                                Load more reviews
+                            </button>
+                        )}
                     </div>
                 </section>
             </div>